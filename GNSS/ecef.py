@@ -0,0 +1,100 @@
+import functools
+import numpy as np
+
+__author__ = 'amuls'
+
+# WGS84 ellipsoid
+WGS84A = 6378137.0  # semi-major axis [m]
+WGS84F = 1 / 298.257223563  # flattening
+WGS84E2 = WGS84F * (2 - WGS84F)  # first eccentricity squared
+
+
+def geodetic2ECEF(lat: np.ndarray, lon: np.ndarray, ellH: np.ndarray) -> np.ndarray:
+    """
+    converts arrays of geodetic latitude, longitude (radians) and ellipsoidal height (m) to ECEF coordinates (n x 3) on WGS84
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    ellH = np.asarray(ellH, dtype=float)
+
+    sinLat = np.sin(lat)
+    cosLat = np.cos(lat)
+    # radius of curvature in the prime vertical
+    N = WGS84A / np.sqrt(1 - WGS84E2 * sinLat ** 2)
+
+    xyz = np.empty(np.broadcast(lat, lon, ellH).shape + (3, ))
+    xyz[..., 0] = (N + ellH) * cosLat * np.cos(lon)
+    xyz[..., 1] = (N + ellH) * cosLat * np.sin(lon)
+    xyz[..., 2] = (N * (1 - WGS84E2) + ellH) * sinLat
+
+    return xyz
+
+
+def ecef2Geodetic(xyz: np.ndarray) -> tuple:
+    """
+    converts ECEF coordinates (n x 3) to geodetic latitude, longitude (radians) and ellipsoidal height (m) on WGS84 using Bowring's formula
+    """
+    xyz = np.asarray(xyz, dtype=float)
+    x, y, z = xyz[..., 0], xyz[..., 1], xyz[..., 2]
+
+    b = WGS84A * (1 - WGS84F)
+    ep2 = WGS84E2 / (1 - WGS84E2)  # second eccentricity squared
+    p = np.hypot(x, y)
+    theta = np.arctan2(z * WGS84A, p * b)
+
+    lat = np.arctan2(z + ep2 * b * np.sin(theta) ** 3, p - WGS84E2 * WGS84A * np.cos(theta) ** 3)
+    lon = np.arctan2(y, x)
+    N = WGS84A / np.sqrt(1 - WGS84E2 * np.sin(lat) ** 2)
+    ellH = p / np.cos(lat) - N
+
+    return lat, lon, ellH
+
+
+@functools.lru_cache(maxsize=32)
+def rotationENU(lat0: float, lon0: float) -> np.ndarray:
+    """
+    returns the (cached, read-only) rotation matrix from ECEF to East/North/Up at the reference point lat0, lon0 (radians)
+    """
+    sinLat, cosLat = np.sin(lat0), np.cos(lat0)
+    sinLon, cosLon = np.sin(lon0), np.cos(lon0)
+
+    R = np.array([[-sinLon, cosLon, 0.],
+                  [-sinLat * cosLon, -sinLat * sinLon, cosLat],
+                  [cosLat * cosLon, cosLat * sinLon, sinLat]])
+    R.flags.writeable = False
+
+    return R
+
+
+@functools.lru_cache(maxsize=32)
+def referenceECEF(lat0: float, lon0: float, ellH0: float) -> np.ndarray:
+    """
+    returns the (cached, read-only) ECEF coordinates of the reference point
+    """
+    xyz0 = geodetic2ECEF(lat0, lon0, ellH0)
+    xyz0.flags.writeable = False
+
+    return xyz0
+
+
+def ecef2ENU(xyz: np.ndarray, lat0: float, lon0: float, ellH0: float) -> np.ndarray:
+    """
+    converts ECEF coordinates (n x 3) to local East/North/Up coordinates (n x 3) relative to the reference point lat0, lon0 (radians), ellH0 (m)
+    """
+    return (np.asarray(xyz) - referenceECEF(float(lat0), float(lon0), float(ellH0))) @ rotationENU(float(lat0), float(lon0)).T
+
+
+def geodetic2ENU(lat: np.ndarray, lon: np.ndarray, ellH: np.ndarray, lat0: float, lon0: float, ellH0: float) -> np.ndarray:
+    """
+    converts arrays of geodetic coordinates (radians, m) to local East/North/Up coordinates (n x 3) relative to the reference point
+    """
+    return ecef2ENU(geodetic2ECEF(lat, lon, ellH), lat0=lat0, lon0=lon0, ellH0=ellH0)
+
+
+def distances(enu: np.ndarray) -> tuple:
+    """
+    returns the horizontal and 3D distances of the East/North/Up coordinates to their reference point
+    """
+    dist2D = np.hypot(enu[..., 0], enu[..., 1])
+
+    return dist2D, np.hypot(dist2D, enu[..., 2])
@@ -0,0 +1,200 @@
+import json
+import numpy as np
+import pandas as pd
+
+from GNSS import ecef
+
+__author__ = 'amuls'
+
+ZONEKINDS = ('allow', 'deny')
+GRIDCELLS = 256  # number of grid cells along the largest side of the area covered by the zones
+ERRSUPPRESSED = 127  # PVT error code of a valid position actively suppressed (e.g. PRS denial)
+
+
+def loadZones(zonesFile: str) -> dict:
+    """
+    reads the zones from the JSON file zonesFile, mapping each zone name to its kind (allow/deny) and either its centre lat/lon (degrees) and radius (m) or its polygon of [lat, lon] vertices (degrees)
+    """
+    with open(zonesFile, 'r') as fd:
+        dZones = json.load(fd)
+
+    for name, dZone in dZones.items():
+        if dZone.get('kind') not in ZONEKINDS:
+            raise ValueError('zone {name:s} has kind {kind!s}, expected one of {kinds!s}'.format(name=name, kind=dZone.get('kind'), kinds=ZONEKINDS))
+        if 'polygon' in dZone:
+            if len(dZone['polygon']) < 3:
+                raise ValueError('zone {name:s} has a polygon with less than 3 vertices'.format(name=name))
+        elif not all(key in dZone for key in ['lat', 'lon', 'radius']):
+            raise ValueError('zone {name:s} needs either a polygon or a lat, lon and radius'.format(name=name))
+
+    return dZones
+
+
+def compileZones(dZones: dict) -> dict:
+    """
+    converts the zones to local East/North coordinates around their mean centre, with their bounding boxes and the grid of cells used to select the epochs near each zone
+    """
+    dGeofence = {}
+    dGeofence['names'] = list(dZones)
+    dGeofence['kinds'] = [dZones[name]['kind'] for name in dGeofence['names']]
+
+    # all geometry is expressed in the local horizontal plane at the mean of the zone vertices and centres
+    lstLatLon = [np.array(dZone['polygon'], dtype=float) if 'polygon' in dZone else np.array([[dZone['lat'], dZone['lon']]]) for dZone in dZones.values()]
+    latLon = np.radians(np.concatenate(lstLatLon))
+    dGeofence['lat0'], dGeofence['lon0'] = float(latLon[:, 0].mean()), float(latLon[:, 1].mean())
+
+    dGeofence['shapes'] = []
+    bboxes = np.empty((len(dZones), 4))  # minE, minN, maxE, maxN
+    for i, (dZone, zoneLatLon) in enumerate(zip(dZones.values(), lstLatLon)):
+        en = localEN(dGeofence, np.radians(zoneLatLon[:, 0]), np.radians(zoneLatLon[:, 1]))
+        if 'polygon' in dZone:
+            dGeofence['shapes'].append({'polygon': en})
+            bboxes[i] = np.concatenate([en.min(axis=0), en.max(axis=0)])
+        else:
+            dGeofence['shapes'].append({'centre': en[0], 'radius': float(dZone['radius'])})
+            bboxes[i] = np.concatenate([en[0] - dZone['radius'], en[0] + dZone['radius']])
+    dGeofence['bboxes'] = bboxes
+
+    # square grid over the area covered by the zones
+    dGeofence['gridOrigin'] = bboxes[:, :2].min(axis=0)
+    extent = bboxes[:, 2:].max(axis=0) - dGeofence['gridOrigin']
+    dGeofence['cellSize'] = max(extent.max() / GRIDCELLS, 1e-3)
+    dGeofence['gridShape'] = (np.floor(extent / dGeofence['cellSize']).astype(np.int64) + 1).tolist()
+
+    return dGeofence
+
+
+def localEN(dGeofence: dict, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """
+    returns the East/North coordinates (n x 2) of lat/lon (radians) in the local horizontal plane of the geofence
+    """
+    return ecef.geodetic2ENU(lat, lon, np.zeros(np.shape(lat)), lat0=dGeofence['lat0'], lon0=dGeofence['lon0'], ellH0=0.)[..., :2]
+
+
+def insidePolygon(en: np.ndarray, vertices: np.ndarray) -> np.ndarray:
+    """
+    returns for each point en (n x 2) whether it lies inside the polygon vertices (k x 2), using the crossing number of a ray towards East
+    """
+    inside = np.zeros(en.shape[0], dtype=bool)
+    x, y = en[:, 0], en[:, 1]
+    for (x1, y1), (x2, y2) in zip(vertices, np.roll(vertices, -1, axis=0)):
+        crosses = (y1 > y) != (y2 > y)
+        # East coordinate of the edge at the height of the points that it crosses
+        xEdge = x1 + (y[crosses] - y1) * (x2 - x1) / (y2 - y1)
+        inside[crosses] ^= x[crosses] < xEdge
+
+    return inside
+
+
+def zoneMembership(dGeofence: dict, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """
+    returns for each epoch (lat/lon in radians) whether it lies inside each zone (n x #zones)
+
+    The epochs are sorted by grid cell once, so that only the epochs in the cells overlapping the bounding box of a zone are tested against it.
+    """
+    en = localEN(dGeofence, np.asarray(lat, dtype=float), np.asarray(lon, dtype=float))
+    inside = np.zeros((en.shape[0], len(dGeofence['names'])), dtype=bool)
+
+    # grid cell of each epoch, the epochs outside the grid are in the extra last cell
+    nrE, nrN = dGeofence['gridShape']
+    cells = np.floor((en - dGeofence['gridOrigin']) / dGeofence['cellSize'])
+    inGrid = (cells[:, 0] >= 0) & (cells[:, 0] < nrE) & (cells[:, 1] >= 0) & (cells[:, 1] < nrN)
+    cellIds = np.where(inGrid, cells[:, 1] * nrE + cells[:, 0], nrE * nrN).astype(np.int64)
+    order = np.argsort(cellIds, kind='stable')
+    bounds = np.searchsorted(cellIds[order], np.arange(nrE * nrN + 1))
+
+    for i, (dShape, bbox) in enumerate(zip(dGeofence['shapes'], dGeofence['bboxes'])):
+        # the cells of a row of the bounding box are contiguous in the sort order
+        cellMin = np.clip(np.floor((bbox[:2] - dGeofence['gridOrigin']) / dGeofence['cellSize']).astype(np.int64), 0, [nrE - 1, nrN - 1])
+        cellMax = np.clip(np.floor((bbox[2:] - dGeofence['gridOrigin']) / dGeofence['cellSize']).astype(np.int64), 0, [nrE - 1, nrN - 1])
+        rows = np.arange(cellMin[1], cellMax[1] + 1) * nrE
+        candidates = np.concatenate([order[bounds[row + cellMin[0]]:bounds[row + cellMax[0] + 1]] for row in rows])
+        if candidates.size == 0:
+            continue
+
+        if 'polygon' in dShape:
+            inside[candidates, i] = insidePolygon(en[candidates], dShape['polygon'])
+        else:
+            inside[candidates, i] = np.hypot(*(en[candidates] - dShape['centre']).T) <= dShape['radius']
+
+    return inside
+
+
+def initEvents(dGeofence: dict) -> dict:
+    """
+    creates the accumulator of the zone membership counts and the enter/exit events over (chunks of) the epochs
+    """
+    nrZones = len(dGeofence['names'])
+
+    dEvents = {}
+    dEvents['last'] = np.zeros(nrZones, dtype=bool)  # membership of the last epoch seen, outside all zones at the start
+    dEvents['epochs'] = np.zeros(nrZones, dtype=np.int64)
+    dEvents['suppressed'] = np.zeros(nrZones, dtype=np.int64)
+    dEvents['outside'] = {'epochs': 0, 'suppressed': 0}
+    dEvents['enter'] = np.zeros(nrZones, dtype=np.int64)
+    dEvents['exit'] = np.zeros(nrZones, dtype=np.int64)
+    dEvents['events'] = []  # enter/exit events not yet taken by popEvents
+
+    return dEvents
+
+
+def updateEvents(dEvents: dict, dGeofence: dict, inside: np.ndarray, dfSTF: pd.DataFrame):
+    """
+    accumulates the zone membership inside of (a chunk of) the epochs of dfSTF and adds their enter/exit events
+    """
+    if inside.shape[0] == 0:
+        return
+
+    suppressed = dfSTF['Error'].to_numpy() == ERRSUPPRESSED
+    dEvents['epochs'] += inside.sum(axis=0)
+    dEvents['suppressed'] += (inside & suppressed[:, np.newaxis]).sum(axis=0)
+    outside = ~inside.any(axis=1)
+    dEvents['outside']['epochs'] += int(outside.sum())
+    dEvents['outside']['suppressed'] += int((outside & suppressed).sum())
+
+    # a transition is a change of membership with respect to the previous epoch
+    changes = np.diff(np.vstack([dEvents['last'], inside]).astype(np.int8), axis=0)
+    rows, zones = np.nonzero(changes)
+    dEvents['last'] = inside[-1].copy()
+    dEvents['enter'] += np.bincount(zones[changes[rows, zones] > 0], minlength=inside.shape[1])
+    dEvents['exit'] += np.bincount(zones[changes[rows, zones] < 0], minlength=inside.shape[1])
+    if rows.size > 0:
+        dfEvents = dfSTF[['time', 'WNc[week]', 'TOW[s]', 'Error']].iloc[rows].reset_index(drop=True)
+        dfEvents.insert(1, 'zone', np.array(dGeofence['names'], dtype=object)[zones])
+        dfEvents.insert(2, 'kind', np.array(dGeofence['kinds'], dtype=object)[zones])
+        dfEvents.insert(3, 'event', np.where(changes[rows, zones] > 0, 'enter', 'exit'))
+        dEvents['events'].append(dfEvents)
+
+
+def eventsSummary(dEvents: dict, dGeofence: dict) -> dict:
+    """
+    returns per zone the number of epochs inside it, how many of these are suppressed and the number of enter/exit events
+    """
+    dSummary = {}
+    for i, (name, kind) in enumerate(zip(dGeofence['names'], dGeofence['kinds'])):
+        dSummary[name] = {'kind': kind, 'epochs': int(dEvents['epochs'][i]), 'suppressed': int(dEvents['suppressed'][i])}
+        for event in ['enter', 'exit']:
+            dSummary[name][event] = int(dEvents[event][i])
+    dSummary['outside'] = dict(dEvents['outside'])
+
+    return dSummary
+
+
+def eventsFrame(dEvents: dict) -> pd.DataFrame:
+    """
+    returns the enter/exit events in time order
+    """
+    if not dEvents['events']:
+        return pd.DataFrame(columns=['time', 'zone', 'kind', 'event', 'WNc[week]', 'TOW[s]', 'Error'])
+
+    return pd.concat(dEvents['events'], ignore_index=True)
+
+
+def popEvents(dEvents: dict) -> pd.DataFrame:
+    """
+    returns the enter/exit events added since the previous call and forgets them, so that the events of a growing file are kept in bounded memory
+    """
+    dfEvents = eventsFrame(dEvents)
+    dEvents['events'] = []
+
+    return dfEvents
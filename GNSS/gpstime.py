@@ -47,6 +47,7 @@ as compared to some algorigthms found in the literature and on the web.
 # __version__ = git_version.id
 
 import time
+import calendar
 import datetime
 import math
 import numpy as np
@@ -59,6 +60,36 @@ SECSINQUARTER = 900
 SECSINTWOHOUR = 7200
 SECSINTHREEHOUR = 10800
 DT06JAN80 = (1980, 1, 6, 0, 0, 0)  # (year, month, day, hh, mm, ss)
+GPSEPOCH64 = np.datetime64('1980-01-06T00:00:00', 'ns')  # GPS epoch as numpy datetime
+NSECSINSEC = 1000000000
+
+# leap seconds: (year, month, day) from which on (00:00:00 UTC) GPS time is ahead of UTC by the given number of seconds
+# has to be extended when the IERS announces a new leap second (Bulletin C)
+LEAPSECONDS = [
+    ((1981, 7, 1), 1),
+    ((1982, 7, 1), 2),
+    ((1983, 7, 1), 3),
+    ((1985, 7, 1), 4),
+    ((1988, 1, 1), 5),
+    ((1990, 1, 1), 6),
+    ((1991, 1, 1), 7),
+    ((1992, 7, 1), 8),
+    ((1993, 7, 1), 9),
+    ((1994, 7, 1), 10),
+    ((1996, 1, 1), 11),
+    ((1997, 7, 1), 12),
+    ((1999, 1, 1), 13),
+    ((2006, 1, 1), 14),
+    ((2009, 1, 1), 15),
+    ((2012, 7, 1), 16),
+    ((2015, 7, 1), 17),
+    ((2017, 1, 1), 18),
+]
+
+# lookup tables: UTC resp. GPS seconds since the GPS epoch at which each leap second takes effect
+_LEAPOFFSET = np.array([0] + [leap for _, leap in LEAPSECONDS], dtype=np.int64)
+_LEAPUTC = np.array([(datetime.datetime(*ymd) - datetime.datetime(*DT06JAN80)).days * SECSINDAY for ymd, _ in LEAPSECONDS], dtype=np.int64)
+_LEAPGPS = _LEAPUTC + _LEAPOFFSET[1:]
 
 
 def dayOfWeek(year, month, day):
@@ -74,9 +105,7 @@ def dayOfWeek(year, month, day):
     :returns: day of week: 0=Sun, 1=Mon, .., 6=Sat
     :rtype: int
     """
-    hr = 12  # make sure you fall into right day, middle is save
-    t = time.mktime((year, month, day, hr, 0, 0, 0, 0, -1))
-    pyDow = time.localtime(t)[6]
+    pyDow = datetime.date(year, month, day).weekday()
     gpsDow = (pyDow + 1) % 7
 
     return gpsDow
@@ -112,13 +141,7 @@ def julianDay(year, month, day):
     :returns: julian day
     :rtype: float
     """
-    hr = 12  # make sure you fall into right day, middle is save
-    # print('\n\nyear %s = %s' % (type(year), year))
-    # print('month %s = %s' % (type(month), month))
-    # print('day %s = %s' % (type(day), day))
-
-    t = time.mktime((year, month, day, hr, 0, 0, 0, 0, -1))
-    julDay = time.localtime(t)[7]
+    julDay = datetime.date(year, month, day).timetuple().tm_yday
 
     return julDay
 
@@ -142,19 +165,9 @@ def mkUTC(year, month, day, hour, min, sec):
     :returns: UTC time
     :rtype: time structure
     """
-    if float(sec).is_integer():
-        msec = 0
-    else:
-        msec = float(str(sec-int(sec))[1:])
-    spec = [year, month, day, hour, min, int(math.floor(sec))] + [0, 0, 0]
-    # print('\n\nyear %s = %s' % (type(year), year))
-    # print('month %s = %s' % (type(month), month))
-    # print('day %s = %s' % (type(day), day))
-    # print('hour %s = %s' % (type(hour), hour))
-    # print('min %s = %s' % (type(min), min))
-    # print('sec %s = %s' % (type(sec), sec))
-    # print('spec %s' % spec)
-    utc = time.mktime(spec) + msec - time.timezone
+    msec = sec - math.floor(sec)
+    spec = (year, month, day, hour, min, int(math.floor(sec)), 0, 0, 0)
+    utc = calendar.timegm(spec) + msec
     return utc
 
 
@@ -173,18 +186,92 @@ def ymdhmsFromPyUTC(pyUTC):
     return datetime.datetime.utcfromtimestamp(pyUTC)
 
 
-def wtFromUTCpy(pyUTC, leapSecs=14):
+def wtFromUTCpy(pyUTC, leapSecs=None):
     """
     convenience function:
          allows to use python UTC times and
          returns only week and tow
     """
     ymdhms = ymdhmsFromPyUTC(pyUTC)
-    wSowDSoD = apply(gpsFromUTC, ymdhms.timetuple()[:6] + (leapSecs,))
+    wSowDSoD = gpsFromUTC(*ymdhms.timetuple()[:5], ymdhms.second + ymdhms.microsecond / 1e6, leapSecs=leapSecs)
     return wSowDSoD[0:2]
 
 
-def gpsFromUTC(year, month, day, hour, min, sec, leapSecs=14):
+def leapSecondsFromUTC(utcSecs):
+    """
+    returns the GPS-UTC leap seconds in effect at the given UTC times
+
+    :param utcSecs: UTC seconds since the GPS epoch (no leap seconds counted)
+    :type utcSecs: float or array_like
+    :returns: number of leap seconds
+    :rtype: int or numpy.ndarray of int64
+    """
+    return _LEAPOFFSET[np.searchsorted(_LEAPUTC, np.floor(utcSecs), side='right')]
+
+
+def leapSecondsFromGps(gpsSecs):
+    """
+    returns the GPS-UTC leap seconds in effect at the given GPS times
+
+    :param gpsSecs: GPS seconds since the GPS epoch
+    :type gpsSecs: float or array_like
+    :returns: number of leap seconds
+    :rtype: int or numpy.ndarray of int64
+    """
+    return _LEAPOFFSET[np.searchsorted(_LEAPGPS, np.floor(gpsSecs), side='right')]
+
+
+def _nsecsFromWT(weeknr, tow):
+    """
+    returns the nanoseconds since the GPS epoch for weektime arrays, fraction of TOW rounded to microseconds
+    """
+    weeknr = np.asarray(weeknr).astype(np.int64)
+    tow = np.asarray(tow, dtype=np.float64)
+
+    secs = np.floor(tow)
+    usecs = np.round((tow - secs) * 1e6).astype(np.int64)
+
+    return (weeknr * SECSINWEEK + secs.astype(np.int64)) * NSECSINSEC + usecs * 1000
+
+
+def UTCFromGpsArray(weeknr, tow):
+    """
+    converts arrays of GPS week and seconds of week to UTC taking the leap seconds into account
+
+    The inserted leap second itself (23:59:60) is not representable as datetime64 and maps onto 00:00:00.
+
+    :param weeknr: GPS week numbers (full, not modulo 1024)
+    :type weeknr: array_like of int
+    :param tow: time of week in seconds
+    :type tow: array_like of float
+    :returns: UTC times
+    :rtype: numpy.ndarray of datetime64[ns]
+    """
+    nsecs = _nsecsFromWT(weeknr, tow)
+    leapSecs = leapSecondsFromGps(nsecs // NSECSINSEC)
+
+    return GPSEPOCH64 + (nsecs - leapSecs * NSECSINSEC).astype('timedelta64[ns]')
+
+
+def gpsFromUTCArray(utc):
+    """
+    converts an array of UTC times to GPS week and seconds of week taking the leap seconds into account
+
+    :param utc: UTC times
+    :type utc: array_like of datetime64
+    :returns: GPS week numbers and seconds of week
+    :rtype: tuple of numpy.ndarray (int64, float64)
+    """
+    nsecs = (np.asarray(utc, dtype='datetime64[ns]') - GPSEPOCH64).astype(np.int64)
+    nsecs = nsecs + leapSecondsFromUTC(nsecs // NSECSINSEC) * NSECSINSEC
+
+    weeknr = nsecs // (SECSINWEEK * NSECSINSEC)
+    tow = (nsecs - weeknr * SECSINWEEK * NSECSINSEC) / NSECSINSEC
+
+    return weeknr, tow
+
+
+def gpsFromUTC(year, month, day, hour, min, sec, leapSecs=None):
     """converts UTC to: gpsWeek, secsOfWeek, gpsDay, secsOfDay
 
     a good reference is:  http://www.oc.nps.navy.mil/~jclynch/timsys.html
@@ -197,39 +284,20 @@ def gpsFromUTC(year, month, day, hour, min, sec, leapSecs=14):
     The GPS week starts on Saturday midnight (Sunday morning), and runs
     for 604800 seconds.
 
-    Currently, GPS time is 14 seconds ahead of UTC (see above reference).
-    While GPS SVs transmit this difference and the date when another leap
-    second takes effect, the use of leap seconds cannot be predicted.  This
-    routine is precise until the next leap second is introduced and has to be
-    updated after that.
+    GPS time is ahead of UTC by the number of leap seconds introduced since
+    the GPS epoch. When leapSecs is None, this number is looked up in the
+    table LEAPSECONDS which has to be updated when a new leap second is
+    announced.
 
     SOW = Seconds of Week
     SOD = Seconds of Day
-
-    Note:  Python represents time in integer seconds, fractions are lost!!!
     """
-    # secFract = sec
-    # secFract = sec % 1
-    epochTuple = DT06JAN80 + (-1, -1, 0)
-    t0 = time.mktime(epochTuple)
-    # print('\n\nyear %s = %s' % (type(year), year))
-    # print('month %s = %s' % (type(month), month))
-    # print('day %s = %s' % (type(day), day))
-    # print('hour %s = %s' % (type(hour), hour))
-    # print('min %s = %s' % (type(min), min))
-    # print('sec %s = %s' % (type(sec), sec))
-    if float(sec).is_integer():
-        msec = 0
-    else:
-        msec = float(str(sec-int(sec))[1:])
-
-    t = time.mktime((year, month, day, hour, min, int(sec), -1, -1, 0))
-    # Note: time.mktime strictly works in localtime and to yield UTC, it should be
-    #       corrected with time.timezone
-    #       However, since we use the difference, this correction is unnecessary.
-    # Warning:  trouble if daylight savings flag is set to -1 or 1 !!!
-    t = t + leapSecs
-    tdiff = t - t0
+    msec = sec - math.floor(sec)
+    t = calendar.timegm((year, month, day, hour, min, int(math.floor(sec)), 0, 0, 0)) - calendar.timegm(DT06JAN80 + (0, 0, 0))
+    if leapSecs is None:
+        leapSecs = int(leapSecondsFromUTC(t))
+
+    tdiff = t + leapSecs
     gpsSOW = (tdiff % SECSINWEEK) + msec
     # gpsSOW = (tdiff % SECSINWEEK) + secFract
     gpsWeek = int(math.floor(tdiff/SECSINWEEK))
@@ -238,7 +306,7 @@ def gpsFromUTC(year, month, day, hour, min, sec, leapSecs=14):
     return (gpsWeek, gpsSOW, gpsDay, gpsSOD)
 
 
-def UTCFromGps(gpsWeek, SOW, leapSecs=14):
+def UTCFromGps(gpsWeek, SOW, leapSecs=None):
     """converts gps week and seconds to UTC
 
     see comments of inverse function!
@@ -247,13 +315,12 @@ def UTCFromGps(gpsWeek, SOW, leapSecs=14):
     gpsWeek is the full number (not modulo 1024)
     """
     secFract = SOW % 1
-    epochTuple = DT06JAN80 + (-1, -1, 0)
-    t0 = time.mktime(epochTuple) - time.timezone  # mktime is localtime, correct for UTC
-    tdiff = (gpsWeek * SECSINWEEK) + SOW - leapSecs
-    t = t0 + tdiff
-    (year, month, day, hh, mm, ss, dayOfWeek, julianDay, daylightsaving) = time.gmtime(t)
-    # use gmtime since localtime does not allow to switch off daylighsavings correction!!!
-    return (year, month, day, hh, mm, ss + secFract)
+    tdiff = int(gpsWeek * SECSINWEEK + math.floor(SOW))
+    if leapSecs is None:
+        leapSecs = int(leapSecondsFromGps(tdiff))
+
+    t = datetime.datetime(*DT06JAN80) + datetime.timedelta(seconds=tdiff - leapSecs)
+    return (t.year, t.month, t.day, t.hour, t.minute, t.second + secFract)
 
 
 def UTCFromString(year, month, day, dataString):
@@ -268,12 +335,12 @@ def UTCFromString(year, month, day, dataString):
     return time
 
 
-def GpsSecondsFromPyUTC(pyUTC, leapSecs=14):
+def GpsSecondsFromPyUTC(pyUTC, leapSecs=None):
     """converts the python epoch to gps seconds
 
     pyEpoch = the python epoch from time.time()
     """
-    t = gpsFromUTC(*ymdhmsFromPyUTC(pyUTC))
+    t = wtFromUTCpy(pyUTC, leapSecs=leapSecs)
     return int(t[0] * 60 * 60 * 24 * 7 + t[1])
 
 
@@ -286,6 +353,8 @@ def DOWFromWT(tow):
 def UTCFromWT(weeknr, tow):
     """
     get UTC time from weektime
+
+    No leap seconds are applied (GPS time scale), use UTCFromGps or UTCFromGpsArray for true UTC.
     """
     datum = datetime.datetime(1980, 1, 6, 0, 0, 0)
     week = datetime.timedelta(weeks=weeknr)
@@ -293,6 +362,24 @@ def UTCFromWT(weeknr, tow):
     time = datum+week+sec
     return time
 
+
+def UTCFromWTArray(weeknr, tow):
+    """
+    get UTC time from weektime for whole columns at once (vectorised UTCFromWT)
+
+    The fractional seconds are rounded to microseconds half-to-even, as done by
+    datetime.timedelta, so that the result is identical to applying UTCFromWT per row.
+    As for UTCFromWT, no leap seconds are applied.
+
+    :param weeknr: GPS week numbers
+    :type weeknr: array_like of int
+    :param tow: time of week in seconds
+    :type tow: array_like of float
+    :returns: times corresponding to weeknr and tow
+    :rtype: numpy.ndarray of datetime64[ns]
+    """
+    return GPSEPOCH64 + _nsecsFromWT(weeknr, tow).astype('timedelta64[ns]')
+
 # def PyUTCFromGpsSeconds(gpsseconds):
 #     """converts gps seconds to the
 #     python epoch. That is, the time
@@ -317,7 +404,7 @@ def testTimeStuff():
     (w, sow, d, sod) = gpsFromUTC(1999, 8, 21, 23, 59, 47)
     print("**** week: %s, sow: %s, day: %s, sod: %s" % (w, sow, d, sod))
     print("     and hopefully back:")
-    print("**** %s, %s, %s, %s, %s, %s\n" % UTCFromGps(w, sow, leapSecs=14))
+    print("**** %s, %s, %s, %s, %s, %s\n" % UTCFromGps(w, sow))
 
     print("Today is GPS week 1186, day 3, seems to run ok (2002, 10, 2, 12, 6, 13.56)")
     (w, sow, d, sod) = gpsFromUTC(2002, 10, 2, 12, 6, 13.56)
@@ -347,7 +434,7 @@ def testPyUtilties():
     ymdhms = (2002, 10, 12, 8, 34, 12.3)
     print("testing for: ", ymdhms)
 
-    pyUtc = apply(mkUTC, ymdhms)
+    pyUtc = mkUTC(*ymdhms)
     back = ymdhmsFromPyUTC(pyUtc)
     print("yields     : ", back)
 # *********************** !!!!!!!!
@@ -359,6 +446,32 @@ def testPyUtilties():
     print("week and time: ", (w, t))
 
 
+def testUTCFromWTArray(nrEpochs=86400):
+    """test and time the vectorised weektime conversion against UTCFromWT"""
+    weeknr = np.full(nrEpochs, 2040)
+    tow = np.round(345600 + np.arange(nrEpochs) * 0.1 + np.random.uniform(0, 0.1, nrEpochs), 3)
+
+    t0 = time.perf_counter()
+    perRow = np.array([UTCFromWT(w, t) for w, t in zip(weeknr.tolist(), tow.tolist())], dtype='datetime64[ns]')
+    t1 = time.perf_counter()
+    vectorised = UTCFromWTArray(weeknr, tow)
+    t2 = time.perf_counter()
+
+    print('%d epochs: per row %.3fs, vectorised %.4fs (x%.0f), identical = %s' % (nrEpochs, t1 - t0, t2 - t1, (t1 - t0) / (t2 - t1), np.array_equal(perRow, vectorised)))
+
+
+def testLeapSeconds():
+    """test the leap second aware conversions around the leap second of 31 Dec 2016"""
+    weeknr, tow = gpsFromUTCArray(np.array(['2016-12-31T23:59:59.000250', '2017-01-01T00:00:00.000250'], dtype='datetime64[ns]'))
+    print('2016-12-31 23:59:59.00025 & 2017-01-01 00:00:00.00025 -> week 1930, sow 16.00025 & 18.00025  ==??== ', weeknr, tow)
+    print('     and hopefully back: ', UTCFromGpsArray(weeknr, tow))
+    print('scalar: ', gpsFromUTC(2017, 1, 1, 0, 0, 0.00025), UTCFromGps(1930, 18.00025))
+
+    utc = GPSEPOCH64 + np.arange(0, 40 * 365 * SECSINDAY, 3599.123456, dtype=np.float64).astype('timedelta64[s]')
+    weeknr, tow = gpsFromUTCArray(utc)
+    print('round trip over %d epochs from 1980 identical = %s' % (len(utc), np.array_equal(UTCFromGpsArray(weeknr, tow), utc)))
+
+
 # ===== Main =========================================
 if __name__ == "__main__":
     pass
@@ -366,4 +479,6 @@ if __name__ == "__main__":
     testGpsWeek()
     testJulD()
     testDayOfWeek()
+    testUTCFromWTArray()
+    testLeapSeconds()
     testPyUtilties()
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+
+from GNSS import gpstime
+
+__author__ = 'amuls'
+
+BLOCKSECONDS = 60  # length of the blocks of which the median AGC is kept for the baseline
+BASELINEBLOCKS = 10  # number of previous blocks whose median gives the baseline
+EVENTCOLUMNS = ['FrontEnd', 'start', 'end', 'duration[s]', 'depth[dB]', 'minAGC[dB]', 'baseline[dB]', 'epochs']
+
+
+def initDetector(frontEnds: list, threshold: float) -> dict:
+    """
+    creates the state of the interference detector, flagging for each front-end the AGC values more than threshold dB below its running baseline
+    """
+    dDetector = {}
+    dDetector['threshold'] = threshold
+    dDetector['events'] = []  # closed events
+    dDetector['frontends'] = {}
+    for frontEnd in frontEnds:
+        addFrontEnd(dDetector, frontEnd)
+
+    return dDetector
+
+
+def addFrontEnd(dDetector: dict, frontEnd: int):
+    """
+    adds the state of a front-end to the detector: the medians of its last blocks, the AGC values of its incomplete block and its open event
+    """
+    dState = {}
+    dState['medians'] = np.full(BASELINEBLOCKS, np.nan)  # ring of the medians of the last unflagged blocks
+    dState['next'] = 0  # position in the ring of the next median
+    dState['pendingSecs'] = np.zeros(0)
+    dState['pendingAGC'] = np.zeros(0)
+    dState['open'] = None  # event still going on at the end of the last block
+
+    dDetector['frontends'][frontEnd] = dState
+
+
+def detectBlock(dDetector: dict, frontEnd: int, secs: np.ndarray, agc: np.ndarray):
+    """
+    flags the AGC values of a block of a front-end against the baseline of the previous blocks and extends or closes its events
+
+    The median of the unflagged values of the block is added to the baseline, so that the baseline stays at the undisturbed AGC during an event.
+    """
+    dState = dDetector['frontends'][frontEnd]
+
+    # no flags before a baseline is available
+    baseline = np.nanmedian(dState['medians']) if not np.isnan(dState['medians']).all() else np.nan
+    drop = baseline - agc
+    flagged = drop > dDetector['threshold']
+
+    if not flagged.all():
+        dState['medians'][dState['next']] = np.median(agc[~flagged])
+        dState['next'] = (dState['next'] + 1) % BASELINEBLOCKS
+
+    # runs of flagged values, a run at the start of the block continues the open event
+    edges = np.diff(np.concatenate([[dState['open'] is not None], flagged, [False]]).astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if dState['open'] is not None:
+        starts = np.concatenate([[0], starts])
+
+    for start, end in zip(starts, ends):
+        dEvent = dState['open'] if (start == 0 and dState['open'] is not None) else {'FrontEnd': frontEnd, 'start': secs[start], 'depth[dB]': -np.inf, 'minAGC[dB]': np.inf, 'baseline[dB]': baseline, 'epochs': 0}
+        dState['open'] = None
+        if end > start:
+            dEvent['end'] = secs[end - 1]
+            dEvent['depth[dB]'] = max(dEvent['depth[dB]'], drop[start:end].max())
+            dEvent['minAGC[dB]'] = min(dEvent['minAGC[dB]'], agc[start:end].min())
+            dEvent['epochs'] += end - start
+
+        # the event goes on when it reaches the end of the block
+        if end == agc.size:
+            dState['open'] = dEvent
+        else:
+            dDetector['events'].append(dEvent)
+
+
+def updateDetector(dDetector: dict, gpsSecs: np.ndarray, dAGC: dict, final: bool = False):
+    """
+    feeds the next epochs (GPS seconds, in time order) of the epochs x front-ends AGC array to the detector, a NaN meaning that the front-end reports no value
+
+    The values of the last (possibly incomplete) block are kept for the next update, unless final is set, when all blocks and open events are closed.
+    """
+    for i, frontEnd in enumerate(dAGC['frontends']):
+        if frontEnd not in dDetector['frontends']:
+            addFrontEnd(dDetector, frontEnd)
+        dState = dDetector['frontends'][frontEnd]
+
+        valid = ~np.isnan(dAGC['agc'][:, i])
+        secs = np.concatenate([dState['pendingSecs'], gpsSecs[valid]])
+        agc = np.concatenate([dState['pendingAGC'], dAGC['agc'][valid, i]])
+
+        # split in blocks, the last block is only complete at the final update
+        blocks = np.floor(secs / BLOCKSECONDS)
+        bounds = np.concatenate([[0], np.flatnonzero(np.diff(blocks)) + 1, [secs.size]])
+        nrComplete = bounds.size - 1 if final else bounds.size - 2
+        for start, end in zip(bounds[:nrComplete], bounds[1:nrComplete + 1]):
+            if end > start:
+                detectBlock(dDetector, frontEnd, secs[start:end], agc[start:end])
+
+        dState['pendingSecs'] = secs[bounds[max(nrComplete, 0)]:]
+        dState['pendingAGC'] = agc[bounds[max(nrComplete, 0)]:]
+
+    if final:
+        for dState in dDetector['frontends'].values():
+            if dState['open'] is not None:
+                dDetector['events'].append(dState['open'])
+                dState['open'] = None
+
+
+def eventsFrame(dDetector: dict) -> pd.DataFrame:
+    """
+    returns the closed interference events in time order, with their start and end as UTC time
+    """
+    dfEvents = pd.DataFrame(dDetector['events'], columns=EVENTCOLUMNS)
+    if dfEvents.shape[0] == 0:
+        return dfEvents
+
+    dfEvents['duration[s]'] = dfEvents['end'] - dfEvents['start']
+    for col in ['start', 'end']:
+        secs = dfEvents[col].to_numpy(dtype=float)
+        dfEvents[col] = gpstime.UTCFromWTArray(secs // gpstime.SECSINWEEK, secs % gpstime.SECSINWEEK)
+
+    return dfEvents.sort_values(['start', 'FrontEnd'], kind='stable').reset_index(drop=True)
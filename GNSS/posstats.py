@@ -0,0 +1,232 @@
+import numpy as np
+import pandas as pd
+
+from GNSS import ecef
+from GNSS import gpstime
+
+__author__ = 'amuls'
+
+# log spaced bins of the histograms of the horizontal and vertical errors, from 1 mm to 100 km
+HISTMIN = 1e-3
+HISTDECADES = 8
+BINSPERDECADE = 40
+HISTEDGES = HISTMIN * 10 ** (np.arange(HISTDECADES * BINSPERDECADE + 1) / BINSPERDECADE)
+
+ROLLINGSTEPS = 10  # number of steps a rolling window advances over its length
+
+# scale factors from the standard deviations to the percentiles of normally distributed errors
+CEP50SCALE = 0.5887  # CEP50 ~ 0.5887 (stdE + stdN)
+CEP95SCALE = 1.2239  # CEP95 ~ 1.2239 (stdE + stdN)
+V95SCALE = 1.96  # V95 ~ 1.96 stdU
+
+
+def initAccumulator() -> dict:
+    """
+    creates an empty accumulator of position statistics: number of epochs, mean and co-moment of the ECEF coordinates and histograms of the horizontal and vertical errors
+    """
+    dAcc = {}
+    dAcc['epochs'] = 0
+    dAcc['mean'] = np.zeros(3)
+    dAcc['M2'] = np.zeros((3, 3))
+    dAcc['hist2D'] = np.zeros(HISTEDGES.size + 1, dtype=np.int64)
+    dAcc['histV'] = np.zeros(HISTEDGES.size + 1, dtype=np.int64)
+
+    return dAcc
+
+
+def histogramCounts(values: np.ndarray) -> np.ndarray:
+    """
+    returns the counts of the (non NaN) values in the bins below, between and above HISTEDGES
+    """
+    values = values[~np.isnan(values)]
+
+    return np.bincount(np.searchsorted(HISTEDGES, values, side='right'), minlength=HISTEDGES.size + 1)
+
+
+def accumulate(xyz: np.ndarray, enu: np.ndarray) -> dict:
+    """
+    returns the accumulator of the ECEF coordinates xyz (n x 3) and their East/North/Up errors enu (n x 3, NaN without reference)
+    """
+    dAcc = initAccumulator()
+    if xyz.shape[0] == 0:
+        return dAcc
+
+    dAcc['epochs'] = xyz.shape[0]
+    dAcc['mean'] = xyz.mean(axis=0)
+    dxyz = xyz - dAcc['mean']
+    dAcc['M2'] = dxyz.T @ dxyz
+    dAcc['hist2D'] += histogramCounts(np.hypot(enu[:, 0], enu[:, 1]))
+    dAcc['histV'] += histogramCounts(np.abs(enu[:, 2]))
+
+    return dAcc
+
+
+def mergeAccumulators(dAccA: dict, dAccB: dict) -> dict:
+    """
+    returns the accumulator of the epochs of both accumulators, combining the means and co-moments with Chan's parallel formula
+    """
+    if dAccA['epochs'] == 0:
+        return dAccB
+    if dAccB['epochs'] == 0:
+        return dAccA
+
+    dAcc = {}
+    dAcc['epochs'] = dAccA['epochs'] + dAccB['epochs']
+    delta = dAccB['mean'] - dAccA['mean']
+    dAcc['mean'] = dAccA['mean'] + delta * dAccB['epochs'] / dAcc['epochs']
+    dAcc['M2'] = dAccA['M2'] + dAccB['M2'] + np.outer(delta, delta) * dAccA['epochs'] * dAccB['epochs'] / dAcc['epochs']
+    dAcc['hist2D'] = dAccA['hist2D'] + dAccB['hist2D']
+    dAcc['histV'] = dAccA['histV'] + dAccB['histV']
+
+    return dAcc
+
+
+def histogramQuantile(counts: np.ndarray, q: float) -> float:
+    """
+    returns the q-quantile of the histogram counts, interpolating linearly within its bin
+    """
+    total = counts.sum()
+    if total == 0:
+        return np.nan
+
+    cumCounts = np.cumsum(counts)
+    iBin = int(np.searchsorted(cumCounts, q * total, side='left'))
+    if iBin >= HISTEDGES.size:
+        return HISTEDGES[-1]
+
+    lower = 0. if iBin == 0 else HISTEDGES[iBin - 1]
+    below = 0 if iBin == 0 else cumCounts[iBin - 1]
+
+    return lower + (HISTEDGES[iBin] - lower) * (q * total - below) / counts[iBin]
+
+
+def statistics(dAcc: dict, dMarker: dict) -> dict:
+    """
+    returns the position statistics of the accumulator: mean position, its offset to the marker, per-axis std, 2DRMS, CEP50, CEP95 and V95
+
+    The percentiles are taken from the error histograms relative to the marker, without marker they are derived from the standard deviations assuming normally distributed errors around the mean position.
+    """
+    dStats = {}
+    dStats['epochs'] = int(dAcc['epochs'])
+    if dAcc['epochs'] == 0:
+        return dStats
+
+    lat, lon, ellH = ecef.ecef2Geodetic(dAcc['mean'])
+    dStats['lat'], dStats['lon'], dStats['ellH'] = float(np.degrees(lat)), float(np.degrees(lon)), float(ellH)
+
+    # the errors are expressed in the local frame at the marker, or at the mean position when no marker is given
+    hasMarker = not np.isnan(dMarker['lat'])
+    if hasMarker:
+        lat0, lon0, ellH0 = np.radians(dMarker['lat']), np.radians(dMarker['lon']), dMarker['ellH']
+        meanENU = ecef.ecef2ENU(dAcc['mean'], lat0=lat0, lon0=lon0, ellH0=ellH0)
+    else:
+        lat0, lon0 = float(lat), float(lon)
+        meanENU = np.zeros(3)
+    R = ecef.rotationENU(float(lat0), float(lon0))
+    covENU = R @ (dAcc['M2'] / (dAcc['epochs'] - 1) if dAcc['epochs'] > 1 else np.full((3, 3), np.nan)) @ R.T
+    stdENU = np.sqrt(np.diag(covENU))
+
+    dStats['meanE'], dStats['meanN'], dStats['meanU'] = (float(v) for v in meanENU)
+    dStats['stdE'], dStats['stdN'], dStats['stdU'] = (float(v) for v in stdENU)
+    dStats['2DRMS'] = float(2 * np.sqrt(stdENU[0] ** 2 + stdENU[1] ** 2 + meanENU[0] ** 2 + meanENU[1] ** 2))
+
+    if hasMarker and dAcc['hist2D'].sum() > 0:
+        dStats['CEP50'] = float(histogramQuantile(dAcc['hist2D'], 0.50))
+        dStats['CEP95'] = float(histogramQuantile(dAcc['hist2D'], 0.95))
+        dStats['V95'] = float(histogramQuantile(dAcc['histV'], 0.95))
+        dStats['reference'] = 'marker'
+    else:
+        dStats['CEP50'] = float(CEP50SCALE * (stdENU[0] + stdENU[1]))
+        dStats['CEP95'] = float(CEP95SCALE * (stdENU[0] + stdENU[1]))
+        dStats['V95'] = float(V95SCALE * stdENU[2])
+        dStats['reference'] = 'mean'
+
+    # undefined values (e.g. the std of a single epoch) are None so that the statistics can be saved as JSON
+    return {key: None if isinstance(value, float) and np.isnan(value) else value for key, value in dStats.items()}
+
+
+def initStats(window: float = 0) -> dict:
+    """
+    creates the position statistics accumulators over all epochs, per SignalInfo and 2D/3D group and per step of the rolling windows of window seconds (0 for none)
+    """
+    dStats = {}
+    dStats['all'] = initAccumulator()
+    dStats['groups'] = {}
+    dStats['window'] = window
+    dStats['step'] = window / ROLLINGSTEPS
+    dStats['steps'] = {}
+    dStats['reported'] = None  # last step of which the rolling window has been returned by rollingStats
+
+    return dStats
+
+
+def updateAccumulators(dAccs: dict, dIndices: dict, xyz: np.ndarray, enu: np.ndarray):
+    """
+    merges the epochs at the positions dIndices[key] into the accumulator dAccs[key]
+    """
+    for key, idx in dIndices.items():
+        dAccs[key] = mergeAccumulators(dAccs.get(key, initAccumulator()), accumulate(xyz[idx], enu[idx]))
+
+
+def updateStats(dStats: dict, dfSTF: pd.DataFrame):
+    """
+    accumulates the position statistics of (a chunk of) the PVTGeodetic dataframe with its ENU columns
+    """
+    if dfSTF.shape[0] == 0:
+        return
+
+    xyz = ecef.geodetic2ECEF(dfSTF['Latitude[rad]'].to_numpy(), dfSTF['Longitude[rad]'].to_numpy(), dfSTF['Height[m]'].to_numpy())
+    enu = dfSTF[['ENU.E', 'ENU.N', 'ENU.U']].to_numpy(dtype=float)
+
+    dStats['all'] = mergeAccumulators(dStats['all'], accumulate(xyz, enu))
+    updateAccumulators(dStats['groups'], dfSTF.groupby(['SignalInfo', '2D/3D']).indices, xyz, enu)
+
+    if dStats['window'] > 0:
+        gpsSecs = dfSTF['WNc[week]'].to_numpy(dtype=float) * gpstime.SECSINWEEK + dfSTF['TOW[s]'].to_numpy(dtype=float)
+        steps = np.floor(gpsSecs / dStats['step']).astype(np.int64)
+        updateAccumulators(dStats['steps'], pd.Series(steps).groupby(steps).indices, xyz, enu)
+
+
+def mergeStats(dStatsA: dict, dStatsB: dict) -> dict:
+    """
+    returns the position statistics accumulators of both (e.g. of different files), which must use the same window
+    """
+    dStats = initStats(window=dStatsA['window'])
+    dStats['all'] = mergeAccumulators(dStatsA['all'], dStatsB['all'])
+    for key in ['groups', 'steps']:
+        for dAccs in [dStatsA[key], dStatsB[key]]:
+            for k, dAcc in dAccs.items():
+                dStats[key][k] = mergeAccumulators(dStats[key].get(k, initAccumulator()), dAcc)
+
+    return dStats
+
+
+def rollingStats(dStats: dict, dMarker: dict, lastStep: int = None) -> pd.DataFrame:
+    """
+    returns the position statistics of the rolling windows, one row per step at the end of the window
+
+    When lastStep is given, only the windows of the steps after those returned before and up to lastStep are returned, and the steps no longer needed by later windows are dropped, so that a growing file is reported with bounded memory.
+    """
+    lstRows = []
+    steps = sorted(step for step in dStats['steps'] if (dStats['reported'] is None or step > dStats['reported']) and (lastStep is None or step <= lastStep))
+    for step in steps:
+        dAcc = initAccumulator()
+        for prevStep in range(step - ROLLINGSTEPS + 1, step + 1):
+            if prevStep in dStats['steps']:
+                dAcc = mergeAccumulators(dAcc, dStats['steps'][prevStep])
+
+        gpsEnd = (step + 1) * dStats['step']
+        dRow = {'WNc[week]': int(gpsEnd // gpstime.SECSINWEEK), 'TOW[s]': gpsEnd % gpstime.SECSINWEEK}
+        dRow.update(statistics(dAcc, dMarker=dMarker))
+        lstRows.append(dRow)
+
+    if lastStep is not None:
+        dStats['reported'] = lastStep if dStats['reported'] is None else max(dStats['reported'], lastStep)
+        for step in [step for step in dStats['steps'] if step <= dStats['reported'] - ROLLINGSTEPS + 1]:
+            del dStats['steps'][step]
+
+    dfWindows = pd.DataFrame(lstRows)
+    if dfWindows.shape[0] > 0:
+        dfWindows.insert(0, 'time', gpstime.UTCFromWTArray(dfWindows['WNc[week]'].to_numpy(), dfWindows['TOW[s]'].to_numpy()))
+
+    return dfWindows
@@ -0,0 +1,60 @@
+import numpy as np
+import utm as UTM
+
+__author__ = 'amuls'
+
+ZONELETTERS = np.array(list('CDEFGHJKLMNPQRSTUVWXX'))
+
+
+def zoneNumbers(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """
+    returns the UTM zone number of each epoch (lat/lon in degrees), including the Norway and Svalbard exceptions
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = (np.asarray(lon, dtype=float) % 360 + 540) % 360 - 180
+
+    zones = ((lon + 180) // 6).astype(np.int64) + 1
+
+    # special zone for Norway
+    zones = np.where((lat >= 56) & (lat < 64) & (lon >= 3) & (lon < 12), 32, zones)
+    # special zones for Svalbard
+    svalbard = (lat >= 72) & (lat <= 84) & (lon >= 0) & (lon < 42)
+    zones = np.where(svalbard, np.array([31, 33, 35, 37])[np.searchsorted([9, 21, 33], lon, side='right').clip(0, 3)], zones)
+
+    return zones
+
+
+def zoneLetters(lat: np.ndarray) -> np.ndarray:
+    """
+    returns the UTM latitude band letter of each epoch (lat in degrees between -80 and 84)
+    """
+    lat = np.asarray(lat, dtype=float)
+
+    return ZONELETTERS[((lat + 80).astype(np.int64) >> 3).clip(0, ZONELETTERS.size - 1)]
+
+
+def projectUTM(lat: np.ndarray, lon: np.ndarray, zone: int = None) -> tuple:
+    """
+    projects the epochs (lat/lon in degrees) to UTM, each in its own zone or all in the common zone when given
+
+    The epochs are partitioned by zone and hemisphere and each partition is projected in bulk, keeping the order of the epochs.
+    Returns the arrays of easting, northing, zone number and zone letter.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+
+    zones = np.full(lat.shape, zone, dtype=np.int64) if zone else zoneNumbers(lat, lon)
+    northern = lat >= 0
+
+    easting = np.empty(lat.shape)
+    northing = np.empty(lat.shape)
+
+    # partition the epochs by zone and hemisphere in a single pass
+    partitions, inverse = np.unique(zones * 2 + northern, return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.searchsorted(inverse[order], np.arange(partitions.size + 1))
+    for i, partition in enumerate(partitions.tolist()):
+        idx = order[bounds[i]:bounds[i + 1]]
+        easting[idx], northing[idx], _, _ = UTM.from_latlon(lat[idx], lon[idx], force_zone_number=partition // 2, force_northern=bool(partition % 2))
+
+    return easting, northing, zones, zoneLetters(lat)
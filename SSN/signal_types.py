@@ -1,3 +1,5 @@
+import numpy as np
+
 dSigType = {
  0: 'GPS_L1-CA',
  1: 'GPS_L1-P(Y)',
@@ -88,8 +90,6 @@ def findPosition(n):
         # increment position
         pos += 1
 
-        print('i = {:d}  pos = {:d}'.format(i, pos))
-
     return pos
 
 
@@ -124,3 +124,78 @@ def countSetBits(n: int) -> int:
         # print('count = {:d}  n = {:d}  n&1 = {:d}'.format(count, n, n&1))
         n >>= 1
     return count
+
+
+# bit masks of the signal types per constellation, taken from the prefix of the signal names
+dSigConstellation = {}
+for bit, name in dSigType.items():
+    if name != 'Reserved':
+        dSigConstellation[name.split('_')[0]] = dSigConstellation.get(name.split('_')[0], 0) | (1 << bit)
+
+# memoized mapping of the SignalInfo bit masks to their signal names, shared by reading and plotting
+dSignalNames = {}
+
+# number of set bits for every byte value
+POPCOUNT8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount(masks: np.ndarray) -> np.ndarray:
+    """
+    returns the number of set bits (i.e. the number of signals) of each SignalInfo bit mask
+    """
+    masks = np.asarray(masks, dtype=np.uint32)
+    counts = POPCOUNT8[masks.reshape(-1).view(np.uint8)].reshape(-1, 4).sum(axis=1, dtype=np.uint8)
+
+    return counts.reshape(masks.shape)
+
+
+def signalBits(masks: np.ndarray) -> np.ndarray:
+    """
+    returns the boolean matrix (one row per mask, one column per bit of dSigType) telling which signals are used
+    """
+    masks = np.asarray(masks, dtype=np.uint32)
+
+    return ((masks[..., np.newaxis] >> np.arange(len(dSigType), dtype=np.uint32)) & 1).astype(bool)
+
+
+def constellationFlags(masks: np.ndarray) -> dict:
+    """
+    returns per constellation (GPS, GLO, GAL, GEO) the boolean array telling whether its signals are used
+    """
+    masks = np.asarray(masks, dtype=np.uint32)
+
+    return {const: (masks & constMask) != 0 for const, constMask in dSigConstellation.items()}
+
+
+def signalNamesMap(masks: np.ndarray) -> dict:
+    """
+    returns the mapping of the distinct SignalInfo bit masks to their signal names, the masks not yet in dSignalNames are decoded in one vectorized pass
+    """
+    masks = np.unique(np.asarray(masks, dtype=np.uint32)).tolist()
+
+    # add the masks not seen before to the memoized mapping
+    newMasks = [mask for mask in masks if mask not in dSignalNames]
+    if newMasks:
+        names = np.array(list(dSigType.values()))
+        for mask, maskBits in zip(newMasks, signalBits(newMasks)):
+            dSignalNames[mask] = tuple(names[maskBits])
+
+    return {mask: dSignalNames[mask] for mask in masks}
+
+
+def signalNames(mask: int) -> tuple:
+    """
+    returns the names of the signals used in the SignalInfo bit mask
+    """
+    mask = int(mask)
+    if mask not in dSignalNames:
+        signalNamesMap([mask])
+
+    return dSignalNames[mask]
+
+
+def signalLabel(mask: int) -> str:
+    """
+    returns the names of the signals used in the SignalInfo bit mask as label for plotting
+    """
+    return ','.join(signalNames(mask))
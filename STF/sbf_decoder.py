@@ -0,0 +1,281 @@
+import os
+import sys
+import logging
+import numpy as np
+import pandas as pd
+from termcolor import colored
+
+import am_config as amc
+from STF import stf_schema
+
+__author__ = 'amuls'
+
+SBF_SYNC = b'$@'
+SBF_HEADERLENGTH = 8  # Sync, CRC, ID, Length
+SBF_DONOTUSE_FLOAT = -2e10
+SBF_DONOTUSE_U2 = 65535
+SBF_DONOTUSE_I1 = -128
+SBF_PVTGEODETIC = 4007
+SBF_RECEIVERSTATUS = 4014
+SYNCSEARCHSIZE = 64 * 1024 * 1024  # bytes searched at once for the sync pattern
+
+# header and time stamp common to all SBF blocks
+lstSBFHeader = [('Sync', 'S2', 0), ('CRC', '<u2', 2), ('ID', '<u2', 4), ('Length', '<u2', 6), ('TOW', '<u4', 8), ('WNc', '<u2', 12)]
+
+# PVTGeodetic revision 2
+lstPVTGeodetic2 = lstSBFHeader + [
+    ('Mode', 'u1', 14), ('Error', 'u1', 15),
+    ('Latitude', '<f8', 16), ('Longitude', '<f8', 24), ('Height', '<f8', 32),
+    ('Undulation', '<f4', 40), ('Vn', '<f4', 44), ('Ve', '<f4', 48), ('Vu', '<f4', 52), ('COG', '<f4', 56),
+    ('RxClkBias', '<f8', 60), ('RxClkDrift', '<f4', 68),
+    ('TimeSystem', 'u1', 72), ('Datum', 'u1', 73), ('NrSV', 'u1', 74), ('WACorrInfo', 'u1', 75),
+    ('ReferenceID', '<u2', 76), ('MeanCorrAge', '<u2', 78), ('SignalInfo', '<u4', 80),
+    ('AlertFlag', 'u1', 84), ('NrBases', 'u1', 85), ('PPPInfo', '<u2', 86),
+    ('Latency', '<u2', 88), ('HAccuracy', '<u2', 90), ('VAccuracy', '<u2', 92), ('Misc', 'u1', 94)]
+
+# ReceiverStatus revision 2, followed by N AGCState sub-blocks of SBLength bytes
+lstReceiverStatus2 = lstSBFHeader + [
+    ('CPULoad', 'u1', 14), ('ExtError', 'u1', 15), ('UpTime', '<u4', 16), ('RxState', '<u4', 20), ('RxError', '<u4', 24),
+    ('N', 'u1', 28), ('SBLength', 'u1', 29), ('CmdCount', 'u1', 30), ('Temperature', 'u1', 31)]
+lstAGCState = [('FrontendID', 'u1', 0), ('Gain', 'i1', 1), ('SampleVar', 'u1', 2), ('BlankingStat', 'u1', 3)]
+
+
+def crcTable() -> np.ndarray:
+    """
+    returns the lookup table for the CRC-CCITT (polynomial 0x1021) used by SBF
+    """
+    table = np.zeros(256, dtype=np.uint16)
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table[i] = crc & 0xFFFF
+
+    return table
+
+
+CRCTABLE = crcTable()
+
+
+def crcBlocks(blocks: np.ndarray) -> np.ndarray:
+    """
+    computes the CRC over ID, Length and body of equally long SBF blocks, vectorised over the blocks (rows)
+    """
+    crc = np.zeros(blocks.shape[0], dtype=np.uint16)
+    for j in range(4, blocks.shape[1]):
+        crc = (crc << 8) ^ CRCTABLE[(crc >> 8) ^ blocks[:, j]]
+
+    return crc
+
+
+def blockDtype(lstFields: list, length: int) -> np.dtype:
+    """
+    returns the structured (little endian) dtype for decoding an SBF block of length bytes
+    """
+    return np.dtype({'names': [f[0] for f in lstFields], 'formats': [f[1] for f in lstFields], 'offsets': [f[2] for f in lstFields], 'itemsize': length})
+
+
+def findSync(buf: np.ndarray) -> np.ndarray:
+    """
+    returns the positions of all SBF sync patterns in the buffer
+    """
+    lstPos = []
+    for start in range(0, max(len(buf) - 1, 0), SYNCSEARCHSIZE):
+        part = buf[start:start + SYNCSEARCHSIZE + 1]
+        lstPos.append(np.flatnonzero((part[:-1] == SBF_SYNC[0]) & (part[1:] == SBF_SYNC[1])) + start)
+
+    return np.concatenate(lstPos) if lstPos else np.zeros(0, dtype=np.int64)
+
+
+def extractBlocks(buf: np.ndarray, blockNr: int, minRevision: int) -> list:
+    """
+    returns the CRC-checked SBF blocks with number blockNr as list of 2D uint8 arrays, one per block length
+    """
+    pos = findSync(buf)
+    pos = pos[pos + SBF_HEADERLENGTH <= len(buf)]
+
+    # header fields of all candidate blocks
+    ids = buf[pos + 4].astype(np.uint16) | (buf[pos + 5].astype(np.uint16) << 8)
+    lengths = (buf[pos + 6].astype(np.int64) | (buf[pos + 7].astype(np.int64) << 8))
+    crcs = buf[pos + 2].astype(np.uint16) | (buf[pos + 3].astype(np.uint16) << 8)
+
+    keep = ((ids & 0x1FFF) == blockNr) & ((ids >> 13) >= minRevision) & (lengths >= SBF_HEADERLENGTH + 6) & (lengths % 4 == 0) & (pos + lengths <= len(buf))
+    pos, lengths, crcs = pos[keep], lengths[keep], crcs[keep]
+
+    # the blocks of a length are copied from a strided view on buf, without an index array per byte
+    lstBlocks = []
+    for length in np.unique(lengths):
+        idx = np.flatnonzero(lengths == length)
+        blocks = np.lib.stride_tricks.sliding_window_view(buf, length)[pos[idx]]
+        valid = crcBlocks(blocks) == crcs[idx]
+        if valid.any():
+            lstBlocks.append((pos[idx[valid]], blocks[valid]))
+
+    return lstBlocks
+
+
+def decodeBlocks(lstBlocks: list, lstFields: list) -> dict:
+    """
+    decodes the fields of the blocks (grouped per length) into arrays, ordered on position in the file
+    """
+    lstPos = []
+    dFields = {name: [] for name, _, _ in lstFields}
+    for pos, blocks in lstBlocks:
+        recs = blocks.view(blockDtype(lstFields, blocks.shape[1]))[:, 0]
+        lstPos.append(pos)
+        for name in dFields:
+            dFields[name].append(recs[name])
+
+    if not lstPos:
+        return {name: np.zeros(0, dtype=fmt) for name, fmt, _ in lstFields}
+
+    order = np.argsort(np.concatenate(lstPos), kind='stable')
+
+    return {name: np.concatenate(lstArrays)[order] for name, lstArrays in dFields.items()}
+
+
+def floatDNU(values: np.ndarray, dtype: str = 'float64') -> np.ndarray:
+    """
+    converts an SBF float field to dtype with the do-not-use values replaced by NaN
+    """
+    dnu = values == values.dtype.type(SBF_DONOTUSE_FLOAT)
+    values = values.astype(dtype)
+    values[dnu] = np.nan
+
+    return values
+
+
+def scaledDNU(values: np.ndarray, scale: float) -> np.ndarray:
+    """
+    converts a scaled unsigned SBF field to float32 with the do-not-use values replaced by NaN
+    """
+    scaled = (values * scale).astype(np.float32)
+    scaled[values == SBF_DONOTUSE_U2] = np.nan
+
+    return scaled
+
+
+def decodePVTGeodetic(buf: np.ndarray) -> pd.DataFrame:
+    """
+    decodes the PVTGeodetic (v2) blocks into the dataframe also obtained by reading the sbf2stf PVTGeodetic_2 file
+    """
+    recs = decodeBlocks(extractBlocks(buf, SBF_PVTGEODETIC, minRevision=2), lstPVTGeodetic2)
+
+    dColumns = {}
+    dColumns['TOW[s]'] = recs['TOW'] / 1000.
+    dColumns['WNc[week]'] = recs['WNc']
+    dColumns['Type'] = recs['Mode'] & 0x0F
+    dColumns['Error'] = recs['Error']
+    dColumns['Mode'] = recs['Mode']
+    dColumns['2D/3D'] = (recs['Mode'] >> 7) & 0x01
+    dColumns['Latitude[rad]'] = floatDNU(recs['Latitude'])
+    dColumns['Longitude[rad]'] = floatDNU(recs['Longitude'])
+    dColumns['Height[m]'] = floatDNU(recs['Height'])
+    for field in ['Undulation[m]', 'Vn[m/s]', 'Ve[m/s]', 'Vu[m/s]', 'COG[deg]', 'RxClkDrift[ppm]']:
+        dColumns[field] = floatDNU(recs[field.split('[')[0]], dtype='float32')
+    dColumns['RxClkBias[ms]'] = floatDNU(recs['RxClkBias'])
+    for field in ['TimeSystem', 'Datum', 'NrSV', 'WACorrInfo', 'ReferenceID']:
+        dColumns[field] = recs[field]
+    dColumns['MeanCorrAge[s]'] = scaledDNU(recs['MeanCorrAge'], 0.01)
+    for field in ['SignalInfo', 'AlertFlag', 'NrBases', 'PPPInfo']:
+        dColumns[field] = recs[field]
+    dColumns['Latency[s]'] = scaledDNU(recs['Latency'], 0.0001)
+    dColumns['HAccuracy[m]'] = scaledDNU(recs['HAccuracy'], 0.01)
+    dColumns['VAccuracy[m]'] = scaledDNU(recs['VAccuracy'], 0.01)
+    dColumns['Misc'] = recs['Misc']
+
+    # same column order and types as the STF file read with the schema
+    df = pd.DataFrame(dColumns)[list(stf_schema.dPVTGeodetic2)]
+
+    return df.astype(stf_schema.dPVTGeodetic2)
+
+
+def decodeReceiverStatus(buf: np.ndarray) -> pd.DataFrame:
+    """
+    decodes the ReceiverStatus (v2) blocks into the long format dataframe (one row per AGCState) also obtained by reading the sbf2stf ReceiverStatus_2 file
+    """
+    lstFrames = []
+    for pos, blocks in extractBlocks(buf, SBF_RECEIVERSTATUS, minRevision=2):
+        recs = blocks.view(blockDtype(lstReceiverStatus2, blocks.shape[1]))[:, 0]
+
+        # blocks of equal length may still differ in number or size of the sub-blocks
+        for (nrSB, sbLength) in set(zip(recs['N'].tolist(), recs['SBLength'].tolist())):
+            sel = np.flatnonzero((recs['N'] == nrSB) & (recs['SBLength'] == sbLength))
+            if nrSB == 0 or 32 + nrSB * sbLength > blocks.shape[1]:
+                continue
+
+            agc = blocks[sel, 32:32 + nrSB * sbLength].reshape(-1, sbLength).copy().view(blockDtype(lstAGCState, sbLength))[:, 0]
+
+            dColumns = {}
+            dColumns['pos'] = np.repeat(pos[sel], nrSB)
+            dColumns['sb'] = np.tile(np.arange(nrSB), len(sel))
+            dColumns['TOW[s]'] = np.repeat(recs['TOW'][sel] / 1000., nrSB)
+            dColumns['WNc[week]'] = np.repeat(recs['WNc'][sel], nrSB)
+            dColumns['CPULoad[%]'] = np.repeat(recs['CPULoad'][sel], nrSB)
+            dColumns['UpTime[s]'] = np.repeat(recs['UpTime'][sel], nrSB)
+            dColumns['RxStatus'] = np.repeat(recs['RxState'][sel], nrSB)
+            dColumns['RxError'] = np.repeat(recs['RxError'][sel], nrSB)
+            dColumns['Antenna'] = agc['FrontendID'] >> 5
+            dColumns['SampleVar'] = agc['SampleVar']
+            dColumns['Blanking[%]'] = agc['BlankingStat']
+            dColumns['FrontEnd'] = agc['FrontendID'] & 0x1F
+            dColumns['AGCGain[dB]'] = np.where(agc['Gain'] == SBF_DONOTUSE_I1, np.nan, agc['Gain'])
+            lstFrames.append(pd.DataFrame(dColumns))
+
+    if not lstFrames:
+        return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in stf_schema.dReceiverStatus2.items()})
+
+    df = pd.concat(lstFrames, ignore_index=True).sort_values(['pos', 'sb'], kind='mergesort')
+    df = df[list(stf_schema.dReceiverStatus2)].reset_index(drop=True)
+
+    return df.astype(stf_schema.dReceiverStatus2)
+
+
+# decoders per SBF block number
+dDecoders = {
+    SBF_PVTGEODETIC: decodePVTGeodetic,
+    SBF_RECEIVERSTATUS: decodeReceiverStatus,
+}
+
+# name of the STF file created by sbf2stf per SBF block number
+dSTFNames = {
+    SBF_PVTGEODETIC: 'PVTGeodetic_2',
+    SBF_RECEIVERSTATUS: 'ReceiverStatus_2',
+}
+
+
+def isSBF(fileName: str) -> bool:
+    """
+    checks whether fileName is an SBF file based on its extension (.sbf or the RINEX-like .yy_)
+    """
+    ext = os.path.splitext(fileName)[1].lower()
+    return ext == '.sbf' or (len(ext) == 4 and ext[1:3].isdigit() and ext[3] == '_')
+
+
+def stfName(sbfFile: str, blockNr: int) -> str:
+    """
+    returns the name sbf2stf would give to the STF file of block blockNr extracted from sbfFile
+    """
+    return '{sbf:s}_{name:s}.stf'.format(sbf=sbfFile, name=dSTFNames[blockNr])
+
+
+def readSBF(sbfFile: str, blockNr: int, logger: logging.Logger, usecols: list = None) -> pd.DataFrame:
+    """
+    decodes the SBF blocks blockNr from sbfFile into the dataframe obtained from the sbf2stf file, without the text round-trip
+
+    When usecols is given, only these columns are returned.
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    if blockNr not in dDecoders:
+        logger.error('{func:s}: no SBF decoder available for block {nr:d}'.format(nr=blockNr, func=cFuncName))
+        sys.exit(amc.E_FAILURE)
+
+    logger.info('{func:s}: decoding SBF file {file:s}'.format(file=sbfFile, func=cFuncName))
+    buf = np.memmap(sbfFile, dtype=np.uint8, mode='r') if os.path.getsize(sbfFile) > 0 else np.zeros(0, dtype=np.uint8)
+    df = dDecoders[blockNr](buf)
+    if usecols is not None:
+        df = df[[col for col in df.columns if col in usecols]]
+    logger.info('{func:s}: decoded {nr:d} rows from {file:s}'.format(nr=df.shape[0], file=sbfFile, func=cFuncName))
+
+    return df
@@ -0,0 +1,175 @@
+import numpy as np
+import pandas as pd
+
+from GNSS import gpstime
+
+__author__ = 'amuls'
+
+
+def bucketCodes(df: pd.DataFrame, binSeconds: int, keyCols: list = ()) -> tuple:
+    """
+    returns for each row the code of its time bucket of binSeconds integer GPS seconds (and key values), and the bucket start and key values of each code
+
+    The codes are assigned by hashing in order of first appearance, so rows sorted in time give non decreasing codes when no key columns are used.
+    """
+    buckets = (df['WNc[week]'].to_numpy(dtype=np.int64) * gpstime.SECSINWEEK + np.floor(df['TOW[s]'].to_numpy(dtype=float)).astype(np.int64)) // binSeconds
+
+    # combine the bucket and the codes of the key columns into one code per row
+    rawCodes = buckets
+    lstKeys = []
+    for col in keyCols:
+        keyCodes, uniques = pd.factorize(df[col])
+        rawCodes = rawCodes * max(len(uniques), 1) + keyCodes
+        lstKeys.append(uniques)
+    codes, uniqueCodes = pd.factorize(rawCodes)
+
+    # get back the bucket and key values of each code
+    dfCodes = pd.DataFrame(index=pd.RangeIndex(len(uniqueCodes)))
+    for col, uniques in reversed(list(zip(keyCols, lstKeys))):
+        uniqueCodes, keyCodes = np.divmod(uniqueCodes, max(len(uniques), 1))
+        dfCodes[col] = uniques[keyCodes]
+    dfCodes.insert(0, 'bucket', uniqueCodes * binSeconds)
+
+    return codes, dfCodes
+
+
+def extremes(codes: np.ndarray, nrCodes: int, values: np.ndarray) -> tuple:
+    """
+    returns the minimum and maximum of the values per code, using reduceat over the runs of equal codes when these are non decreasing
+    """
+    mins = np.full(nrCodes, np.nan)
+    maxs = np.full(nrCodes, np.nan)
+    if codes.size == 0:
+        return mins, maxs
+
+    if np.all(codes[1:] >= codes[:-1]):
+        starts = np.flatnonzero(np.diff(codes, prepend=-1))
+        mins[codes[starts]] = np.minimum.reduceat(values, starts)
+        maxs[codes[starts]] = np.maximum.reduceat(values, starts)
+    else:
+        mins[:], maxs[:] = np.inf, -np.inf
+        np.minimum.at(mins, codes, values)
+        np.maximum.at(maxs, codes, values)
+        empty = np.bincount(codes, minlength=nrCodes) == 0
+        mins[empty] = maxs[empty] = np.nan
+
+    return mins, maxs
+
+
+def aggregate(df: pd.DataFrame, binSeconds: int, valueCols: list, modeCols: list, keyCols: list = ()) -> dict:
+    """
+    returns the partial aggregation of (a chunk of) df per time bucket (and key values): the number of epochs, and per value column the count, mean, co-moment, minimum and maximum of its (non NaN) values and per mode column the count of each value
+
+    The partial aggregations of consecutive chunks are combined by mergePartials.
+    """
+    codes, dfPart = bucketCodes(df, binSeconds=binSeconds, keyCols=keyCols)
+    nrCodes = dfPart.shape[0]
+    dfPart['epochs'] = np.bincount(codes, minlength=nrCodes)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for col in valueCols:
+            values = df[col].to_numpy(dtype=float, na_value=np.nan)
+            valid = ~np.isnan(values)
+            validCodes, values = codes[valid], values[valid]
+
+            dfPart[col + '.n'] = np.bincount(validCodes, minlength=nrCodes)
+            dfPart[col + '.mean'] = np.bincount(validCodes, weights=values, minlength=nrCodes) / dfPart[col + '.n'].to_numpy()
+            dfPart[col + '.M2'] = np.bincount(validCodes, weights=(values - dfPart[col + '.mean'].to_numpy()[validCodes]) ** 2, minlength=nrCodes)
+            dfPart[col + '.min'], dfPart[col + '.max'] = extremes(validCodes, nrCodes, values)
+
+    # count of each value of the mode columns per code, in long format
+    lstModes = []
+    for col in modeCols:
+        valueCodes, uniques = pd.factorize(df[col])
+        valid = valueCodes >= 0
+        counts = np.bincount(codes[valid] * len(uniques) + valueCodes[valid], minlength=nrCodes * len(uniques))
+        idx = np.flatnonzero(counts)
+        dfMode = dfPart.iloc[idx // len(uniques)][['bucket'] + list(keyCols)].reset_index(drop=True)
+        dfMode['column'] = col
+        dfMode['value'] = uniques[idx % len(uniques)]
+        dfMode['count'] = counts[idx]
+        lstModes.append(dfMode)
+
+    return {'values': dfPart, 'modes': pd.concat(lstModes, ignore_index=True) if lstModes else None}
+
+
+def mergePartials(lstPartials: list, valueCols: list, keyCols: list = ()) -> dict:
+    """
+    combines the partial aggregations (e.g. of consecutive chunks) into one, merging the buckets present in more than one of them
+    """
+    if len(lstPartials) == 1:
+        return lstPartials[0]
+
+    dfAll = pd.concat([dPartial['values'] for dPartial in lstPartials], ignore_index=True)
+    groups = dfAll.groupby(['bucket'] + list(keyCols), sort=True)
+    codes = groups.ngroup().to_numpy()
+    order = np.argsort(codes, kind='stable')
+    dfAll, codes = dfAll.iloc[order].reset_index(drop=True), codes[order]
+    nrCodes = groups.ngroups
+
+    starts = np.flatnonzero(np.diff(codes, prepend=-1))
+    dfPart = dfAll.iloc[starts][['bucket'] + list(keyCols)].reset_index(drop=True)
+    dfPart['epochs'] = np.bincount(codes, weights=dfAll['epochs'].to_numpy(), minlength=nrCodes).astype(np.int64)
+
+    # combine means and co-moments with Chan's parallel formula
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for col in valueCols:
+            n, mean, M2 = (dfAll[col + stat].to_numpy(dtype=float) for stat in ['.n', '.mean', '.M2'])
+            dfPart[col + '.n'] = np.bincount(codes, weights=n, minlength=nrCodes).astype(np.int64)
+            dfPart[col + '.mean'] = np.bincount(codes, weights=np.where(n > 0, n * mean, 0.), minlength=nrCodes) / dfPart[col + '.n'].to_numpy()
+            dfPart[col + '.M2'] = np.bincount(codes, weights=np.where(n > 0, M2 + n * (mean - dfPart[col + '.mean'].to_numpy()[codes]) ** 2, 0.), minlength=nrCodes)
+            dfPart[col + '.min'] = np.fmin.reduceat(dfAll[col + '.min'].to_numpy(), starts)
+            dfPart[col + '.max'] = np.fmax.reduceat(dfAll[col + '.max'].to_numpy(), starts)
+
+    dfModes = None
+    lstModes = [dPartial['modes'] for dPartial in lstPartials if dPartial['modes'] is not None]
+    if lstModes:
+        dfModes = pd.concat(lstModes, ignore_index=True).groupby(['bucket'] + list(keyCols) + ['column', 'value'], sort=False)['count'].sum().reset_index()
+
+    return {'values': dfPart, 'modes': dfModes}
+
+
+def finalize(dPartial: dict, valueCols: list, modeCols: list, keyCols: list = ()) -> pd.DataFrame:
+    """
+    returns the aggregated frame of the partial aggregation, a row per time bucket (and key values) with its start time, number of epochs, mean, std, min and max of the value columns and most common value of the mode columns
+
+    The mean of a value column keeps the name of the column, so that the aggregated frame can be plotted as the frame of the epochs.
+    """
+    dfPart = dPartial['values']
+
+    dfAgg = pd.DataFrame({'WNc[week]': dfPart['bucket'].to_numpy() // gpstime.SECSINWEEK, 'TOW[s]': (dfPart['bucket'].to_numpy() % gpstime.SECSINWEEK).astype(float)})
+    dfAgg.insert(0, 'time', gpstime.UTCFromWTArray(dfAgg['WNc[week]'].to_numpy(), dfAgg['TOW[s]'].to_numpy()))
+    for col in keyCols:
+        dfAgg[col] = dfPart[col].to_numpy()
+    dfAgg['epochs'] = dfPart['epochs'].to_numpy()
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for col in valueCols:
+            n = dfPart[col + '.n'].to_numpy()
+            dfAgg[col] = dfPart[col + '.mean'].to_numpy()
+            dfAgg[col + '.std'] = np.where(n > 1, np.sqrt(dfPart[col + '.M2'].to_numpy() / (n - 1)), np.nan)
+            dfAgg[col + '.min'] = dfPart[col + '.min'].to_numpy()
+            dfAgg[col + '.max'] = dfPart[col + '.max'].to_numpy()
+
+    # the most common value, the smallest one on a tie
+    if dPartial['modes'] is not None:
+        dfModes = dPartial['modes'].sort_values(['count', 'value'], ascending=[False, True], kind='stable').drop_duplicates(['bucket'] + list(keyCols) + ['column'])
+        for col in modeCols:
+            dfMode = dfModes[dfModes['column'] == col].set_index(['bucket'] + list(keyCols))['value']
+            dfAgg[col] = dfMode.reindex(pd.MultiIndex.from_frame(dfPart[['bucket'] + list(keyCols)]) if keyCols else dfPart['bucket']).to_numpy()
+
+    # sort on time (and key values)
+    dfAgg['bucket'] = dfPart['bucket'].to_numpy()
+    dfAgg = dfAgg.sort_values(['bucket'] + list(keyCols), kind='stable').drop(columns='bucket').reset_index(drop=True)
+
+    return dfAgg
+
+
+def aggregateFrame(df: pd.DataFrame, binSeconds: int, valueCols: list, modeCols: list, keyCols: list = ()) -> pd.DataFrame:
+    """
+    returns the aggregation of df per time bucket of binSeconds integer GPS seconds (and key values), only using the value and mode columns present in df
+    """
+    valueCols = [col for col in valueCols if col in df.columns]
+    modeCols = [col for col in modeCols if col in df.columns]
+
+    return finalize(aggregate(df, binSeconds=binSeconds, valueCols=valueCols, modeCols=modeCols, keyCols=keyCols), valueCols=valueCols, modeCols=modeCols, keyCols=keyCols)
@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+from termcolor import colored
+
+from STF import stf_schema
+from STF import sbf_decoder
+
+__author__ = 'amuls'
+
+CACHEDIR = '.stfcache'  # created in the directory of the STF file
+CACHEINDEX = 'index.json'
+CACHEMAXBYTES = 2 * 1024 ** 3  # total size of the cached files before the least recently used are evicted
+CACHEVERSION = 1  # increase when the layout of the cached data changes
+HASHBLOCKSIZE = 1024 * 1024
+
+
+def cacheDir(stfFile: str) -> str:
+    """
+    returns the cache directory used for stfFile
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(stfFile)), CACHEDIR)
+
+
+def contentHash(stfFile: str) -> str:
+    """
+    returns the hash of the content of stfFile
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(stfFile, 'rb') as fd:
+        for block in iter(lambda: fd.read(HASHBLOCKSIZE), b''):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+def readIndex(dirCache: str) -> dict:
+    """
+    reads the index mapping the STF file identity (path, size, mtime) to its content hash
+    """
+    try:
+        with open(os.path.join(dirCache, CACHEINDEX), 'r') as fd:
+            return json.load(fd)
+    except (OSError, ValueError):
+        return {}
+
+
+def writeIndex(dirCache: str, dIndex: dict):
+    """
+    writes the index atomically so that concurrent runs never see a partial file
+    """
+    tmpName = os.path.join(dirCache, '{idx:s}.{pid:d}'.format(idx=CACHEINDEX, pid=os.getpid()))
+    with open(tmpName, 'w') as fd:
+        json.dump(dIndex, fd)
+    os.replace(tmpName, os.path.join(dirCache, CACHEINDEX))
+
+
+def cacheKey(stfFile: str, dSchema: dict, sbfBlock: int = None, usecols: list = None) -> str:
+    """
+    returns the cache key of stfFile, based on its path, size, mtime and content hash and on the schema, SBF block and columns used for reading
+
+    The content hash is only recomputed when path, size or mtime differ from the indexed values.
+    """
+    dirCache = cacheDir(stfFile)
+    stat = os.stat(stfFile)
+    path = os.path.abspath(stfFile)
+
+    dIndex = readIndex(dirCache)
+    dEntry = dIndex.get(path, {})
+    if dEntry.get('size') != stat.st_size or dEntry.get('mtime') != stat.st_mtime_ns:
+        dEntry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': contentHash(stfFile)}
+        dIndex[path] = dEntry
+        os.makedirs(dirCache, exist_ok=True)
+        writeIndex(dirCache, dIndex)
+
+    h = hashlib.blake2b(digest_size=8)
+    h.update('{ver:d} {hash:s} {schema!s} {sbf!s} {cols!s}'.format(ver=CACHEVERSION, hash=dEntry['hash'], schema=sorted(dSchema.items()), sbf=sbfBlock, cols=usecols).encode())
+
+    return h.hexdigest()
+
+
+def cacheName(stfFile: str, key: str) -> str:
+    """
+    returns the name of the cache file for stfFile
+    """
+    return os.path.join(cacheDir(stfFile), '{base:s}-{key:s}.npz'.format(base=os.path.basename(stfFile), key=key))
+
+
+def storeCached(cacheFile: str, df: pd.DataFrame) -> bool:
+    """
+    stores the columns of df as numpy arrays in cacheFile, nullable integer columns are stored with their mask
+    """
+    dArrays = {'columns': np.array(df.columns, dtype=str), 'dtypes': np.array([df[col].dtype.name for col in df.columns], dtype=str)}
+    for i, col in enumerate(df.columns):
+        if df[col].dtype.kind not in 'biuf':
+            return False
+        if isinstance(df[col].dtype, pd.api.extensions.ExtensionDtype):
+            dArrays['m{:d}'.format(i)] = df[col].isna().to_numpy()
+            dArrays['c{:d}'.format(i)] = df[col].fillna(0).to_numpy(dtype=df[col].dtype.numpy_dtype)
+        else:
+            dArrays['c{:d}'.format(i)] = df[col].to_numpy()
+
+    tmpName = '{name:s}.{pid:d}'.format(name=cacheFile, pid=os.getpid())
+    with open(tmpName, 'wb') as fd:
+        np.savez(fd, **dArrays)
+    os.replace(tmpName, cacheFile)
+
+    return True
+
+
+def loadCached(cacheFile: str) -> pd.DataFrame:
+    """
+    loads the dataframe stored by storeCached
+    """
+    with np.load(cacheFile, allow_pickle=False) as npz:
+        dColumns = {}
+        for i, (col, dtype) in enumerate(zip(npz['columns'], npz['dtypes'])):
+            data = npz['c{:d}'.format(i)]
+            if 'm{:d}'.format(i) in npz.files:
+                dColumns[col] = pd.arrays.IntegerArray(data, npz['m{:d}'.format(i)])
+            else:
+                dColumns[col] = data
+
+    # refresh modification time for least recently used eviction, only a hint so a read-only cache is fine
+    try:
+        os.utime(cacheFile)
+    except OSError:
+        pass
+
+    return pd.DataFrame(dColumns)
+
+
+def evictCache(dirCache: str, maxBytes: int, logger: logging.Logger):
+    """
+    removes the least recently used cache files until their total size is below maxBytes
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    lstCached = []
+    for entry in os.scandir(dirCache):
+        if entry.name.endswith('.npz'):
+            stat = entry.stat()
+            lstCached.append((stat.st_mtime, stat.st_size, entry.path))
+
+    totalBytes = sum(size for _, size, _ in lstCached)
+    for _, size, path in sorted(lstCached):
+        if totalBytes <= maxBytes:
+            break
+        logger.info('{func:s}: evicting cache file {file:s}'.format(file=path, func=cFuncName))
+        os.remove(path)
+        totalBytes -= size
+
+
+def parseSTF(stfFile: str, dSchema: dict, logger: logging.Logger, sbfBlock: int = None, usecols: list = None) -> pd.DataFrame:
+    """
+    parses the columns usecols (default all) of the STF file with the schema, or decodes block sbfBlock when stfFile is an SBF file
+    """
+    if sbfBlock is not None and sbf_decoder.isSBF(stfFile):
+        return sbf_decoder.readSBF(stfFile, blockNr=sbfBlock, logger=logger, usecols=usecols)
+
+    return stf_schema.readSTFTyped(stfFile, dSchema=dSchema, usecols=usecols)
+
+
+def readSTFCached(stfFile: str, dSchema: dict, logger: logging.Logger, useCache: bool = True, sbfBlock: int = None, usecols: list = None) -> pd.DataFrame:
+    """
+    returns the typed dataframe of stfFile from the cache when available, else parses stfFile and caches the result
+
+    When sbfBlock is given and stfFile is an SBF file, the block is decoded directly from the SBF file.
+    When usecols is given, only these columns are parsed (and cached).
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    if not useCache:
+        return parseSTF(stfFile, dSchema=dSchema, logger=logger, sbfBlock=sbfBlock, usecols=usecols)
+
+    try:
+        cacheFile = cacheName(stfFile, cacheKey(stfFile, dSchema, sbfBlock=sbfBlock, usecols=usecols))
+    except OSError as e:
+        logger.warning('{func:s}: cache not available for {file:s}: {err!s}'.format(file=stfFile, err=e, func=cFuncName))
+        return parseSTF(stfFile, dSchema=dSchema, logger=logger, sbfBlock=sbfBlock, usecols=usecols)
+
+    if os.path.isfile(cacheFile):
+        logger.info('{func:s}: loading {file:s} from cache {cache:s}'.format(file=stfFile, cache=cacheFile, func=cFuncName))
+        return loadCached(cacheFile)
+
+    dfSTF = parseSTF(stfFile, dSchema=dSchema, logger=logger, sbfBlock=sbfBlock, usecols=usecols)
+
+    try:
+        if storeCached(cacheFile, dfSTF):
+            logger.info('{func:s}: cached {file:s} as {cache:s}'.format(file=stfFile, cache=cacheFile, func=cFuncName))
+            evictCache(cacheDir(stfFile), maxBytes=CACHEMAXBYTES, logger=logger)
+    except OSError as e:
+        logger.warning('{func:s}: could not cache {file:s}: {err!s}'.format(file=stfFile, err=e, func=cFuncName))
+
+    return dfSTF
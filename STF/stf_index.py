@@ -0,0 +1,192 @@
+import os
+import sys
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+from termcolor import colored
+
+import am_config as amc
+from GNSS import gpstime
+from STF import stf_schema
+from STF import stf_cache
+from STF import sbf_decoder
+
+__author__ = 'amuls'
+
+INDEXSTRIDE = 1000  # number of data lines between two indexed lines
+INDEXVERSION = 1  # increase when the layout of the index changes
+SCANBLOCKSIZE = 64 * 1024 * 1024  # bytes scanned at once for line ends
+FIELDBYTES = 64  # bytes read at an indexed line to decode its TOW and WNc
+
+
+def indexName(stfFile: str) -> str:
+    """
+    returns the name of the index sidecar of stfFile, kept in the cache directory (without .npz extension so it is never evicted)
+    """
+    return os.path.join(stf_cache.cacheDir(stfFile), '{base:s}.idx'.format(base=os.path.basename(stfFile)))
+
+
+def gpsSecondsFromTime(dt: str) -> float:
+    """
+    returns the seconds since the GPS epoch of date/time dt (e.g. 2019-01-01T10:00:00) expressed in the time scale of the time column
+    """
+    return (np.datetime64(dt, 'ns') - gpstime.GPSEPOCH64).astype(np.int64) / gpstime.NSECSINSEC
+
+
+def buildIndex(stfFile: str, stride: int = INDEXSTRIDE) -> dict:
+    """
+    scans stfFile for its line ends and returns the byte offset and GPS seconds (WNc * 604800 + TOW) of every stride-th data line
+    """
+    stat = os.stat(stfFile)
+    offset = stf_schema.dataOffset(stfFile)
+    buf = np.memmap(stfFile, dtype=np.uint8, mode='r') if stat.st_size > 0 else np.zeros(0, dtype=np.uint8)
+
+    # the line starts are the first data line and the bytes following a line end
+    lstOffsets = [np.array([offset], dtype=np.int64)]
+    nrLines = 1
+    for start in range(offset, stat.st_size, SCANBLOCKSIZE):
+        lineStarts = np.flatnonzero(buf[start:start + SCANBLOCKSIZE] == 0x0A) + start + 1
+        lineStarts = lineStarts[lineStarts < stat.st_size]
+        lstOffsets.append(lineStarts[(np.arange(nrLines, nrLines + lineStarts.size) % stride) == 0])
+        nrLines += lineStarts.size
+    offsets = np.concatenate(lstOffsets)
+
+    # decode TOW and WNc, the first 2 fields of the indexed lines
+    gpsSecs = np.full(offsets.size, np.nan)
+    for i, offset in enumerate(offsets):
+        fields = bytes(buf[offset:offset + FIELDBYTES]).split(b',')
+        try:
+            gpsSecs[i] = float(fields[1]) * gpstime.SECSINWEEK + float(fields[0])
+        except (IndexError, ValueError):
+            pass
+
+    # lines without time information can not be searched for
+    valid = ~np.isnan(gpsSecs)
+    valid[0] = True
+
+    dIndex = {}
+    dIndex['version'] = INDEXVERSION
+    dIndex['size'] = stat.st_size
+    dIndex['mtime'] = stat.st_mtime_ns
+    dIndex['stride'] = stride
+    dIndex['line'] = (np.arange(offsets.size) * stride)[valid]
+    dIndex['offset'] = offsets[valid]
+    dIndex['gpssec'] = np.fmax.accumulate(np.nan_to_num(gpsSecs[valid], nan=-np.inf))
+
+    return dIndex
+
+
+def loadIndex(stfFile: str, logger: logging.Logger) -> dict:
+    """
+    returns the index of stfFile, (re)building and storing it when it is missing or outdated
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    stat = os.stat(stfFile)
+    idxFile = indexName(stfFile)
+    try:
+        with np.load(idxFile, allow_pickle=False) as npz:
+            dIndex = {key: npz[key] for key in npz.files}
+        if dIndex['version'] == INDEXVERSION and dIndex['size'] == stat.st_size and dIndex['mtime'] == stat.st_mtime_ns:
+            return dIndex
+    except (OSError, ValueError, KeyError):
+        pass
+
+    logger.info('{func:s}: building index of {file:s}'.format(file=stfFile, func=cFuncName))
+    dIndex = buildIndex(stfFile)
+
+    try:
+        os.makedirs(stf_cache.cacheDir(stfFile), exist_ok=True)
+        tmpName = '{name:s}.{pid:d}'.format(name=idxFile, pid=os.getpid())
+        with open(tmpName, 'wb') as fd:
+            np.savez(fd, **dIndex)
+        os.replace(tmpName, idxFile)
+        logger.info('{func:s}: stored index of {nr:d} lines in {idx:s}'.format(nr=dIndex['offset'].size, idx=idxFile, func=cFuncName))
+    except OSError as e:
+        logger.warning('{func:s}: could not store index of {file:s}: {err!s}'.format(file=stfFile, err=e, func=cFuncName))
+
+    return dIndex
+
+
+def readSTFWindow(stfFile: str, dSchema: dict, start: str, end: str, logger: logging.Logger, usecols: list = None) -> pd.DataFrame:
+    """
+    reads the lines of the STF file between the date/times start and end (None for open ended) using the index to seek to them
+
+    The returned dataframe is indexed by the data line numbers, as when the whole file is read.
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    gpsStart = -np.inf if start is None else gpsSecondsFromTime(start)
+    gpsEnd = np.inf if end is None else gpsSecondsFromTime(end)
+
+    # start at the last indexed line before start, stop at the first indexed line after end
+    dIndex = loadIndex(stfFile, logger=logger)
+    i0 = max(np.searchsorted(dIndex['gpssec'], gpsStart, side='left') - 1, 0)
+    i1 = np.searchsorted(dIndex['gpssec'], gpsEnd, side='right')
+    offsetEnd = dIndex['offset'][i1] if i1 < dIndex['offset'].size else dIndex['size']
+
+    with open(stfFile, 'rb') as fd:
+        fd.seek(dIndex['offset'][i0])
+        data = fd.read(offsetEnd - dIndex['offset'][i0])
+    logger.info('{func:s}: reading {nr:d} bytes at offset {off:d} of {file:s}'.format(nr=len(data), off=dIndex['offset'][i0], file=stfFile, func=cFuncName))
+
+    # the time columns are needed for selecting the lines in the window
+    if usecols is not None:
+        usecols = list(usecols) + [col for col in ['TOW[s]', 'WNc[week]'] if col not in usecols]
+    dfSTF = stf_schema.readSTFLines(data, columns=stf_schema.readHeader(stfFile), dSchema=dSchema, usecols=usecols)
+    dfSTF.index = pd.RangeIndex(start=dIndex['line'][i0], stop=dIndex['line'][i0] + dfSTF.shape[0])
+
+    return selectTimeWindow(dfSTF, start=start, end=end)
+
+
+def selectTimeWindow(dfSTF: pd.DataFrame, start: str, end: str) -> pd.DataFrame:
+    """
+    returns the rows of the (e.g. decoded SBF) dataframe between the date/times start and end (None for open ended)
+    """
+    gpsSecs = dfSTF['WNc[week]'].to_numpy(dtype=float, na_value=np.nan) * gpstime.SECSINWEEK + dfSTF['TOW[s]'].to_numpy(dtype=float)
+    gpsStart = -np.inf if start is None else gpsSecondsFromTime(start)
+    gpsEnd = np.inf if end is None else gpsSecondsFromTime(end)
+
+    return dfSTF[(gpsSecs >= gpsStart) & (gpsSecs <= gpsEnd)]
+
+
+def readSTFRange(stfFile: str, dSchema: dict, logger: logging.Logger, start: str = None, end: str = None, useCache: bool = True, sbfBlock: int = None, usecols: list = None) -> pd.DataFrame:
+    """
+    reads the STF file (or decodes block sbfBlock of a SBF file), restricted to the epochs between the date/times start and end when given
+
+    A time window of a STF file is read by seeking to it using the index, a SBF file is decoded (or taken from the cache) and then restricted.
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    if start is None and end is None:
+        return stf_cache.readSTFCached(stfFile, dSchema=dSchema, logger=logger, useCache=useCache, sbfBlock=sbfBlock, usecols=usecols)
+
+    logger.info('{func:s}: reading {file:s} from {start!s} till {end!s}'.format(file=stfFile, start=start, end=end, func=cFuncName))
+    if sbfBlock is not None and sbf_decoder.isSBF(stfFile):
+        dfSTF = selectTimeWindow(stf_cache.readSTFCached(stfFile, dSchema=dSchema, logger=logger, useCache=useCache, sbfBlock=sbfBlock, usecols=usecols), start=start, end=end)
+    else:
+        dfSTF = readSTFWindow(stfFile, dSchema=dSchema, start=start, end=end, logger=logger, usecols=usecols)
+
+    if dfSTF.shape[0] == 0:
+        logger.error('{func:s}: no epochs found in {file:s} from {start!s} till {end!s}'.format(file=colored(stfFile, 'red'), start=start, end=end, func=cFuncName))
+        sys.exit(amc.E_FAILURE)
+
+    return dfSTF
+
+
+def main(argv):
+    """
+    builds the index of the STF files so that later time window reads do not have to scan them
+    """
+    parser = argparse.ArgumentParser(description=os.path.basename(__file__) + ' builds the index used for reading a time window of STF files')
+    parser.add_argument('files', help='STF files to index', nargs='+', type=str)
+    args = parser.parse_args(argv[1:])
+
+    logger = amc.createLoggers(os.path.basename(__file__), logLevels=['INFO', 'DEBUG'])
+    for stfFile in args.files:
+        loadIndex(stfFile, logger=logger)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
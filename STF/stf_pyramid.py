@@ -0,0 +1,148 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+import am_config as amc
+from GNSS import gpstime
+from STF import stf_aggregate
+from STF import stf_index
+
+__author__ = 'amuls'
+
+PYRAMIDLEVELS = (1, 10, 60, 600, 3600)  # bucket length in seconds of the levels, from fine to coarse
+PYRAMIDVERSION = 1  # increase when the layout of the stored pyramid changes
+PYRAMIDINFO = 'pyramid.json'
+PYRAMIDPIXELS = 1000  # default number of buckets asked for by a query
+
+
+def buildLevels(df: pd.DataFrame, valueCols: list, keyCols: list = (), levels: tuple = PYRAMIDLEVELS) -> dict:
+    """
+    returns per level the partial aggregation of (a chunk of) df in buckets of that many GPS seconds (and key values)
+
+    The levels of consecutive chunks are combined by mergeLevels.
+    """
+    return {level: stf_aggregate.aggregate(df, binSeconds=level, valueCols=valueCols, modeCols=[], keyCols=keyCols) for level in levels}
+
+
+def mergeLevels(lstLevels: list, valueCols: list, keyCols: list = ()) -> dict:
+    """
+    combines the levels of the chunks into the levels of all epochs
+    """
+    return {level: stf_aggregate.mergePartials([dLevels[level] for dLevels in lstLevels], valueCols=valueCols, keyCols=keyCols) for level in lstLevels[0]}
+
+
+def levelRecords(dPartial: dict, valueCols: list, keyCols: list = ()) -> np.ndarray:
+    """
+    returns the buckets of a level as a record array sorted on time (and key values): start in GPS seconds, key values, number of epochs and mean, std, min and max of the value columns
+    """
+    dfLevel = stf_aggregate.finalize(dPartial, valueCols=valueCols, modeCols=[], keyCols=keyCols)
+
+    lstFields = [('gpssec', np.int64)] + [(col, dfLevel[col].to_numpy().dtype) for col in keyCols] + [('epochs', np.int32)]
+    for col in valueCols:
+        lstFields += [(col, np.float64), (col + '.std', np.float32), (col + '.min', np.float64), (col + '.max', np.float64)]
+
+    records = np.empty(dfLevel.shape[0], dtype=lstFields)
+    records['gpssec'] = dfLevel['WNc[week]'].to_numpy(dtype=np.int64) * gpstime.SECSINWEEK + dfLevel['TOW[s]'].to_numpy().astype(np.int64)
+    for name, dtype in lstFields[1:]:
+        records[name] = dfLevel[name].to_numpy(dtype=dtype)
+
+    return records
+
+
+def storePyramid(pyramidDir: str, dLevels: dict, valueCols: list, keyCols: list = ()):
+    """
+    stores the levels in pyramidDir, each as a binary record file that is memory mapped by queryPyramid, with their description in PYRAMIDINFO
+    """
+    os.makedirs(pyramidDir, exist_ok=True)
+
+    dInfo = {'version': PYRAMIDVERSION, 'levels': sorted(dLevels), 'values': list(valueCols), 'keys': list(keyCols), 'rows': {}}
+    for level, dPartial in dLevels.items():
+        records = levelRecords(dPartial, valueCols=valueCols, keyCols=keyCols)
+        levelName = os.path.join(pyramidDir, '{sec:d}s.npy'.format(sec=level))
+        tmpName = '{name:s}.{pid:d}'.format(name=levelName, pid=os.getpid())
+        with open(tmpName, 'wb') as fd:
+            np.save(fd, records)
+        os.replace(tmpName, levelName)
+
+        dInfo['rows'][str(level)] = int(records.size)
+        if records.size > 0:
+            dInfo['start'], dInfo['end'] = int(records['gpssec'][0]), int(records['gpssec'][-1]) + level
+
+    infoName = os.path.join(pyramidDir, PYRAMIDINFO)
+    tmpName = '{name:s}.{pid:d}'.format(name=infoName, pid=os.getpid())
+    with open(tmpName, 'w') as fd:
+        json.dump(dInfo, fd, indent=1)
+    os.replace(tmpName, infoName)
+
+
+def loadInfo(pyramidDir: str) -> dict:
+    """
+    reads the description of the pyramid stored in pyramidDir
+    """
+    with open(os.path.join(pyramidDir, PYRAMIDINFO), 'r') as fd:
+        dInfo = json.load(fd)
+
+    if dInfo.get('version') != PYRAMIDVERSION:
+        raise ValueError('pyramid {dir:s} has version {ver!s}, expected {exp:d}'.format(dir=pyramidDir, ver=dInfo.get('version'), exp=PYRAMIDVERSION))
+
+    return dInfo
+
+
+def selectLevel(levels: list, seconds: float, pixels: int) -> int:
+    """
+    returns the finest level with at most pixels buckets over seconds, the coarsest level when none has
+    """
+    return next((level for level in sorted(levels) if seconds / level <= pixels), max(levels))
+
+
+def queryPyramid(pyramidDir: str, start: str = None, end: str = None, pixels: int = PYRAMIDPIXELS) -> tuple:
+    """
+    returns the level and the buckets of the finest level of the pyramid having at most pixels buckets between the date/times start and end (default its first and last epoch)
+
+    The level is memory mapped and the time range is found by binary search, so only the returned buckets are read whatever the length of the pyramid.
+    """
+    dInfo = loadInfo(pyramidDir)
+    if 'start' not in dInfo:
+        return dInfo['levels'][0], pd.DataFrame()
+
+    gpsStart = dInfo['start'] if start is None else stf_index.gpsSecondsFromTime(start)
+    gpsEnd = dInfo['end'] if end is None else stf_index.gpsSecondsFromTime(end)
+    level = selectLevel(dInfo['levels'], seconds=max(gpsEnd - gpsStart, 0), pixels=pixels)
+
+    records = np.load(os.path.join(pyramidDir, '{sec:d}s.npy'.format(sec=level)), mmap_mode='r')
+    gpsSecs = records['gpssec']
+    first = np.searchsorted(gpsSecs, np.floor(gpsStart / level) * level, side='left')
+    last = np.searchsorted(gpsSecs, gpsEnd, side='right')
+
+    dfLevel = pd.DataFrame(np.array(records[first:last]))
+    dfLevel.insert(0, 'time', gpstime.UTCFromWTArray(dfLevel['gpssec'].to_numpy() // gpstime.SECSINWEEK, (dfLevel['gpssec'].to_numpy() % gpstime.SECSINWEEK).astype(float)))
+
+    return level, dfLevel
+
+
+def main(argv):
+    """
+    queries a pyramid for the buckets of a time range to be plotted in a number of pixels
+    """
+    parser = argparse.ArgumentParser(description=os.path.basename(__file__) + ' returns the buckets of the level of a pyramid matching a time range and pixel width')
+    parser.add_argument('pyramid', help='directory of the pyramid', type=str)
+    parser.add_argument('--start', help='first date/time (e.g. 2019-02-14T03:00:00), default the start of the pyramid', required=False, default=None, type=str)
+    parser.add_argument('--end', help='last date/time (e.g. 2019-02-14T03:20:00), default the end of the pyramid', required=False, default=None, type=str)
+    parser.add_argument('--pixels', help='maximum number of buckets (default {:d})'.format(PYRAMIDPIXELS), required=False, default=PYRAMIDPIXELS, type=int)
+    parser.add_argument('-o', '--output', help='CSV file the buckets are saved in (default print them)', required=False, default=None, type=str)
+    args = parser.parse_args(argv[1:])
+
+    logger = amc.createLoggers(os.path.basename(__file__), logLevels=['INFO', 'DEBUG'])
+    level, dfLevel = queryPyramid(args.pyramid, start=args.start, end=args.end, pixels=args.pixels)
+    logger.info('{file:s}: {nr:d} buckets of level {sec:d}s'.format(file=args.pyramid, nr=dfLevel.shape[0], sec=level))
+    if args.output is not None:
+        dfLevel.to_csv(args.output)
+    else:
+        print(dfLevel.to_string())
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,265 @@
+import os
+import io
+import logging
+from concurrent import futures
+import numpy as np
+import pandas as pd
+from termcolor import colored
+
+__author__ = 'amuls'
+
+PARALLELMINBYTES = 256 * 1024 ** 2  # STF files from this size on are parsed in parallel by readSTFTyped
+PARALLELWORKERS = os.cpu_count()  # number of processes used for parsing in parallel, 1 disables parallel parsing
+
+# compact column types per STF block, based on the field types of the SBF blocks
+# lat/lon, height, TOW and the receiver clock bias need the precision of float64
+dPVTGeodetic2 = {
+    'TOW[s]': 'float64',
+    'WNc[week]': 'uint16',
+    'Type': 'uint8',
+    'Error': 'uint8',
+    'Mode': 'uint8',
+    '2D/3D': 'uint8',
+    'Latitude[rad]': 'float64',
+    'Longitude[rad]': 'float64',
+    'Height[m]': 'float64',
+    'Undulation[m]': 'float32',
+    'Vn[m/s]': 'float32',
+    'Ve[m/s]': 'float32',
+    'Vu[m/s]': 'float32',
+    'COG[deg]': 'float32',
+    'RxClkBias[ms]': 'float64',
+    'RxClkDrift[ppm]': 'float32',
+    'TimeSystem': 'uint8',
+    'Datum': 'uint8',
+    'NrSV': 'uint8',
+    'WACorrInfo': 'uint8',
+    'ReferenceID': 'uint16',
+    'MeanCorrAge[s]': 'float32',
+    'SignalInfo': 'uint32',
+    'AlertFlag': 'uint8',
+    'NrBases': 'uint8',
+    'PPPInfo': 'uint16',
+    'Latency[s]': 'float32',
+    'HAccuracy[m]': 'float32',
+    'VAccuracy[m]': 'float32',
+    'Misc': 'uint8',
+}
+
+dReceiverStatus2 = {
+    'TOW[s]': 'float64',
+    'WNc[week]': 'uint16',
+    'CPULoad[%]': 'uint8',
+    'UpTime[s]': 'uint32',
+    'RxStatus': 'uint32',
+    'RxError': 'uint32',
+    'Antenna': 'uint8',
+    'SampleVar': 'float32',
+    'Blanking[%]': 'float32',
+    'FrontEnd': 'uint8',
+    'AGCGain[dB]': 'float32',
+}
+
+
+def readHeader(stfFile: str) -> list:
+    """
+    returns the column names from the first line of the STF file
+    """
+    with open(stfFile, 'r') as fd:
+        return fd.readline().rstrip('\r\n').split(',')
+
+
+def dataOffset(stfFile: str) -> int:
+    """
+    returns the byte offset of the first data line of the STF file, after the header line and the units line (the row skipped by skiprows=range(1, 2) when reading)
+    """
+    with open(stfFile, 'rb') as fd:
+        fd.readline()
+        fd.readline()
+        return fd.tell()
+
+
+def nullableDtype(dtype: str) -> str:
+    """
+    returns the pandas nullable extension type for integer dtypes, so that empty fields can be read
+    """
+    if np.dtype(dtype).kind == 'u':
+        return 'UInt' + dtype[4:]
+    if np.dtype(dtype).kind == 'i':
+        return 'Int' + dtype[3:]
+    return dtype
+
+
+def readDtypes(dSchema: dict, columns: list, nullable: bool = False) -> dict:
+    """
+    returns the dtypes to pass to read_csv for the columns present in the STF file
+    """
+    if nullable:
+        return {col: nullableDtype(dSchema[col]) for col in columns if col in dSchema}
+    return {col: dSchema[col] for col in columns if col in dSchema}
+
+
+def compactDtypes(df: pd.DataFrame, dSchema: dict) -> pd.DataFrame:
+    """
+    converts the nullable integer columns to their numpy dtype once they contain no missing values anymore
+    """
+    for col in df.columns:
+        if col in dSchema and df[col].dtype.name != dSchema[col] and not df[col].hasnans:
+            df[col] = df[col].to_numpy(dtype=dSchema[col])
+
+    return df
+
+
+def readSTFChunks(stfFile: str, columns: list, dSchema: dict, chunksize: int, **kwargs):
+    """
+    generator yielding the typed chunks of the STF file, switching to nullable integer types from the chunk on where an integer field is empty
+    """
+    nrRows = 0
+    try:
+        for dfChunk in pd.read_csv(stfFile, sep=',', skiprows=range(1, 2), dtype=readDtypes(dSchema, columns), chunksize=chunksize, **kwargs):
+            nrRows += dfChunk.shape[0]
+            yield dfChunk
+        return
+    except ValueError:
+        pass
+
+    # restart after the rows already yielded and continue their numbering
+    for dfChunk in pd.read_csv(stfFile, sep=',', skiprows=range(1, 2 + nrRows), dtype=readDtypes(dSchema, columns, nullable=True), chunksize=chunksize, **kwargs):
+        dfChunk.index += nrRows
+        yield dfChunk
+
+
+def projectColumns(dOutputColumns: dict, lstOutputs: list) -> list:
+    """
+    returns the columns of the STF file needed by the requested outputs, None when an output needs all columns
+
+    dOutputColumns declares per output (csv, plots, ...) the columns it uses, None meaning all columns.
+    """
+    lstColumns = []
+    for output in lstOutputs:
+        if dOutputColumns[output] is None:
+            return None
+        lstColumns += [col for col in dOutputColumns[output] if col not in lstColumns]
+
+    return lstColumns
+
+
+def readSTFTyped(stfFile: str, dSchema: dict, chunksize: int = None, usecols: list = None, **kwargs):
+    """
+    reads the STF file with the compact column types of dSchema, columns not in dSchema are inferred by pandas
+
+    Integer columns are read as numpy integers. When the file contains empty integer fields, the file is read
+    with the pandas nullable integer types which compactDtypes converts back after dropping the incomplete rows.
+    When usecols is given, only these columns are parsed. When chunksize is given, a generator over the chunks is returned.
+    Large files are parsed in parallel by readSTFParallel.
+    """
+    columns = readHeader(stfFile)
+    if usecols is not None:
+        columns = [col for col in columns if col in usecols]
+        kwargs['usecols'] = columns
+
+    if chunksize:
+        return readSTFChunks(stfFile, columns=columns, dSchema=dSchema, chunksize=chunksize, **kwargs)
+
+    if not kwargs.get('nrows') and PARALLELWORKERS > 1 and os.path.getsize(stfFile) >= PARALLELMINBYTES:
+        return readSTFParallel(stfFile, dSchema=dSchema, usecols=usecols, workers=PARALLELWORKERS)
+
+    try:
+        return pd.read_csv(stfFile, sep=',', skiprows=range(1, 2), dtype=readDtypes(dSchema, columns), **kwargs)
+    except ValueError:
+        return pd.read_csv(stfFile, sep=',', skiprows=range(1, 2), dtype=readDtypes(dSchema, columns, nullable=True), **kwargs)
+
+
+def readSTFLines(data: bytes, columns: list, dSchema: dict, usecols: list = None) -> pd.DataFrame:
+    """
+    parses data lines of an STF file (without its header lines), such as the lines appended to a growing STF file
+
+    When usecols is given, only these columns are parsed.
+    """
+    readcols = columns if usecols is None else [col for col in columns if col in usecols]
+    try:
+        return pd.read_csv(io.BytesIO(data), sep=',', header=None, names=columns, usecols=readcols, dtype=readDtypes(dSchema, readcols))
+    except ValueError:
+        return pd.read_csv(io.BytesIO(data), sep=',', header=None, names=columns, usecols=readcols, dtype=readDtypes(dSchema, readcols, nullable=True))
+
+
+def lineRanges(stfFile: str, nrRanges: int) -> list:
+    """
+    splits the data lines of the STF file in nrRanges byte ranges (start, end) of about equal size, aligned on line boundaries
+    """
+    start = dataOffset(stfFile)
+    size = os.path.getsize(stfFile)
+
+    # move the evenly spaced boundaries to the start of the next line
+    lstBounds = [start]
+    with open(stfFile, 'rb') as fd:
+        for i in range(1, nrRanges):
+            fd.seek(max(start + (size - start) * i // nrRanges - 1, lstBounds[-1]))
+            fd.readline()
+            lstBounds.append(min(fd.tell(), size))
+    lstBounds.append(size)
+
+    return [(lstBounds[i], lstBounds[i + 1]) for i in range(nrRanges) if lstBounds[i + 1] > lstBounds[i]]
+
+
+def readSTFRange(stfFile: str, start: int, end: int, dSchema: dict, usecols: list = None) -> pd.DataFrame:
+    """
+    parses the data lines of the STF file in the byte range start to end
+    """
+    with open(stfFile, 'rb') as fd:
+        fd.seek(start)
+        data = fd.read(end - start)
+
+    return readSTFLines(data, columns=readHeader(stfFile), dSchema=dSchema, usecols=usecols)
+
+
+def readSTFParallel(stfFile: str, dSchema: dict, usecols: list = None, workers: int = None) -> pd.DataFrame:
+    """
+    parses the STF file in parallel, split in byte ranges aligned on lines which are each parsed by a worker process
+
+    The parsed ranges are concatenated in order so that the result equals the dataframe read by readSTFTyped.
+    """
+    workers = workers or os.cpu_count()
+    lstRanges = lineRanges(stfFile, workers)
+
+    with futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        lstFrames = list(executor.map(readSTFRange, *zip(*[(stfFile, start, end, dSchema, usecols) for start, end in lstRanges])))
+
+    if len(lstFrames) == 0:
+        return readSTFLines(b'', columns=readHeader(stfFile), dSchema=dSchema, usecols=usecols)
+
+    return pd.concat(lstFrames, ignore_index=True, copy=False)
+
+
+def bytesPerEpoch(df: pd.DataFrame, sampleRows: int = 10000) -> dict:
+    """
+    returns the memory used per row by df and an estimate of the memory it would use with the types pandas infers when reading the STF file
+
+    The estimate counts 8 bytes for a numeric column (1 for a boolean one) and the size of the python strings, measured on the first sampleRows rows, for a text or categorical column.
+    """
+    nrRows = max(df.shape[0], 1)
+    dfSample = df.head(sampleRows)
+
+    dMem = {}
+    dMem['typed'] = df.memory_usage(index=False, deep=True).sum() / nrRows
+    dMem['inferred'] = 0.
+    for col in df.columns:
+        if pd.api.types.is_bool_dtype(df[col].dtype):
+            dMem['inferred'] += 1.
+        elif pd.api.types.is_numeric_dtype(df[col].dtype) or pd.api.types.is_datetime64_any_dtype(df[col].dtype):
+            dMem['inferred'] += 8.
+        else:
+            dMem['inferred'] += dfSample[col].astype(object).memory_usage(index=False, deep=True) / max(dfSample.shape[0], 1)
+    dMem['saving'] = 100. * (1 - dMem['typed'] / dMem['inferred']) if dMem['inferred'] > 0 else 0.
+
+    return dMem
+
+
+def logMemoryReport(df: pd.DataFrame, dfName: str, callerName: str, logger: logging.Logger) -> dict:
+    """
+    logs the bytes per epoch of df after applying the schema and the estimated bytes per epoch before (pandas inferred types)
+    """
+    dMem = bytesPerEpoch(df)
+    logger.info('{func:s}: {name:s} uses {typed:.1f} bytes/epoch instead of an estimated {inf:.1f} bytes/epoch with inferred types (saving {sav:.1f}%)'.format(name=colored(dfName, 'green'), typed=dMem['typed'], inf=dMem['inferred'], sav=dMem['saving'], func=callerName))
+
+    return dMem
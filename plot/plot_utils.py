@@ -3,7 +3,9 @@ import sys
 import os
 from collections import OrderedDict
 import numpy as np
+import pandas as pd
 from termcolor import colored
+import matplotlib.colors as mcolors
 import datetime
 
 from GNSS import gpstime
@@ -11,6 +13,8 @@ from ampyutils import amutils
 
 __author__ = 'amuls'
 
+DENSITYPIXELS = 1000  # number of pixels along the largest side of a density raster
+
 
 def determineTimeTicks(firstObs, lastObs):
     """
@@ -71,3 +75,130 @@ def determine_datetime_ticks(startDT: datetime.datetime, endDT: datetime.datetim
     # print('dTimeFormatter = {!s}'.format(dTimeFormatter))
 
     return dTimeFormatter
+
+
+def groupIndex(df: pd.DataFrame, columns: list) -> dict:
+    """
+    returns for each combination of values of columns the (ascending) row positions of df having these values
+
+    The rows are grouped by a single stable argsort of the combined codes of the columns, each group being a slice of the sort order.
+    A group is keyed by its value (single column) or its tuple of values, rows with a missing value in columns are left out as done by groupby.
+    """
+    # combine the codes of the columns into one code per row, the rows with a missing value (code -1) are in no group
+    codes = np.zeros(df.shape[0], dtype=np.int64)
+    valid = np.ones(df.shape[0], dtype=bool)
+    lstUniques = []
+    for col in columns:
+        colCodes, uniques = pd.factorize(df[col], sort=True)
+        valid &= colCodes >= 0
+        codes = codes * max(len(uniques), 1) + colCodes
+        lstUniques.append(uniques)
+
+    rows = np.flatnonzero(valid)
+    if rows.size == 0:
+        return {}
+    order = rows[np.argsort(codes[rows], kind='stable')]
+    sortedCodes = codes[order]
+    starts = np.flatnonzero(np.diff(sortedCodes, prepend=-1))
+    ends = np.append(starts[1:], order.size)
+
+    # get back the values of the columns from the group codes
+    lstValues = [uniques[valueCodes].tolist() for uniques, valueCodes in zip(lstUniques, np.unravel_index(sortedCodes[starts], [len(uniques) for uniques in lstUniques]))]
+    keys = lstValues[0] if len(columns) == 1 else list(zip(*lstValues))
+
+    return {key: order[start:end] for key, start, end in zip(keys, starts, ends)}
+
+
+def groupRows(dGroups: dict, key) -> np.ndarray:
+    """
+    returns the row positions of group key, none when the group does not occur
+    """
+    return dGroups.get(key, np.zeros(0, dtype=np.int64))
+
+
+def densityRaster(x: np.ndarray, y: np.ndarray, codes: np.ndarray, colors: list, pixels: int = DENSITYPIXELS) -> tuple:
+    """
+    returns the RGBA image compositing the 2-D histograms of the points x/y per category codes (-1 for points not drawn), and its extent for imshow
+
+    The colour of a pixel is the mean of the colours of the categories of its points, its opacity grows with the logarithm of its number of points.
+    The points are binned by bincount, so the work per point is a few vector operations and the image size only depends on pixels.
+    """
+    valid = (codes >= 0) & np.isfinite(x) & np.isfinite(y)
+    x, y, codes = x[valid], y[valid], codes[valid]
+    if x.size == 0:
+        return np.zeros((1, 1, 4)), (0., 1., 0., 1.)
+
+    # square pixels over the extent of the points
+    xMin, yMin = x.min(), y.min()
+    pixelSize = max(x.max() - xMin, y.max() - yMin, 1e-3) / pixels
+    nrX = int((x.max() - xMin) / pixelSize) + 1
+    nrY = int((y.max() - yMin) / pixelSize) + 1
+    pixelIds = np.minimum(((y - yMin) / pixelSize).astype(np.int64), nrY - 1) * nrX + np.minimum(((x - xMin) / pixelSize).astype(np.int64), nrX - 1)
+
+    # number of points and sum of their colours per pixel
+    rgbCodes = np.array([mcolors.to_rgb(color) for color in colors])[codes]
+    counts = np.bincount(pixelIds, minlength=nrY * nrX).astype(float)
+    image = np.zeros((nrY * nrX, 4))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for channel in range(3):
+            image[:, channel] = np.bincount(pixelIds, weights=rgbCodes[:, channel], minlength=nrY * nrX) / counts
+        image[:, 3] = np.where(counts > 0, 0.3 + 0.7 * np.log1p(counts) / np.log1p(counts.max()), 0.)
+    image[counts == 0, :3] = 0.
+
+    return image.reshape(nrY, nrX, 4), (xMin, xMin + nrX * pixelSize, yMin, yMin + nrY * pixelSize)
+
+
+def axesPixels(ax) -> tuple:
+    """
+    returns the width and height in pixels of the axes ax at the dpi of its figure
+    """
+    bbox = ax.get_window_extent()
+
+    return max(int(bbox.width), 1), max(int(bbox.height), 1)
+
+
+def pixelRows(x: np.ndarray, y: np.ndarray, width: int, height: int) -> np.ndarray:
+    """
+    returns the positions of the points x/y (NaN not drawn) to keep when drawn as markers in width x height pixels, the first point of each pixel they fall in
+
+    Every pixel holding a point keeps one, so the outliers and the extremes of every column of pixels stay visible while at most width x height points are drawn.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = np.flatnonzero(~np.isnan(x) & ~np.isnan(y))
+    if valid.size <= width:
+        return valid
+
+    xPix = scalePixels(x[valid], width)
+    yPix = scalePixels(y[valid], height)
+
+    return valid[~pd.Series(xPix * height + yPix).duplicated().to_numpy()]
+
+
+def envelopeRows(x: np.ndarray, y: np.ndarray, width: int) -> np.ndarray:
+    """
+    returns in order the positions of the points x/y (NaN not drawn) with the minimum and maximum y in each of the width columns of pixels, the envelope of a line or filled area
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = np.flatnonzero(~np.isnan(x) & ~np.isnan(y))
+    if valid.size <= 2 * width:
+        return valid
+
+    xPix = scalePixels(x[valid], width)
+    order = np.lexsort((y[valid], xPix))
+    starts = np.flatnonzero(np.diff(xPix[order], prepend=-1))
+    ends = np.append(starts[1:], order.size) - 1
+
+    return valid[np.unique(np.concatenate([order[starts], order[ends]]))]
+
+
+def scalePixels(values: np.ndarray, pixels: int) -> np.ndarray:
+    """
+    returns the pixel (0 .. pixels - 1) of the values when their range is spread over pixels
+    """
+    vMin, vMax = values.min(), values.max()
+    if vMax <= vMin:
+        return np.zeros(values.size, dtype=np.int64)
+
+    return np.minimum(((values - vMin) / (vMax - vMin) * pixels).astype(np.int64), pixels - 1)
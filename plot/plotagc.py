@@ -3,7 +3,6 @@ import matplotlib as mpl
 from matplotlib import dates
 from matplotlib import colors as mpcolors
 import numpy as np
-import pandas as pd
 import matplotlib.colors as mcolors
 
 import sys
@@ -13,20 +12,20 @@ import logging
 from termcolor import colored
 
 from plot import plot_utils
-from ampyutils import amutils
+from plot import plotrender
 
 register_matplotlib_converters()
 
 
-def plotAGC(dStf: dict, dfAgc: pd.DataFrame, logger=logging.Logger):
+def plotAGC(dStf: dict, dAgc: dict, logger=logging.Logger):
     """
-    plots the UTM coordinates and #SVs on 4 different plots as a function of time
+    plots the AGC per frontend as a function of time, reading the frontends as columns of the epochs x frontends AGC array dAgc
     """
     cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
 
     logger.info('{func:s}: start plotting AGC values'.format(func=cFuncName))
 
-    amutils.logHeadTailDataFrame(df=dfAgc, dfName='dfAgc', callerName=cFuncName, logger=logger)
+    dtTime = dAgc['time']
 
     # specify the style
     mpl.style.use('seaborn')
@@ -39,10 +38,10 @@ def plotAGC(dStf: dict, dfAgc: pd.DataFrame, logger=logging.Logger):
     fig.set_size_inches(14, 10)
 
     # for setting the time on time-scale
-    dtFormat = plot_utils.determine_datetime_ticks(startDT=dfAgc['time'].iloc[0], endDT=dfAgc['time'].iloc[-1])
+    dtFormat = plot_utils.determine_datetime_ticks(startDT=dtTime.iloc[0], endDT=dtTime.iloc[-1])
 
     # x-axis properties
-    ax.set_xlim([dfAgc['time'].iloc[0], dfAgc['time'].iloc[-1]])
+    ax.set_xlim([dtTime.iloc[0], dtTime.iloc[-1]])
     if dtFormat['minutes']:
         ax.xaxis.set_major_locator(dates.MinuteLocator(byminute=[0, 15, 30, 45], interval=1))
     else:
@@ -58,16 +57,15 @@ def plotAGC(dStf: dict, dfAgc: pd.DataFrame, logger=logging.Logger):
         # tick.tick2line.set_markersize(0)
         tick.label1.set_horizontalalignment('center')
 
-    # get the index for the different frontends
-    dIdx = {}  # dict with indices
-    for i, fe in enumerate(dStf['frontend']):
+    # the AGC of each frontend is a column of the AGC array, decimated to the pixels of the axes
+    nsTime = dtTime.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    width, height = plot_utils.axesPixels(ax)
+    for i, fe in enumerate(dAgc['frontends']):
         logger.info('{func:s}: ... plotting frontend[{nr:d}], SSNID = {ssnid:d}, name = {name:s}'.format(nr=i, ssnid=fe, name=dStf['frontend'][fe]['name'], func=cFuncName))
 
-        idx = dfAgc.index[dfAgc['FrontEnd'] == fe]
-        logger.info('{func:s}:    ... indices found {idx!s} (#{len:d})'.format(idx=idx, len=len(idx), func=cFuncName))
-
-        # plot the AGC for this frontend
-        ax.plot(dfAgc['time'].loc[idx], dfAgc['AGCGain[dB]'].loc[idx], color=next(colorsIter), linestyle='', marker='.', label=dStf['frontend'][fe]['name'], markersize=3)
+        # plot the AGC for this frontend, the epochs without value are not drawn
+        idx = plot_utils.pixelRows(nsTime, dAgc['agc'][:, i], width=width, height=height)
+        ax.plot(dtTime.iloc[idx], dAgc['agc'][idx, i], color=next(colorsIter), linestyle='', marker='.', label=dStf['frontend'][fe]['name'], markersize=3)
 
     # name y-axis
     ax.set_ylabel('AGC Gain [dB]', fontsize=14)
@@ -87,8 +85,8 @@ def plotAGC(dStf: dict, dfAgc: pd.DataFrame, logger=logging.Logger):
     os.makedirs(pltDir, exist_ok=True)
     pltName = '{syst:s}-AGC.png'.format(syst=dStf['gnss'].replace(' ', '-'))
     pltName = os.path.join(pltDir, pltName)
-    fig.savefig(pltName, dpi=100)
+    plotrender.saveFigure(fig, pltName, dpi=100)
 
     logger.info('{func:s}: plot saved as {name:s}'.format(name=pltName, func=cFuncName))
 
-    plt.show(block=True)
+    plotrender.showFigure(fig, block=True)
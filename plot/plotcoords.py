@@ -12,14 +12,66 @@ import logging
 from termcolor import colored
 
 from plot import plot_utils
+from plot import plotrender
 from ampyutils import amutils
+from SSN import signal_types as ssnst
 
 register_matplotlib_converters()
 
+DENSITYEPOCHS = 1000000  # number of epochs from which the trajectories are drawn as a density raster instead of markers
 
-def plotUTMCoords(dStf: dict, dfCrd: pd.DataFrame, logger=logging.Logger):
+# columns defining the groups of rows plotted with their own colour
+dGroupColumns = {
+    'signal': ['SignalInfo', '2D/3D'],
+    'mode': ['2D/3D'],
+    'error': ['Error'],
+}
+
+
+def groupCoords(dfCrd: pd.DataFrame) -> dict:
+    """
+    returns the row positions per signal type & 2D/3D mode, per 2D/3D mode and per PVT error code, computed once and shared by the plots
+    """
+    dGroups = {}
+    for group, columns in dGroupColumns.items():
+        if all(col in dfCrd.columns for col in columns):
+            dGroups[group] = plot_utils.groupIndex(dfCrd, columns)
+
+    return dGroups
+
+
+def plotTrajectory(ax, dfCrd: pd.DataFrame, lstCategories: list, density: bool, markersize: int):
     """
-    plots the UTM coordinates and #SVs on 4 different plots as a function of time
+    draws the E-N trajectory per category (label, row positions, colour), as markers or as one density raster of all categories
+    """
+    if not density:
+        for label, idx, color in lstCategories:
+            ax.plot(dfCrd['UTM.E'].iloc[idx], dfCrd['UTM.N'].iloc[idx], color=color, linestyle='', marker='.', label=label, markersize=markersize)
+        return
+
+    # category of each epoch, the epochs of no category are not drawn
+    codes = np.full(dfCrd.shape[0], -1, dtype=np.int64)
+    for i, (label, idx, color) in enumerate(lstCategories):
+        codes[idx] = i
+    image, extent = plot_utils.densityRaster(dfCrd['UTM.E'].to_numpy(dtype=float), dfCrd['UTM.N'].to_numpy(dtype=float), codes, colors=[color for label, idx, color in lstCategories])
+    ax.imshow(image, extent=extent, origin='lower', interpolation='nearest', aspect='equal')
+
+    # legend entries of the categories present
+    for label, idx, color in lstCategories:
+        if len(idx) > 0:
+            ax.plot([], [], color=color, linestyle='', marker='s', label=label, markersize=markersize)
+
+
+def useDensity(dStf: dict, dfCrd: pd.DataFrame) -> bool:
+    """
+    returns whether the trajectory is drawn as a density raster, when asked for or when it has DENSITYEPOCHS epochs or more
+    """
+    return dStf.get('density', False) or dfCrd.shape[0] >= DENSITYEPOCHS
+
+
+def plotUTMCoords(dStf: dict, dfCrd: pd.DataFrame, logger=logging.Logger, dGroups: dict = None):
+    """
+    plots the UTM coordinates and #SVs on 4 different plots as a function of time, using the row positions per group of groupCoords
     """
     cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
     crds = ['UTM.E', 'UTM.N', 'Height[m]', 'dist', 'NrSV']
@@ -27,6 +79,9 @@ def plotUTMCoords(dStf: dict, dfCrd: pd.DataFrame, logger=logging.Logger):
 
     logger.info('{func:s}: start plotting UTM coordinates'.format(func=cFuncName))
 
+    if dGroups is None:
+        dGroups = groupCoords(dfCrd)
+
     amutils.logHeadTailDataFrame(df=dfCrd, dfName='dfCrd', callerName=cFuncName, logger=logger)
 
     # specify the style
@@ -36,23 +91,27 @@ def plotUTMCoords(dStf: dict, dfCrd: pd.DataFrame, logger=logging.Logger):
     fig.set_size_inches(18.5, 15)
 
     # get the index for 2D/3D
-    idx3D = dfCrd.index[dfCrd['2D/3D'] == 0]
-    idx2D = dfCrd.index[dfCrd['2D/3D'] == 1]
+    idx3D = plot_utils.groupRows(dGroups['mode'], 0)
+    idx2D = plot_utils.groupRows(dGroups['mode'], 1)
 
     # get the index for signals used for PNT AND for 3D/2D
     dIdx = {}  # dict with indices corresponding to signals & 3D/2D usage
-    for st, lstSTNames in dStf['signals'].items():
-        stNames = ",".join(lstSTNames)
+    for st in dStf['signals']:
+        stNames = ssnst.signalLabel(st)
         logger.info('{func:s}: st = {st:d}  name = {name!s}'.format(st=st, name=stNames, func=cFuncName))
         dIdx[st] = {}
-        dIdx[st]['3D'] = dfCrd.index[(dfCrd['SignalInfo'] == st) & (dfCrd['2D/3D'] == 0)]
-        dIdx[st]['2D'] = dfCrd.index[(dfCrd['SignalInfo'] == st) & (dfCrd['2D/3D'] == 1)]
+        dIdx[st]['3D'] = plot_utils.groupRows(dGroups['signal'], (st, 0))
+        dIdx[st]['2D'] = plot_utils.groupRows(dGroups['signal'], (st, 1))
         logger.info('{func:s}: list of indices dIdx[{st:d}][3D] = {idx!s}'.format(st=st, idx=dIdx[st]['3D'], func=cFuncName))
         logger.info('{func:s}: list of indices dIdx[{st:d}][2D] = {idx!s}'.format(st=st, idx=dIdx[st]['2D'], func=cFuncName))
 
     # for setting the time on time-scale
     dtFormat = plot_utils.determine_datetime_ticks(startDT=dfCrd['time'].iloc[0], endDT=dfCrd['time'].iloc[-1])
 
+    # each series is decimated to the pixels of its axes, the time as nanoseconds
+    nsTime = dfCrd['time'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    width, height = plot_utils.axesPixels(axes[0])
+
     for crd, ax in zip(crds, axes):
         # print in order UTM.E, UTM.N, height, and NrSV and indicate 2D/3D by alpha
         logger.info('{func:s}: plotting {crd:s}'.format(crd=crd, func=cFuncName))
@@ -77,25 +136,30 @@ def plotUTMCoords(dStf: dict, dfCrd: pd.DataFrame, logger=logging.Logger):
         # (re)set the color iterator
         colorsIter = iter(list(mcolors.TABLEAU_COLORS))
 
+        values = dfCrd[crd].to_numpy(dtype=float)
         if crd is not 'NrSV':
             # plot according to signals used and 2D/3D
-            for st, lstSTNames in dStf['signals'].items():
-                stNames = ",".join(lstSTNames)
+            for st in dStf['signals']:
+                stNames = ssnst.signalLabel(st)
                 for mode in '3D', '2D':
                     lblTxt = '{st:s} ({mode:s})'.format(st=stNames, mode=mode)
                     logger.debug('{func:s}: plotting {stm:s}'.format(stm=lblTxt, func=cFuncName))
 
                     # get the index for this sigType & mode
                     idx = dIdx[st][mode]
+                    idx = idx[plot_utils.pixelRows(nsTime[idx], values[idx], width=width, height=height)]
                     ax.plot(dfCrd['time'].iloc[idx], dfCrd[crd].iloc[idx], color=next(colorsIter), linestyle='', marker='.', label=lblTxt, markersize=2)
         else:
-            # plot when 3D posn
-            ax.fill_between(dfCrd['time'], dfCrd[crd], color='grey', alpha=.2)
+            # plot when 3D posn, filling up to the envelope of #SVs
+            idxFill = plot_utils.envelopeRows(nsTime, values, width=width)
+            ax.fill_between(dfCrd['time'].iloc[idxFill], dfCrd[crd].iloc[idxFill], color='grey', alpha=.2)
 
             # plot when 3D posn
-            ax.plot(dfCrd['time'].iloc[idx3D], dfCrd[crd].iloc[idx3D], color='green', linestyle='', marker='.', markersize=2, label='3D')
+            idx = idx3D[plot_utils.pixelRows(nsTime[idx3D], values[idx3D], width=width, height=height)]
+            ax.plot(dfCrd['time'].iloc[idx], dfCrd[crd].iloc[idx], color='green', linestyle='', marker='.', markersize=2, label='3D')
             # plot when 2D posn
-            ax.plot(dfCrd['time'].iloc[idx2D], dfCrd[crd].iloc[idx2D], color='red', linestyle='', marker='.', markersize=2, label='2D')
+            idx = idx2D[plot_utils.pixelRows(nsTime[idx2D], values[idx2D], width=width, height=height)]
+            ax.plot(dfCrd['time'].iloc[idx], dfCrd[crd].iloc[idx], color='red', linestyle='', marker='.', markersize=2, label='2D')
 
         # name y-axis
         ax.set_ylabel(crd, fontsize=14)
@@ -115,42 +179,44 @@ def plotUTMCoords(dStf: dict, dfCrd: pd.DataFrame, logger=logging.Logger):
     os.makedirs(pltDir, exist_ok=True)
     pltName = '{syst:s}-UTM.png'.format(syst=dStf['gnss'].replace(' ', '-'))
     pltName = os.path.join(pltDir, pltName)
-    fig.savefig(pltName, dpi=100)
+    plotrender.saveFigure(fig, pltName, dpi=100)
 
     logger.info('{func:s}: plot saved as {name:s}'.format(name=pltName, func=cFuncName))
 
-    plt.show(block=False)
+    plotrender.showFigure(fig, block=False)
 
 
-def plotUTMScatter(dStf: dict, dfCrd: pd.DataFrame, logger=logging.Logger):
+def plotUTMScatter(dStf: dict, dfCrd: pd.DataFrame, logger=logging.Logger, dGroups: dict = None):
     """
-    plots the UTM E-N scatter
+    plots the UTM E-N scatter, using the row positions per group of groupCoords
     """
     cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
 
     logger.info('{func:s}: start plotting trajectories'.format(func=cFuncName))
 
+    if dGroups is None:
+        dGroups = groupCoords(dfCrd)
+
     # specify the style
     mpl.style.use('seaborn')
 
     # get the index for signals used for PNT AND for 3D/2D
     dIdx = {}  # dict with indices corresponding to signals & 3D/2D usage
-    for st, lstSTNames in dStf['signals'].items():
-        stNames = ",".join(lstSTNames)
+    for st in dStf['signals']:
+        stNames = ssnst.signalLabel(st)
         logger.info('{func:s}: st = {st:d}  name = {name:s}'.format(st=st, name=stNames, func=cFuncName))
         dIdx[st] = {}
-        dIdx[st]['3D'] = dfCrd.index[(dfCrd['SignalInfo'] == st) & (dfCrd['2D/3D'] == 0)]
-        dIdx[st]['2D'] = dfCrd.index[(dfCrd['SignalInfo'] == st) & (dfCrd['2D/3D'] == 1)]
+        dIdx[st]['3D'] = plot_utils.groupRows(dGroups['signal'], (st, 0))
+        dIdx[st]['2D'] = plot_utils.groupRows(dGroups['signal'], (st, 1))
         logger.info('{func:s}: list of indices dIdx[{st:d}][3D] = {idx!s}'.format(st=st, idx=dIdx[st]['3D'], func=cFuncName))
         logger.info('{func:s}: list of indices dIdx[{st:d}][2D] = {idx!s}'.format(st=st, idx=dIdx[st]['2D'], func=cFuncName))
 
-    # convert time column to seconds
-    dsTime = dfCrd['time']-dfCrd['time'].iloc[0]
-    dfCrd['sec'] = dsTime.dt.total_seconds()
+    # convert time column to seconds, without changing the frame of the caller
+    sec = (dfCrd['time'] - dfCrd['time'].iloc[0]).dt.total_seconds().to_numpy()
     amutils.logHeadTailDataFrame(df=dfCrd, dfName='dfCrd plot scatter', callerName=cFuncName, logger=logger)
 
     # get index when sec is multiple of 10 minutes
-    idxTime = dfCrd.index[dfCrd['sec'] % 600 == 0]
+    idxTime = dfCrd.index[sec % 600 == 0]
     logger.debug('{func:s}: indices multiple of 300s = {idx!s}'.format(idx=idxTime, func=cFuncName))
 
     fig, ax = plt.subplots(nrows=1, ncols=1)
@@ -160,23 +226,20 @@ def plotUTMScatter(dStf: dict, dfCrd: pd.DataFrame, logger=logging.Logger):
     # copyright this
     ax.annotate(r'$\copyright$ Alain Muls (alain.muls@mil.be)', xy=(1, 0), xycoords='axes fraction', xytext=(0, -45), textcoords='offset pixels', horizontalalignment='right', verticalalignment='bottom', weight='strong', fontsize='medium')
 
-    # get the index for 2D/3D
-    idx3D = dfCrd.index[dfCrd['2D/3D'] == 0]
-    idx2D = dfCrd.index[dfCrd['2D/3D'] == 1]
-
     # (re)set the color iterator
     colorsIter = iter(list(mcolors.TABLEAU_COLORS))
 
     # plot the E-N coordinates according to signals used and 2D/3D mode
-    for st, lstSTNames in dStf['signals'].items():
-        stNames = ",".join(lstSTNames)
+    lstCategories = []
+    for st in dStf['signals']:
+        stNames = ssnst.signalLabel(st)
         for mode in '3D', '2D':
             lblTxt = '{st:s} ({mode:s})'.format(st=stNames, mode=mode)
             logger.debug('{func:s}: plotting {stm:s}'.format(stm=lblTxt, func=cFuncName))
 
             # get the index for this sigType & mode
-            idx = dIdx[st][mode]
-            ax.plot(dfCrd['UTM.E'].iloc[idx], dfCrd['UTM.N'].iloc[idx], color=next(colorsIter), linestyle='', marker='.', label=lblTxt, markersize=2)
+            lstCategories.append((lblTxt, dIdx[st][mode], next(colorsIter)))
+    plotTrajectory(ax, dfCrd, lstCategories, density=useDensity(dStf, dfCrd), markersize=2)
 
 
     # ax.plot(dfCrd['UTM.E'].iloc[idx3D], dfCrd['UTM.N'].iloc[idx3D], color='blue', label='3D mode', markersize=2, linestyle='', marker='.')
@@ -222,15 +285,15 @@ def plotUTMScatter(dStf: dict, dfCrd: pd.DataFrame, logger=logging.Logger):
     os.makedirs(pltDir, exist_ok=True)
     pltName = '{syst:s}-UTMscatter.png'.format(syst=dStf['gnss'].replace(' ', '-'))
     pltName = os.path.join(pltDir, pltName)
-    fig.savefig(pltName, dpi=100)
+    plotrender.saveFigure(fig, pltName, dpi=100)
     logger.info('{func:s}: plot saved as {name:s}'.format(name=pltName, func=cFuncName))
 
-    plt.show(block=True)
+    plotrender.showFigure(fig, block=True)
 
 
-def plotUTMSuppressed(dStf: dict, dfCrd: pd.DataFrame, logger=logging.Logger):
+def plotUTMSuppressed(dStf: dict, dfCrd: pd.DataFrame, logger=logging.Logger, dGroups: dict = None):
     """
-    plots the UTM E-N scatter
+    plots the UTM E-N scatter, using the row positions per group of groupCoords
 
     PVT error code. The following values are defined:
     0: no error.
@@ -249,22 +312,24 @@ def plotUTMSuppressed(dStf: dict, dfCrd: pd.DataFrame, logger=logging.Logger):
 
     logger.info('{func:s}: start plotting (un)suppressed trajectories'.format(func=cFuncName))
 
+    if dGroups is None:
+        dGroups = groupCoords(dfCrd)
+
     # specify the style
     mpl.style.use('seaborn')
 
     # get the index for PVT suppression
     dIdx = {}  # dict with indices corresponding to PNT suppression
     for errCode in dStf['errCodes']:
-        dIdx[errCode] = dfCrd.index[dfCrd['Error'] == errCode]
+        dIdx[errCode] = plot_utils.groupRows(dGroups['error'], errCode)
         logger.info('{func:s}: list of indices dIdx[{errc:d}] = {idx!s}'.format(errc=errCode, idx=dIdx[errCode], func=cFuncName))
 
-    # convert time column to seconds
-    dsTime = dfCrd['time']-dfCrd['time'].iloc[0]
-    dfCrd['sec'] = dsTime.dt.total_seconds()
+    # convert time column to seconds, without changing the frame of the caller
+    sec = (dfCrd['time'] - dfCrd['time'].iloc[0]).dt.total_seconds().to_numpy()
     amutils.logHeadTailDataFrame(df=dfCrd, dfName='dfCrd plot scatter', callerName=cFuncName, logger=logger)
 
     # get index when sec is multiple of 10 minutes
-    idxTime = dfCrd.index[dfCrd['sec'] % 300 == 0]
+    idxTime = dfCrd.index[sec % 300 == 0]
     logger.debug('{func:s}: indices multiple of 300s = {idx!s}'.format(idx=idxTime, func=cFuncName))
 
     fig, ax = plt.subplots(nrows=1, ncols=1)
@@ -278,12 +343,13 @@ def plotUTMSuppressed(dStf: dict, dfCrd: pd.DataFrame, logger=logging.Logger):
     colorsIter = iter(list(mcolors.TABLEAU_COLORS))
 
     # plot the E-N coordinates according to PVT Error mode
+    lstCategories = []
     for errCode, errCodeName in dStf['errCodes'].items():
         logger.debug('{func:s}: plotting {errc:d}: {errtxt:s}'.format(errc=errCode, errtxt=errCodeName, func=cFuncName))
 
         # get the index for this error code
-        idx = dIdx[errCode]
-        ax.plot(dfCrd['UTM.E'].iloc[idx], dfCrd['UTM.N'].iloc[idx], color=next(colorsIter), linestyle='', marker='.', label=errCodeName, markersize=4)
+        lstCategories.append((errCodeName, dIdx[errCode], next(colorsIter)))
+    plotTrajectory(ax, dfCrd, lstCategories, density=useDensity(dStf, dfCrd), markersize=4)
 
     # ax.plot(dfCrd['UTM.E'].iloc[idx3D], dfCrd['UTM.N'].iloc[idx3D], color='blue', label='3D mode', markersize=2, linestyle='', marker='.')
     # ax.plot(dfCrd['UTM.E'].iloc[idx2D], dfCrd['UTM.N'].iloc[idx2D], color='red', label='2D mode', markersize=2, linestyle='', marker='.')
@@ -294,19 +360,19 @@ def plotUTMSuppressed(dStf: dict, dfCrd: pd.DataFrame, logger=logging.Logger):
     for idx, text in zip(idxTime, annText):
         ax.annotate(text, (dfCrd['UTM.E'].iloc[idx], dfCrd['UTM.N'].iloc[idx]), textcoords='offset points', xytext=(0,10), ha='center')
 
-    # # draw circles for zones on plot
-    # for zone, zone_crd in dStf['zones'].items():
-    #     E, N, R = zone_crd['UTM.E'], zone_crd['UTM.N'], zone_crd['radius']
-
-    #     # draw marker & cricle
-    #     ax.scatter(E, N, color='black', marker='^', alpha=0.4)
-    #     newCircle = plt.Circle((E, N), R, color='black', fill=False, clip_on=True)
-    #     ax.add_artist(newCircle)
-
-    #     # annotate the markers
-    #     ax.annotate('{zone:s}'.format(zone=zone), xy=(E + 2, N), textcoords='data', xycoords='data', clip_on=True, color='black', alpha=0.4)
+    # draw the allow/deny zones on plot
+    for zone, zone_crd in dStf.get('zones', {}).items():
+        color = 'green' if zone_crd['kind'] == 'allow' else 'red'
+        if 'polygon' in zone_crd:
+            E, N = zone_crd['UTM.polygon'].mean(axis=0)
+            ax.add_patch(plt.Polygon(zone_crd['UTM.polygon'], color=color, fill=False, clip_on=True))
+        else:
+            E, N = zone_crd['UTM.E'], zone_crd['UTM.N']
+            ax.add_patch(plt.Circle((E, N), zone_crd['radius'], color=color, fill=False, clip_on=True))
 
-    #     # break
+        # draw & annotate the markers
+        ax.scatter(E, N, color=color, marker='^', alpha=0.4)
+        ax.annotate('{zone:s}'.format(zone=zone), xy=(E + 2, N), textcoords='data', xycoords='data', clip_on=True, color=color, alpha=0.4)
 
     # name y-axis
     ax.set_xlabel('UTM.E', fontsize=14)
@@ -324,7 +390,7 @@ def plotUTMSuppressed(dStf: dict, dfCrd: pd.DataFrame, logger=logging.Logger):
     os.makedirs(pltDir, exist_ok=True)
     pltName = '{syst:s}-UTMsuppressed.png'.format(syst=dStf['gnss'].replace(' ', '-'))
     pltName = os.path.join(pltDir, pltName)
-    fig.savefig(pltName, dpi=100)
+    plotrender.saveFigure(fig, pltName, dpi=100)
     logger.info('{func:s}: plot saved as {name:s}'.format(name=pltName, func=cFuncName))
 
-    plt.show(block=True)
+    plotrender.showFigure(fig, block=True)
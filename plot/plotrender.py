@@ -0,0 +1,220 @@
+import os
+import sys
+import json
+import hashlib
+from concurrent import futures
+import logging
+import numpy as np
+import pandas as pd
+import matplotlib
+import matplotlib.pyplot as plt
+from termcolor import colored
+
+__author__ = 'amuls'
+
+HEADLESS = False  # render without display: Agg backend, no plt.show and the figures closed once saved
+RENDERWORKERS = os.cpu_count()  # number of processes rendering the figures in parallel when headless, 1 renders them in turn
+RENDERCACHE = True  # when headless, skip the figures whose key matches the one of the PNG files they saved before
+CACHEINDEX = '.rendercache.json'  # created in the png directory
+
+lstSaved = []  # PNG files saved by the figure being rendered
+
+
+def setHeadless(workers: int = None):
+    """
+    switches to headless rendering with the Agg backend, rendering the figures in workers processes (default RENDERWORKERS)
+    """
+    global HEADLESS, RENDERWORKERS
+
+    matplotlib.use('Agg', force=True)
+    HEADLESS = True
+    if workers is not None:
+        RENDERWORKERS = workers
+
+
+def saveFigure(fig: plt.Figure, pltName: str, dpi: int = 100):
+    """
+    saves the figure fig as pltName, keeping its name for the render cache
+    """
+    fig.savefig(pltName, dpi=dpi)
+    lstSaved.append(os.path.abspath(pltName))
+
+
+def showFigure(fig: plt.Figure, block: bool = True):
+    """
+    shows the saved figure fig, or closes it to free its memory when rendering headless
+    """
+    if HEADLESS:
+        plt.close(fig)
+    else:
+        plt.show(block=block)
+
+
+def drawFigure(plotFunc, dKwargs: dict) -> list:
+    """
+    draws one figure by calling plotFunc with the keyword arguments dKwargs and returns the PNG files it saved
+    """
+    del lstSaved[:]
+    plotFunc(**dKwargs)
+
+    return list(lstSaved)
+
+
+def renderFigure(plotFunc, dKwargs: dict) -> list:
+    """
+    renders one figure in a worker process and returns the PNG files it saved
+    """
+    setHeadless()
+    try:
+        return drawFigure(plotFunc, dKwargs)
+    finally:
+        plt.close('all')
+
+
+def hashValue(h, value):
+    """
+    adds the content of value (nested dicts and lists of arrays, dataframes and scalars) to the hash h, objects such as loggers only by their type
+    """
+    if isinstance(value, dict):
+        h.update(b'dict')
+        for key in sorted(value, key=repr):
+            h.update(repr(key).encode())
+            hashValue(h, value[key])
+    elif isinstance(value, (list, tuple)):
+        h.update('list {:d}'.format(len(value)).encode())
+        for item in value:
+            hashValue(h, item)
+    elif isinstance(value, (pd.DataFrame, pd.Series)):
+        h.update(repr(value.columns.tolist() if isinstance(value, pd.DataFrame) else value.name).encode())
+        h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        h.update('{dtype!s} {shape!s}'.format(dtype=value.dtype, shape=value.shape).encode())
+        h.update(np.ascontiguousarray(value).tobytes() if value.dtype != object else repr(value.tolist()).encode())
+    elif value is None or isinstance(value, (str, bool, int, float, np.generic)):
+        h.update(repr(value).encode())
+    else:
+        h.update(type(value).__name__.encode())
+
+
+def plotModules(plotFunc) -> list:
+    """
+    returns the modules of the package used by plotFunc: its own module, this module and the package modules these import, directly or through each other
+    """
+    pkgDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    dModules = {}
+    lstTodo = [sys.modules[plotFunc.__module__], sys.modules[__name__]]
+    while lstTodo:
+        module = lstTodo.pop()
+        if module.__name__ in dModules or not os.path.abspath(getattr(module, '__file__', None) or '/').startswith(pkgDir + os.sep):
+            continue
+        dModules[module.__name__] = module
+
+        # imported modules and the modules of imported functions and classes
+        for value in vars(module).values():
+            imported = value if isinstance(value, type(sys)) else sys.modules.get(getattr(value, '__module__', None) or '')
+            if imported is not None:
+                lstTodo.append(imported)
+
+    return [dModules[name] for name in sorted(dModules)]
+
+
+def codeVersion(plotFunc) -> str:
+    """
+    returns the hash of the source of the package modules used by plotFunc (e.g. plot_utils, signal_types, amutils) and of the matplotlib version
+    """
+    h = hashlib.sha1(matplotlib.__version__.encode())
+    for module in plotModules(plotFunc):
+        h.update(module.__name__.encode())
+        with open(module.__file__, 'rb') as fd:
+            h.update(fd.read())
+
+    return h.hexdigest()
+
+
+def renderKey(plotFunc, dKwargs: dict) -> str:
+    """
+    returns the render cache key of a figure, the hash of its plotted data, plot parameters (with dStf options such as density), rendering options and code version
+    """
+    h = hashlib.sha1('{mod:s}.{func:s} {code:s}'.format(mod=plotFunc.__module__, func=plotFunc.__name__, code=codeVersion(plotFunc)).encode())
+    h.update('{backend:s} {rc:s}'.format(backend=matplotlib.get_backend(), rc=repr(sorted(matplotlib.rcParams.items()))).encode())
+    hashValue(h, dKwargs)
+
+    return h.hexdigest()
+
+
+def fileStamp(pltName: str) -> list:
+    """
+    returns the size and modification time of the file pltName, None when it does not exist
+    """
+    try:
+        stat = os.stat(pltName)
+    except OSError:
+        return None
+
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def readCacheIndex(pngDir: str) -> dict:
+    """
+    reads the render cache index of pngDir, mapping each plot function to its key and the stamps of the PNG files it saved
+    """
+    try:
+        with open(os.path.join(pngDir, CACHEINDEX), 'r') as fd:
+            return json.load(fd)
+    except (OSError, ValueError):
+        return {}
+
+
+def writeCacheIndex(pngDir: str, dIndex: dict):
+    """
+    writes the render cache index of pngDir, dropping the entries of which a PNG file was removed or changed
+    """
+    dIndex = {name: dEntry for name, dEntry in dIndex.items() if all(fileStamp(pltName) == stamp for pltName, stamp in dEntry['files'].items())}
+
+    os.makedirs(pngDir, exist_ok=True)
+    tmpName = os.path.join(pngDir, '{idx:s}.{pid:d}'.format(idx=CACHEINDEX, pid=os.getpid()))
+    with open(tmpName, 'w') as fd:
+        json.dump(dIndex, fd, indent=1)
+    os.replace(tmpName, os.path.join(pngDir, CACHEINDEX))
+
+
+def renderFigures(lstFigures: list, logger: logging.Logger):
+    """
+    renders the independent figures, given as (plot function, keyword arguments with dStf), at the same time in worker processes when headless, else in turn
+
+    When headless, the figures whose render key matches the one stored with their unchanged PNG files are skipped.
+    An error in a worker is raised again once all figures are rendered.
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    useCache = HEADLESS and RENDERCACHE and len(lstFigures) > 0
+    if useCache:
+        pngDir = os.path.join(lstFigures[0][1]['dStf']['dir'], 'png')
+        dIndex = readCacheIndex(pngDir)
+        lstNames = ['{mod:s}.{func:s}'.format(mod=plotFunc.__module__, func=plotFunc.__name__) for plotFunc, dKwargs in lstFigures]
+        lstKeys = [renderKey(plotFunc, dKwargs) for plotFunc, dKwargs in lstFigures]
+
+        lstTodo = []
+        for i, (name, key) in enumerate(zip(lstNames, lstKeys)):
+            dEntry = dIndex.get(name)
+            if dEntry is not None and dEntry['key'] == key and all(fileStamp(pltName) == stamp for pltName, stamp in dEntry['files'].items()):
+                logger.info('{func:s}: {name:s} unchanged, keeping {files!s}'.format(name=name, files=list(dEntry['files']), func=cFuncName))
+            else:
+                lstTodo.append(i)
+    else:
+        lstTodo = list(range(len(lstFigures)))
+
+    workers = min(RENDERWORKERS, len(lstTodo))
+    if not HEADLESS or workers <= 1:
+        lstFiles = [drawFigure(*lstFigures[i]) for i in lstTodo]
+    else:
+        logger.info('{func:s}: rendering {nr:d} figures with {workers:d} workers'.format(nr=len(lstTodo), workers=workers, func=cFuncName))
+        with futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            lstFutures = [executor.submit(renderFigure, *lstFigures[i]) for i in lstTodo]
+        lstFiles = [future.result() for future in lstFutures]
+
+    if useCache:
+        for i, files in zip(lstTodo, lstFiles):
+            dIndex[lstNames[i]] = {'key': lstKeys[i], 'files': {pltName: fileStamp(pltName) for pltName in files}}
+        writeCacheIndex(pngDir, dIndex)
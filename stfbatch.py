@@ -0,0 +1,234 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import argparse
+import sys
+import glob
+import time
+import logging
+from concurrent import futures
+from termcolor import colored
+import pandas as pd
+
+import am_config as amc
+from STF import sbf_decoder
+
+__author__ = 'amuls'
+
+# STF block types recognised from the file name and the script processing them
+dSTFTypes = {
+    'PVTGeodetic': 'stfgeodetic',
+    'ReceiverStatus': 'stfrxstatus',
+}
+
+
+def treatCmdOpts(argv):
+    """
+    Treats the command line options and sets the global variables according to the CLI args
+
+    :param argv: the options (without argv[0])
+    :type argv: list of string
+    """
+    helpTxt = os.path.basename(__file__) + ' processes many PVTGeodetic / ReceiverStatus STF (or SBF) files in parallel, each with its own log and output directory'
+
+    # create the parser for command line arguments
+    parser = argparse.ArgumentParser(description=helpTxt)
+
+    parser.add_argument('files', help='STF/SBF files or glob patterns (quote them) to process', nargs='*', type=str)
+    parser.add_argument('-i', '--manifest', help='file listing the STF/SBF files (or glob patterns) to process, one per line', required=False, default=None, type=str)
+    parser.add_argument('-g', '--gnss', help='GNSS System Name', required=True, type=str)
+    parser.add_argument('-o', '--outdir', help='Directory in which a subdirectory per file is created, named after its parent directory and file name (defaults to .)', required=False, default='.', type=str)
+    parser.add_argument('-j', '--jobs', help='number of worker processes (default number of cores)', required=False, default=os.cpu_count(), type=int)
+    parser.add_argument('-m', '--marker', help='Geodetic coordinates (lat,lon,ellH) of reference point in degrees, default ["0", "0", "0"] means use mean position', nargs=3, type=str, required=False, default=["0", "0", "0"])
+    parser.add_argument('--no-cache', help='do not use (nor create) the parse cache of the STF files and the render cache of the plots', required=False, action='store_true', dest='nocache')
+
+    parser.add_argument('-l', '--logging', help='specify logging level console/file (default {:s})'.format(colored('INFO DEBUG', 'green')), nargs=2, required=False, default=['INFO', 'DEBUG'], choices=['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG', 'NOTSET'])
+
+    args = parser.parse_args(argv[1:])
+
+    return args.files, args.manifest, args.gnss, args.outdir, args.jobs, args.marker, args.nocache, args.logging
+
+
+def collectFiles(lstPatterns: list, manifest: str, logger: logging.Logger) -> list:
+    """
+    expands the glob patterns given on the command line and in the manifest into a sorted list of unique absolute file names
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    lstPatterns = list(lstPatterns)
+    if manifest is not None:
+        if not os.access(manifest, os.R_OK):
+            logger.error('{func:s}: manifest {file:s} is not accessible.'.format(func=cFuncName, file=colored(manifest, 'red')))
+            sys.exit(amc.E_FILE_NOT_ACCESSIBLE)
+        with open(manifest, 'r') as fd:
+            lstPatterns += [line.strip() for line in fd if line.strip() and not line.strip().startswith('#')]
+
+    lstFiles = []
+    for pattern in lstPatterns:
+        lstMatches = glob.glob(os.path.expanduser(pattern))
+        if not lstMatches:
+            logger.warning('{func:s}: no files found for {pat:s}'.format(pat=colored(pattern, 'red'), func=cFuncName))
+        lstFiles += [os.path.abspath(match) for match in lstMatches]
+
+    return sorted(set(lstFiles))
+
+
+def createTasks(lstFiles: list, logger: logging.Logger) -> list:
+    """
+    determines from the file names which script processes each file, SBF files are processed by all scripts
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    lstTasks = []
+    for stfFile in lstFiles:
+        if sbf_decoder.isSBF(stfFile):
+            lstTasks += [(stfFile, script) for script in dSTFTypes.values()]
+            continue
+
+        lstScripts = [script for stfType, script in dSTFTypes.items() if stfType in os.path.basename(stfFile)]
+        if not lstScripts:
+            logger.warning('{func:s}: skipping {file:s}, unknown STF type'.format(file=colored(stfFile, 'red'), func=cFuncName))
+        lstTasks += [(stfFile, script) for script in lstScripts]
+
+    return lstTasks
+
+
+def processFile(stfFile: str, script: str, GNSSsyst: str, outDir: str, crdMarker: list, noCache: bool) -> dict:
+    """
+    processes one file in a worker process, logging to and creating output in its own directory, and returns its status
+    """
+    import matplotlib.pyplot as plt
+    import stfgeodetic
+    import stfrxstatus
+    from STF import stf_schema
+    from plot import plotrender
+
+    # the files are already processed in parallel, render the plots without a display in this process
+    stf_schema.PARALLELWORKERS = 1
+    plotrender.setHeadless(workers=1)
+    plotrender.RENDERCACHE = not noCache
+
+    dStatus = {'file': stfFile, 'script': script, 'outdir': outDir, 'status': 'failed', 'epochs': 0, 'seconds': 0., 'message': ''}
+    tStart = time.time()
+
+    os.makedirs(outDir, exist_ok=True)
+    logger = amc.createLoggers(os.path.join(outDir, script + '.py'), logLevels=['CRITICAL', 'DEBUG'])
+
+    try:
+        if script == 'stfgeodetic':
+            dSTF = stfgeodetic.processSTFGeodetic(stfFile=stfFile, GNSSsyst=GNSSsyst, crdMarker=crdMarker, chunkSize=0, noCache=noCache, outDir=outDir, logger=logger)
+            dStatus['epochs'] = dSTF['#epochs']
+        else:
+            dSTF = stfrxstatus.processSTFRxStatus(stfFile=stfFile, GNSSsyst=GNSSsyst, noCache=noCache, outDir=outDir, logger=logger)
+            dStatus['epochs'] = dSTF['Time']['epochs']
+        dStatus['status'] = 'ok'
+    except SystemExit as e:
+        dStatus['message'] = 'exit code {!s}'.format(e.code)
+    except Exception as e:
+        logger.exception(e)
+        dStatus['message'] = repr(e)
+    finally:
+        plt.close('all')
+        for handler in list(logger.handlers):
+            handler.close()
+            logger.removeHandler(handler)
+
+    dStatus['seconds'] = time.time() - tStart
+
+    return dStatus
+
+
+def taskOutDirs(lstTasks: list, outDir: str, logger: logging.Logger) -> list:
+    """
+    returns the output directory of each task, named after the parent directory and name of its file (and the script when a file has several tasks)
+
+    Receivers write files with the same name in different directories, a name still shared by two tasks is refused so that no worker overwrites the output of another.
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    dTasksPerFile = {}
+    for stfFile, script in lstTasks:
+        dTasksPerFile[stfFile] = dTasksPerFile.get(stfFile, 0) + 1
+
+    lstOutDirs = []
+    for stfFile, script in lstTasks:
+        dirName = '{parent:s}_{file:s}'.format(parent=os.path.basename(os.path.dirname(stfFile)), file=os.path.basename(stfFile))
+        if dTasksPerFile[stfFile] > 1:
+            dirName = '{dir:s}-{script:s}'.format(dir=dirName, script=script)
+        lstOutDirs.append(os.path.join(outDir, dirName))
+
+    lstDuplicates = sorted(set(fileOutDir for fileOutDir in lstOutDirs if lstOutDirs.count(fileOutDir) > 1))
+    if lstDuplicates:
+        logger.error('{func:s}: tasks share the output directories {dirs!s}'.format(dirs=lstDuplicates, func=cFuncName))
+        sys.exit(amc.E_INVALID_ARGS)
+
+    return lstOutDirs
+
+
+def runBatch(lstTasks: list, GNSSsyst: str, outDir: str, jobs: int, crdMarker: list, noCache: bool, logger: logging.Logger) -> pd.DataFrame:
+    """
+    distributes the tasks over a pool of worker processes and returns the status per file
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    lstStatus = []
+    with futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        dFutures = {}
+        for (stfFile, script), fileOutDir in zip(lstTasks, taskOutDirs(lstTasks, outDir=outDir, logger=logger)):
+            future = executor.submit(processFile, stfFile, script, GNSSsyst, fileOutDir, crdMarker, noCache)
+            dFutures[future] = (stfFile, script, fileOutDir)
+
+        for future in futures.as_completed(dFutures):
+            stfFile, script, fileOutDir = dFutures[future]
+            try:
+                dStatus = future.result()
+            except Exception as e:
+                # worker process died
+                dStatus = {'file': stfFile, 'script': script, 'outdir': fileOutDir, 'status': 'failed', 'epochs': 0, 'seconds': 0., 'message': repr(e)}
+
+            logger.info('{func:s}: {script:s} {file:s}: {status:s} ({sec:.1f}s)'.format(script=script, file=stfFile, status=colored(dStatus['status'], 'green' if dStatus['status'] == 'ok' else 'red'), sec=dStatus['seconds'], func=cFuncName))
+            lstStatus.append(dStatus)
+
+    dfStatus = pd.DataFrame(lstStatus, columns=['file', 'script', 'status', 'epochs', 'seconds', 'outdir', 'message'])
+
+    return dfStatus.sort_values(['file', 'script']).reset_index(drop=True)
+
+
+def main(argv):
+    """
+    processes the STF files given on the command line or in a manifest in parallel
+    """
+    amc.cBaseName = colored(os.path.basename(__file__), 'yellow')
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    # treat command line options
+    lstPatterns, manifest, GNSSsyst, outDir, jobs, crdMarker, noCache, logLevels = treatCmdOpts(argv)
+
+    # create logging for better debugging
+    logger = amc.createLoggers(os.path.basename(__file__), logLevels=logLevels)
+
+    lstTasks = createTasks(collectFiles(lstPatterns, manifest, logger=logger), logger=logger)
+    if not lstTasks:
+        logger.error('{func:s}: no files to process'.format(func=cFuncName))
+        sys.exit(amc.E_INVALID_ARGS)
+
+    outDir = os.path.abspath(outDir)
+    os.makedirs(outDir, exist_ok=True)
+    logger.info('{func:s}: processing {nr:d} tasks with {jobs:d} workers into {dir:s}'.format(nr=len(lstTasks), jobs=jobs, dir=outDir, func=cFuncName))
+
+    tStart = time.time()
+    dfStatus = runBatch(lstTasks, GNSSsyst=GNSSsyst, outDir=outDir, jobs=jobs, crdMarker=crdMarker, noCache=noCache, logger=logger)
+
+    # report and save the status per file
+    statusFile = os.path.join(outDir, 'batch-status.csv')
+    dfStatus.to_csv(statusFile, index=False)
+    logger.info('{func:s}: status per file (total {sec:.1f}s):\n{status:s}'.format(status=dfStatus[['file', 'script', 'status', 'epochs', 'seconds']].to_string(), sec=time.time() - tStart, func=cFuncName))
+    logger.info('{func:s}: status saved in {file:s}'.format(file=statusFile, func=cFuncName))
+
+    if (dfStatus['status'] != 'ok').any():
+        sys.exit(amc.E_FAILURE)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
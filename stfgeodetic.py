@@ -4,6 +4,8 @@
 import os
 import argparse
 import sys
+import time
+import json
 from termcolor import colored
 import numpy as np
 import pandas as pd
@@ -13,11 +15,37 @@ import utm as UTM
 import am_config as amc
 from ampyutils import amutils
 from GNSS import gpstime
+from GNSS import ecef
+from GNSS import utmzones
+from GNSS import posstats
+from GNSS import geofence
 from SSN import signal_types as ssnst
+from STF import stf_schema
+from STF import sbf_decoder
+from STF import stf_index
+from STF import stf_aggregate
+from STF import stf_pyramid
 from plot import plotcoords
+from plot import plotrender
 
 __author__ = 'amuls'
 
+# columns of the PVTGeodetic STF file used per output, None means all columns
+dOutputColumns = {
+    'csv': None,
+    'plots': ['TOW[s]', 'WNc[week]', 'Error', '2D/3D', 'Latitude[rad]', 'Longitude[rad]', 'Height[m]', 'NrSV', 'SignalInfo'],
+    'stats': ['TOW[s]', 'WNc[week]', 'Error', '2D/3D', 'Latitude[rad]', 'Longitude[rad]', 'Height[m]', 'SignalInfo'],
+    'pyramid': ['TOW[s]', 'WNc[week]', 'Error', '2D/3D', 'Latitude[rad]', 'Longitude[rad]', 'Height[m]', 'NrSV', 'SignalInfo'],
+}
+
+# columns of the aggregated epochs: mean, std, min and max of the values, most common value of the modes
+dAggregateColumns = {
+    'values': ['UTM.E', 'UTM.N', 'Height[m]', 'NrSV', 'dist', 'dist3D', 'ENU.E', 'ENU.N', 'ENU.U'],
+    'modes': ['SignalInfo', '2D/3D', 'Error'],
+}
+
+FOLLOWWINDOW = 3600  # seconds of the most recent epochs plotted when following a growing STF file
+
 
 def treatCmdOpts(argv):
     """
@@ -26,21 +54,33 @@ def treatCmdOpts(argv):
     :param argv: the options (without argv[0])
     :type argv: list of string
     """
-    helpTxt = os.path.basename(__file__) + ' reads in a sbf2stf converted SBF Geodetic-v2 file and make UTM plots'
+    helpTxt = os.path.basename(__file__) + ' reads in a sbf2stf converted SBF Geodetic-v2 file (or the PVTGeodetic blocks of a SBF file) and make UTM plots'
 
     # create the parser for command line arguments
     parser = argparse.ArgumentParser(description=helpTxt)
 
     parser.add_argument('-d', '--dir', help='Directory of SBF file (defaults to .)', required=False, default='.', type=str)
-    parser.add_argument('-f', '--files', help='Filename of PVTGeodetic_v2 file', required=True, type=str)
+    parser.add_argument('-f', '--files', help='Filename of PVTGeodetic_v2 file or SBF file', required=True, type=str)
     parser.add_argument('-g', '--gnss', help='GNSS System Name', required=True, type=str)
+    parser.add_argument('-c', '--chunksize', help='process the STF file in chunks of CHUNKSIZE lines with bounded memory, only writes the CSV file (default 0 reads the whole file)', required=False, default=0, type=int)
+    parser.add_argument('--follow', help='follow the growing STF file, parsing the lines appended to it every FOLLOW seconds and updating the CSV file and plots (default 0, no follow)', required=False, default=0, type=float)
+    parser.add_argument('--utm-zone', help='project all epochs in UTM zone UTMZONE so that the plots stay continuous, 0 uses the zone of the first epoch (default each epoch is projected in its own zone)', required=False, default=None, type=int, dest='utmzone')
+    parser.add_argument('--outputs', help='outputs to create, only the STF columns these need are parsed (default {:s})'.format(colored('csv plots stats', 'green')), nargs='+', required=False, default=['csv', 'plots', 'stats'], choices=list(dOutputColumns))
+    parser.add_argument('--stats-window', help='length in seconds of the rolling windows of the position statistics, advancing by a tenth of their length (default 0, no rolling windows)', required=False, default=0, type=float, dest='statswindow')
+    parser.add_argument('--aggregate', help='aggregate the epochs in buckets of AGGREGATE GPS seconds, the CSV file and plots then use the aggregated epochs (default 0, no aggregation)', required=False, default=0, type=int)
+    parser.add_argument('--zones', help='JSON file with the allow/deny zones (circles or polygons) the epochs are tested against (default no zones)', required=False, default=None, type=str)
+    parser.add_argument('--start', help='only read the epochs from START on, date/time in the time scale of the plots (e.g. 2019-02-14T03:00:00)', required=False, default=None, type=str)
+    parser.add_argument('--end', help='only read the epochs till END, date/time in the time scale of the plots (e.g. 2019-02-14T03:20:00)', required=False, default=None, type=str)
+    parser.add_argument('--density', help='draw the trajectories as a density raster instead of a marker per epoch (default only from {:d} epochs on)'.format(plotcoords.DENSITYEPOCHS), required=False, action='store_true')
+    parser.add_argument('--headless', help='render the plots without display (Agg backend), in parallel worker processes, and do not show them', required=False, action='store_true')
+    parser.add_argument('--no-cache', help='do not use (nor create) the parse cache of the STF file and the render cache of the plots', required=False, action='store_true', dest='nocache')
     parser.add_argument('-m', '--marker', help='Geodetic coordinates (lat,lon,ellH) of reference point in degrees: ["50.8440152778" "4.3929283333" "151.39179"] for RMA, ["50.93277777", "4.46258333", "123"] for Peutie, default ["0", "0", "0"] means use mean position', nargs=3, type=str, required=False, default=["0", "0", "0"])
 
     parser.add_argument('-l', '--logging', help='specify logging level console/file (default {:s})'.format(colored('INFO DEBUG', 'green')), nargs=2, required=False, default=['INFO', 'DEBUG'], choices=['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG', 'NOTSET'])
 
     args = parser.parse_args()
 
-    return args.dir, args.files, args.gnss, args.marker, args.logging
+    return args.dir, args.files, args.gnss, args.marker, args.utmzone, args.chunksize, args.follow, args.outputs, args.statswindow, args.aggregate, args.zones, args.start, args.end, args.nocache, args.density, args.headless, args.logging
 
 
 def checkExistenceArgs(stfDir: str, stfFile: str, logger: logging.Logger) -> str:
@@ -70,96 +110,181 @@ def checkExistenceArgs(stfDir: str, stfFile: str, logger: logging.Logger) -> str
     return wdir
 
 
-def readSTFGeodetic(stfFile: str, logger: logging.Logger) -> pd.DataFrame:
+def defineZones(logger: logging.Logger):
     """
-    read in the STF Geodetic_v2 file using included header information
+    reads the allow/deny zones from the zones file and adds them with their UTM coordinates and their geofence geometry to dSTF
+
+    With --utm-zone 0 the zones are projected by deriveGeodeticColumns, once the zone of the first epoch is known.
     """
     cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
 
-    # read in the file with in
-    logger.info('{func:s}: reading file {file:s}'.format(file=stfFile, func=cFuncName))
-    dfSTF = pd.read_csv(stfFile, sep=',', skiprows=range(1, 2))
-    amutils.logHeadTailDataFrame(df=dfSTF, dfName=dSTF['stf'], callerName=cFuncName, logger=logger)
-    dfSTF.dropna(subset=['Latitude[rad]', 'Longitude[rad]'], inplace=True)
-    amutils.logHeadTailDataFrame(df=dfSTF, dfName=dSTF['stf'], callerName=cFuncName, logger=logger)
-    dfSTF.reset_index(inplace=True)
+    dSTF['zones'] = {}
+    dSTF['geofence'] = None
+    if dSTF['zonesfile'] is None:
+        return
 
     # zone definition
-    dZone = {}
-    dZone['allow'] = {'lat': 50.934519, 'lon': 4.466130, 'radius': 300}
-    dZone['deny'] = {'lat': 50.934877, 'lon': 4.466280, 'radius': 200}
-
-    # convert lat/lon to UTM
-    for zone, zone_crd in dZone.items():
-        dZone[zone]['UTM.E'], dZone[zone]['UTM.N'], dZone[zone]['UTM.Z'], dZone[zone]['UTM.L'] = UTM.from_latlon(dZone[zone]['lat'], dZone[zone]['lon'])
+    try:
+        dZone = geofence.loadZones(dSTF['zonesfile'])
+    except (OSError, ValueError) as e:
+        logger.error('{func:s}: can not read zones from {file:s}: {err!s}'.format(file=colored(dSTF['zonesfile'], 'red'), err=e, func=cFuncName))
+        sys.exit(amc.E_FILE_NOT_ACCESSIBLE)
+    logger.info('{func:s}: read zones {zones!s} from {file:s}'.format(zones=list(dZone), file=dSTF['zonesfile'], func=cFuncName))
 
     # add to dict dStf
     dSTF['zones'] = dZone
+    dSTF['geofence'] = geofence.compileZones(dZone)
+    if dSTF['utmzone'] != 0:
+        projectZones()
+
+
+def projectZones():
+    """
+    converts the lat/lon of the zones to UTM in the common zone of the epochs (if set), so that they line up with the plotted trajectory
+    """
+    for zone, zone_crd in dSTF['zones'].items():
+        if 'polygon' in zone_crd:
+            latLon = np.array(zone_crd['polygon'], dtype=float)
+            E, N, _, _ = utmzones.projectUTM(latLon[:, 0], latLon[:, 1], zone=dSTF['utmzone'])
+            zone_crd['UTM.polygon'] = np.column_stack([E, N])
+        else:
+            zone_crd['UTM.E'], zone_crd['UTM.N'], zone_crd['UTM.Z'], zone_crd['UTM.L'] = UTM.from_latlon(zone_crd['lat'], zone_crd['lon'], force_zone_number=dSTF['utmzone'])
+
 
+def projectMarker():
+    """
+    converts the lat/lon of the marker to UTM in the common zone of the epochs (if set and known)
+    """
+    dMarker = dSTF['marker']
+    if np.isnan(dMarker['lat']):
+        dMarker['UTM.E'] = dMarker['UTM.N'] = np.NaN
+        dMarker['UTM.Z'] = dMarker['UTM.L'] = ''
+    else:
+        dMarker['UTM.E'], dMarker['UTM.N'], dMarker['UTM.Z'], dMarker['UTM.L'] = UTM.from_latlon(dMarker['lat'], dMarker['lon'], force_zone_number=dSTF['utmzone'] or None)
+
+
+def deriveGeodeticColumns(dfSTF: pd.DataFrame) -> pd.DataFrame:
+    """
+    adds lat/lon in degrees, GNSS time, UTM coordinates, ENU coordinates, distance to marker and zone membership to (a chunk of) the PVTGeodetic dataframe
+    """
     dfSTF['lat'] = np.degrees(dfSTF['Latitude[rad]'])
     dfSTF['lon'] = np.degrees(dfSTF['Longitude[rad]'])
     # convert the GPS time to UTC
-    dfSTF['time'] = dfSTF.apply(lambda x: gpstime.UTCFromWT(x['WNc[week]'], x['TOW[s]']), axis=1)
+    dfSTF['time'] = gpstime.UTCFromWTArray(dfSTF['WNc[week]'].to_numpy(), dfSTF['TOW[s]'].to_numpy())
+
+    # add UTM coordinates, each epoch in its own zone unless a common zone is set (0 selects the zone of the first epoch)
+    if dSTF['utmzone'] == 0:
+        dSTF['utmzone'] = int(utmzones.zoneNumbers(dfSTF['lat'].iloc[0], dfSTF['lon'].iloc[0]))
+        projectZones()
+        projectMarker()
+    dfSTF['UTM.E'], dfSTF['UTM.N'], dfSTF['UTM.Z'], dfSTF['UTM.L'] = utmzones.projectUTM(dfSTF['lat'].to_numpy(), dfSTF['lon'].to_numpy(), zone=dSTF['utmzone'])
+
+    # local East/North/Up coordinates relative to the marker and the horizontal & 3D distance to it, independent of the UTM zones
+    enu = ecef.geodetic2ENU(dfSTF['Latitude[rad]'].to_numpy(), dfSTF['Longitude[rad]'].to_numpy(), dfSTF['Height[m]'].to_numpy(), lat0=np.radians(dSTF['marker']['lat']), lon0=np.radians(dSTF['marker']['lon']), ellH0=dSTF['marker']['ellH'])
+    dfSTF['dist'], dfSTF['dist3D'] = ecef.distances(enu)
+    dfSTF['ENU.E'], dfSTF['ENU.N'], dfSTF['ENU.U'] = enu[:, 0], enu[:, 1], enu[:, 2]
+
+    # membership of the allow/deny zones
+    if dSTF['geofence'] is not None:
+        inside = geofence.zoneMembership(dSTF['geofence'], dfSTF['Latitude[rad]'].to_numpy(), dfSTF['Longitude[rad]'].to_numpy())
+        for i, zone in enumerate(dSTF['geofence']['names']):
+            dfSTF['zone.' + zone] = inside[:, i]
+
+    return dfSTF
+
+
+def initSummary() -> dict:
+    """
+    creates the accumulator for the summary information about the PVTGeodetic epochs
+    """
+    dSummary = {}
+    dSummary['epochs'] = 0
+    dSummary['first'] = None
+    dSummary['last'] = None
+    dSummary['sigTypes'] = {}  # used as ordered set, keeps order of appearance
+    dSummary['errCodes'] = set()
+    dSummary['utmZones'] = set()
+    dSummary['stats'] = None if dSTF['statswindow'] is None else posstats.initStats(window=dSTF['statswindow'])
+    dSummary['zones'] = None if dSTF['geofence'] is None else geofence.initEvents(dSTF['geofence'])
+    dSummary['written'] = {}  # number of rows written per CSV file appended to by storeSummary
+
+    return dSummary
+
+
+def updateSummary(dSummary: dict, dfSTF: pd.DataFrame):
+    """
+    accumulates the summary information of (a chunk of) the PVTGeodetic dataframe
+    """
+    if dfSTF.shape[0] == 0:
+        return
+
+    dSummary['epochs'] += dfSTF.shape[0]
+    if dSummary['first'] is None:
+        dSummary['first'] = dfSTF.time.iloc[0]
+    dSummary['last'] = dfSTF.time.iloc[-1]
+
+    for sigType in dfSTF.SignalInfo.unique():
+        dSummary['sigTypes'].setdefault(sigType, None)
+    dSummary['errCodes'].update(dfSTF.Error.unique())
+    dSummary['utmZones'].update(dfSTF['UTM.Z'].unique().tolist())
+    if dSummary['stats'] is not None:
+        posstats.updateStats(dSummary['stats'], dfSTF)
+    if dSummary['zones'] is not None:
+        inside = dfSTF[['zone.' + zone for zone in dSTF['geofence']['names']]].to_numpy(dtype=bool)
+        geofence.updateEvents(dSummary['zones'], dSTF['geofence'], inside, dfSTF)
+
+
+def appendCSV(df: pd.DataFrame, csvFile: str, dSummary: dict):
+    """
+    appends the rows of df to csvFile, which is created with its header at the first call, continuing the row numbering of the previous calls
+    """
+    rows = dSummary['written'].get(csvFile)
+    df.index = pd.RangeIndex(start=rows or 0, stop=(rows or 0) + df.shape[0])
+    df.to_csv(csvFile, mode='w' if rows is None else 'a', header=(rows is None))
+    dSummary['written'][csvFile] = (rows or 0) + df.shape[0]
 
-    # add UTM coordinates
-    dfSTF['UTM.E'], dfSTF['UTM.N'], dfSTF['UTM.Z'], dfSTF['UTM.L'] = UTM.from_latlon(dfSTF['lat'].to_numpy(), dfSTF['lon'].to_numpy())
 
-    # calculate distance to st-Niklass 51.1577189  4.1915975
-    dfSTF['dist'] = np.linalg.norm(dfSTF[['UTM.E', 'UTM.N']].sub(np.array([dSTF['marker']['UTM.E'], dSTF['marker']['UTM.N']])), axis=1)
-    # dfSTF['dist2'] = np.linalg.norm([dfSTF['UTM.E'].iloc[0], dfSTF['UTM.N'].iloc[0]] - [dSTF['marker']['UTM.E'], dSTF['marker']['UTM.N']])
+def storeSummary(dSummary: dict, logger: logging.Logger, append: bool = False, final: bool = True):
+    """
+    adds the accumulated information about time, signal types and PVT error codes to dSTF
+
+    When append is set (following a growing file), only the rolling windows and zone events added since the previous call are appended to their CSV files, and when final is not set the rolling window of the last (possibly incomplete) step is kept for a later call.
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
 
     # add info to dSTF about time
     dTime = {}
-    dTime['epochs'] = dfSTF.shape[0]
-    dTime['date'] = dfSTF.time.iloc[0].strftime('%d %b %Y')
-    dTime['start'] = dfSTF.time.iloc[0].strftime('%H:%M:%S')
-    dTime['end'] = dfSTF.time.iloc[-1].strftime('%H:%M:%S')
+    dTime['epochs'] = dSummary['epochs']
+    dTime['date'] = dSummary['first'].strftime('%d %b %Y')
+    dTime['start'] = dSummary['first'].strftime('%H:%M:%S')
+    dTime['end'] = dSummary['last'].strftime('%H:%M:%S')
     dSTF['Time'] = dTime
 
     # add info to dSTF about #epochs
-    dSTF['#epochs'] = dfSTF.shape[0]
+    dSTF['#epochs'] = dSummary['epochs']
+
+    # add info to dSTF about the UTM zones used
+    dSTF['utmzones'] = sorted(dSummary['utmZones'])
+    if len(dSTF['utmzones']) > 1:
+        logger.warning('{func:s}: epochs are projected in UTM zones {zones!s}, use --utm-zone for continuous plots'.format(zones=dSTF['utmzones'], func=cFuncName))
 
     # add info to dSTF about used signal types used
     dST = {}
-    sigTypes = dfSTF.SignalInfo.unique()
+    sigTypes = np.array(list(dSummary['sigTypes']))
     logger.info('{func:s}: found nav-signals {sigt!s}'.format(sigt=sigTypes, func=cFuncName))
-    for i, sigType in enumerate(sigTypes):
-        logger.debug('{func:s}: searching name for sig-type {st!s}'.format(st=sigType, func=cFuncName))
-
-        sigTypeNames = []
-
-        for k, v in ssnst.dSigType.items():
-            # logger.debug('{func:s}: checking presence of signal {sig!s}'.format(sig=v, func=cFuncName))
-            # logger.debug('{func:s}: bin(sigType) = {st!s}'.format(st=bin(sigType), func=cFuncName))
-            # logger.debug('{func:s}: bin(0b1 << k) = {ssnst!s}'.format(ssnst=bin(0b1 << k), func=cFuncName))
-            # logger.debug('{func:s}: bin(bin(sigType) & bin(0b1 << k)) = {binops!s})'.format(binops=bin(sigType & (0b1 << k)), func=cFuncName))
-            # logger.debug('{func:s}: binary check sigtype = {st!s} - ssn = {ssnst!s} operator and = {opsbin!s}'.format(st=bin(sigType), ssnst=bin(0b1 << k), opsbin=bin(sigType & (0b1 << k)), func=cFuncName))
-            # logger.debug('-' * 10)
-
-            if (sigType & (0b1 << k)) != 0:
-                logger.info('{func:s}: found signal {ssnst:s}'.format(ssnst=v, func=cFuncName))
-                # add name to the used signal types
-                sigTypeNames.append(v)
+    dSigNames = ssnst.signalNamesMap(sigTypes)
+    for sigType in sigTypes:
+        logger.info('{func:s}: sig-type {st!s} uses signals {names!s}'.format(st=sigType, names=dSigNames[int(sigType)], func=cFuncName))
 
         # add signal to the dST dict
-        dST[sigType] = sigTypeNames
-
-        # nrBitsSet = ssnst.countSetBits(sigType)
-        # lst1Bits = ssnst.findAllSetBits(sigType, nrBitsSet)
-
-        # # get the name of the signals
-        # stName = ssnst.dSigType[lst1Bits[0]]
-        # if nrBitsSet > 1:
-        #     for j in lst1Bits[1:]:
-        #         stName += '+' + ssnst.dSigType[j]
-        # dST[sigType] = stName
+        dST[sigType] = list(dSigNames[int(sigType)])
 
     dSTF['signals'] = dST
     logger.info('{func:s}: found signals {signals!s}'.format(signals=dSTF['signals'], func=cFuncName))
 
     # find out what PVT error codess we have
     dErrCodes = {}
-    errCodes = list(set(dfSTF.Error.unique()))
+    errCodes = list(dSummary['errCodes'])
     for errCode in errCodes:
         logger.debug('{func:s}: searching name for error codes {errc:d}'.format(errc=errCode, func=cFuncName))
 
@@ -173,21 +298,322 @@ def readSTFGeodetic(stfFile: str, logger: logging.Logger) -> pd.DataFrame:
 
     logger.info('{func:s}: found error codes {errc!s}'.format(errc=errCodes, func=cFuncName))
 
+    if dSummary['stats'] is not None:
+        storePositionStats(dSummary['stats'], logger=logger, dAppend=dSummary if append else None, final=final)
+    if dSummary['zones'] is not None:
+        storeZoneEvents(dSummary['zones'], logger=logger, dAppend=dSummary if append else None)
+
+
+def storeZoneEvents(dEvents: dict, logger: logging.Logger, dAppend: dict = None):
+    """
+    adds per zone the number of (suppressed) epochs inside it and of enter/exit events to dSTF and saves the events as CSV file, or appends the new events to it when the summary dAppend is given
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    dSTF['zonesummary'] = geofence.eventsSummary(dEvents, dSTF['geofence'])
+    for zone, dZoneSummary in dSTF['zonesummary'].items():
+        logger.info('{func:s}: zone {zone:s}: {summ!s}'.format(zone=zone, summ=dZoneSummary, func=cFuncName))
+
+    dSTF['zonescsv'] = os.path.splitext(dSTF['csv'])[0] + '-zones.csv'
+    if dAppend is None:
+        geofence.eventsFrame(dEvents).to_csv(dSTF['zonescsv'])
+    else:
+        appendCSV(geofence.popEvents(dEvents), dSTF['zonescsv'], dSummary=dAppend)
+    logger.info('{func:s}: saved zone enter/exit events to {csv:s}'.format(csv=dSTF['zonescsv'], func=cFuncName))
+
+
+def storePositionStats(dStats: dict, logger: logging.Logger, dAppend: dict = None, final: bool = True):
+    """
+    adds the position statistics over all epochs and per SignalInfo and 2D/3D group to dSTF and saves them as JSON file, and those of the rolling windows as CSV file
+
+    When the summary dAppend is given, the new rolling windows are appended to the CSV file, up to the last step when final is set and else up to the step before it.
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    dPosStats = {}
+    dPosStats['all'] = posstats.statistics(dStats['all'], dMarker=dSTF['marker'])
+    dPosStats['groups'] = {}
+    for (sigType, mode), dAcc in sorted(dStats['groups'].items()):
+        dPosStats['groups'][(int(sigType), int(mode))] = posstats.statistics(dAcc, dMarker=dSTF['marker'])
+    dSTF['stats'] = dPosStats
+    logger.info('{func:s}: position statistics of all epochs {stats!s}'.format(stats=dPosStats['all'], func=cFuncName))
+
+    # machine readable summary, a list entry per SignalInfo and 2D/3D group
+    dSummary = {}
+    dSummary['stf'] = dSTF['stf']
+    dSummary['marker'] = {crd: None if np.isnan(dSTF['marker'][crd]) else dSTF['marker'][crd] for crd in ['lat', 'lon', 'ellH']}
+    dSummary['all'] = dPosStats['all']
+    dSummary['groups'] = [dict({'SignalInfo': sigType, 'signals': ssnst.signalLabel(sigType), '2D/3D': mode}, **dGroupStats) for (sigType, mode), dGroupStats in dPosStats['groups'].items()]
+    dSTF['statsjson'] = os.path.splitext(dSTF['csv'])[0] + '-stats.json'
+    with open(dSTF['statsjson'], 'w') as fd:
+        json.dump(dSummary, fd, indent=2)
+    logger.info('{func:s}: saved position statistics to {json:s}'.format(json=dSTF['statsjson'], func=cFuncName))
+
+    if dStats['window'] > 0:
+        dSTF['statscsv'] = os.path.splitext(dSTF['csv'])[0] + '-stats-window.csv'
+        if dAppend is None:
+            posstats.rollingStats(dStats, dMarker=dSTF['marker']).to_csv(dSTF['statscsv'])
+        elif dStats['steps']:
+            lastStep = max(dStats['steps']) - (0 if final else 1)
+            appendCSV(posstats.rollingStats(dStats, dMarker=dSTF['marker'], lastStep=lastStep), dSTF['statscsv'], dSummary=dAppend)
+        logger.info('{func:s}: saved position statistics of the rolling windows of {win:.0f}s to {csv:s}'.format(win=dStats['window'], csv=dSTF['statscsv'], func=cFuncName))
+
+
+def readSTFGeodetic(stfFile: str, logger: logging.Logger, useCache: bool = True, usecols: list = None, start: str = None, end: str = None) -> pd.DataFrame:
+    """
+    read in the STF Geodetic_v2 file using included header information, only parsing the columns usecols (default all) of the epochs between start and end (default all)
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    # read in the file with in
+    logger.info('{func:s}: reading file {file:s}'.format(file=stfFile, func=cFuncName))
+    dfSTF = stf_index.readSTFRange(stfFile, dSchema=stf_schema.dPVTGeodetic2, logger=logger, start=start, end=end, useCache=useCache, sbfBlock=sbf_decoder.SBF_PVTGEODETIC, usecols=usecols)
+    amutils.logHeadTailDataFrame(df=dfSTF, dfName=dSTF['stf'], callerName=cFuncName, logger=logger)
+    dfSTF.dropna(subset=['Latitude[rad]', 'Longitude[rad]'], inplace=True)
+    amutils.logHeadTailDataFrame(df=dfSTF, dfName=dSTF['stf'], callerName=cFuncName, logger=logger)
+    dfSTF.reset_index(inplace=True)
+    dfSTF = stf_schema.compactDtypes(dfSTF, dSchema=stf_schema.dPVTGeodetic2)
+    dSTF['memory'] = stf_schema.logMemoryReport(df=dfSTF, dfName=dSTF['stf'], callerName=cFuncName, logger=logger)
+
+    # zone definition
+    defineZones(logger=logger)
+
+    # add lat/lon, time, UTM and distance to marker
+    dfSTF = deriveGeodeticColumns(dfSTF)
+
+    # add info to dSTF about time, signal types and error codes
+    dSummary = initSummary()
+    updateSummary(dSummary, dfSTF)
+    storeSummary(dSummary, logger=logger)
+
     # inform user
     logger.info('{func:s}: read STF file {file:s}, added UTM coordiantes and GNSS time'.format(file=stfFile, func=cFuncName))
 
     return dfSTF
 
 
+def aggregateColumns(dfGeod: pd.DataFrame) -> tuple:
+    """
+    returns the value and mode columns of dAggregateColumns present in the PVTGeodetic dataframe
+    """
+    return [col for col in dAggregateColumns['values'] if col in dfGeod.columns], [col for col in dAggregateColumns['modes'] if col in dfGeod.columns]
+
+
+def aggregateGeodetic(dfGeod: pd.DataFrame, aggregate: int, logger: logging.Logger) -> pd.DataFrame:
+    """
+    returns the PVTGeodetic epochs aggregated in buckets of aggregate GPS seconds
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    valueCols, modeCols = aggregateColumns(dfGeod)
+    dfAgg = stf_aggregate.aggregateFrame(dfGeod, binSeconds=aggregate, valueCols=valueCols, modeCols=modeCols)
+    logger.info('{func:s}: aggregated {epochs:d} epochs in {nr:d} buckets of {sec:d}s'.format(epochs=dfGeod.shape[0], nr=dfAgg.shape[0], sec=aggregate, func=cFuncName))
+
+    return dfAgg
+
+
+def storePyramid(dLevels: dict, logger: logging.Logger):
+    """
+    stores the pyramid levels of the aggregated values in the pyramid directory next to the csv file
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    stf_pyramid.storePyramid(dSTF['pyramid'], dLevels, valueCols=dSTF['pyramidvalues'])
+    logger.info('{func:s}: stored pyramid of levels {levels!s}s in {dir:s}'.format(levels=sorted(dLevels), dir=dSTF['pyramid'], func=cFuncName))
+
+
+def readSTFGeodeticChunked(stfFile: str, csvFile: str, chunkSize: int, logger: logging.Logger, aggregate: int = 0, pyramid: bool = False, usecols: list = None) -> pd.DataFrame:
+    """
+    reads the STF Geodetic_v2 file in chunks of chunkSize lines, only parsing the columns usecols (default all), derives the added columns per chunk and appends them to csvFile (if not None), so that memory use is independent of the file length
+
+    When aggregate is given, the chunks are aggregated in buckets of aggregate GPS seconds instead and the aggregated epochs are returned (and saved in csvFile).
+    When pyramid is set, the levels of the pyramid of each chunk are merged into the running levels, which are stored at the end.
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    logger.info('{func:s}: reading file {file:s} in chunks of {size:d} lines'.format(file=stfFile, size=chunkSize, func=cFuncName))
+
+    # zone definition
+    defineZones(logger=logger)
+
+    dSummary = initSummary()
+    nrChunks = 0
+    dPartial = None  # running aggregation of the chunks read
+    dLevels = None  # running pyramid levels of the chunks read
+    valueCols = modeCols = None  # aggregated columns, taken from the first chunk with derived columns
+
+    for dfChunk in stf_schema.readSTFTyped(stfFile, dSchema=stf_schema.dPVTGeodetic2, chunksize=chunkSize, usecols=usecols):
+        dfChunk.dropna(subset=['Latitude[rad]', 'Longitude[rad]'], inplace=True)
+        # keep the original line index as done by readSTFGeodetic and continue the row numbering over the chunks
+        dfChunk.reset_index(inplace=True)
+        dfChunk.index = pd.RangeIndex(start=dSummary['epochs'], stop=dSummary['epochs'] + dfChunk.shape[0])
+        if dfChunk.shape[0] == 0:
+            continue
+        dfChunk = stf_schema.compactDtypes(dfChunk, dSchema=stf_schema.dPVTGeodetic2)
+        if nrChunks == 0:
+            dSTF['memory'] = stf_schema.logMemoryReport(df=dfChunk, dfName=dSTF['stf'], callerName=cFuncName, logger=logger)
+
+        dfChunk = deriveGeodeticColumns(dfChunk)
+        if valueCols is None:
+            valueCols, modeCols = aggregateColumns(dfChunk)
+
+        # append to the csv file, the header is only written for the first chunk
+        if aggregate > 0:
+            dChunkPartial = stf_aggregate.aggregate(dfChunk, binSeconds=aggregate, valueCols=valueCols, modeCols=modeCols)
+            dPartial = dChunkPartial if dPartial is None else stf_aggregate.mergePartials([dPartial, dChunkPartial], valueCols=valueCols)
+        elif csvFile is not None:
+            dfChunk.to_csv(csvFile, mode='w' if nrChunks == 0 else 'a', header=(nrChunks == 0))
+        if pyramid:
+            dSTF['pyramidvalues'] = valueCols
+            dChunkLevels = stf_pyramid.buildLevels(dfChunk, valueCols=dSTF['pyramidvalues'])
+            dLevels = dChunkLevels if dLevels is None else stf_pyramid.mergeLevels([dLevels, dChunkLevels], valueCols=dSTF['pyramidvalues'])
+
+        updateSummary(dSummary, dfChunk)
+        nrChunks += 1
+        logger.debug('{func:s}: processed chunk {nr:d}, total epochs {epochs:d}'.format(nr=nrChunks, epochs=dSummary['epochs'], func=cFuncName))
+
+    if nrChunks == 0:
+        logger.error('{func:s}: no valid epochs found in {file:s}'.format(file=colored(stfFile, 'red'), func=cFuncName))
+        sys.exit(amc.E_FAILURE)
+
+    storeSummary(dSummary, logger=logger)
+    if pyramid:
+        storePyramid(dLevels, logger=logger)
+
+    dfAgg = None
+    if aggregate > 0:
+        dfAgg = stf_aggregate.finalize(dPartial, valueCols=valueCols, modeCols=modeCols)
+        if csvFile is not None:
+            dfAgg.to_csv(csvFile)
+        logger.info('{func:s}: aggregated {epochs:d} epochs in {nr:d} buckets of {sec:d}s'.format(epochs=dSummary['epochs'], nr=dfAgg.shape[0], sec=aggregate, func=cFuncName))
+
+    logger.info('{func:s}: streamed STF file {file:s} in {nr:d} chunks to {csv!s}'.format(file=stfFile, nr=nrChunks, csv=csvFile, func=cFuncName))
+
+    return dfAgg
+
+
+def initFollow(stfFile: str, outputs: list) -> dict:
+    """
+    creates the state kept between the updates when following a growing STF file
+    """
+    dFollow = {}
+    dFollow['outputs'] = outputs
+    dFollow['columns'] = stf_schema.readHeader(stfFile)
+    dFollow['usecols'] = stf_schema.projectColumns(dOutputColumns, outputs)
+    dFollow['offset'] = stf_schema.dataOffset(stfFile)  # byte offset of the first line not yet parsed
+    dFollow['lines'] = 0  # number of data lines parsed
+    dFollow['summary'] = initSummary()
+    dFollow['plot'] = None  # plotted columns of the epochs of the last FOLLOWWINDOW seconds
+
+    return dFollow
+
+
+def updateSTFGeodetic(stfFile: str, csvFile: str, dFollow: dict, logger: logging.Logger) -> int:
+    """
+    parses the complete lines appended to the STF file since the last update, derives their added columns and appends them to csvFile
+
+    Only the appended lines are read, so that the cost of an update depends on the number of new lines and not on the file length.
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    # the STF file has been truncated or recreated, start all over again
+    if os.path.getsize(stfFile) < dFollow['offset']:
+        logger.warning('{func:s}: {file:s} has been truncated, restarting from its beginning'.format(file=colored(stfFile, 'red'), func=cFuncName))
+        dFollow.update(initFollow(stfFile, outputs=dFollow['outputs']))
+
+    with open(stfFile, 'rb') as fd:
+        fd.seek(dFollow['offset'])
+        data = fd.read()
+
+    # a partially written last line is parsed at the next update
+    data = data[:data.rfind(b'\n') + 1]
+    if len(data) == 0:
+        return 0
+    dFollow['offset'] += len(data)
+
+    dfNew = stf_schema.readSTFLines(data, columns=dFollow['columns'], dSchema=stf_schema.dPVTGeodetic2, usecols=dFollow['usecols'])
+    # continue the line and row numbering of the previous updates as done by readSTFGeodetic
+    dfNew.index = pd.RangeIndex(start=dFollow['lines'], stop=dFollow['lines'] + dfNew.shape[0])
+    dFollow['lines'] += dfNew.shape[0]
+    dfNew.dropna(subset=['Latitude[rad]', 'Longitude[rad]'], inplace=True)
+    dfNew.reset_index(inplace=True)
+    dfNew.index = pd.RangeIndex(start=dFollow['summary']['epochs'], stop=dFollow['summary']['epochs'] + dfNew.shape[0])
+    if dfNew.shape[0] == 0:
+        return 0
+    dfNew = stf_schema.compactDtypes(dfNew, dSchema=stf_schema.dPVTGeodetic2)
+
+    if dFollow['summary']['epochs'] == 0:
+        dSTF['memory'] = stf_schema.logMemoryReport(df=dfNew, dfName=dSTF['stf'], callerName=cFuncName, logger=logger)
+    dfNew = deriveGeodeticColumns(dfNew)
+
+    # the csv file is (re)created at the first update
+    if 'csv' in dFollow['outputs']:
+        dfNew.to_csv(csvFile, mode='w' if dFollow['summary']['epochs'] == 0 else 'a', header=(dFollow['summary']['epochs'] == 0))
+
+    updateSummary(dFollow['summary'], dfNew)
+    if 'plots' in dFollow['outputs']:
+        # only the epochs of the last FOLLOWWINDOW seconds are kept, so that the plots take bounded memory and time
+        dfPlot = pd.concat([dFollow['plot'], dfNew[['time', 'UTM.E', 'UTM.N', 'Height[m]', 'NrSV', 'SignalInfo', 'dist', '2D/3D', 'Error']]])
+        dFollow['plot'] = dfPlot[dfPlot['time'] > dfPlot['time'].iloc[-1] - pd.Timedelta(seconds=FOLLOWWINDOW)].reset_index(drop=True)
+
+    logger.info('{func:s}: parsed {nr:d} new epochs, total epochs {epochs:d}'.format(nr=dfNew.shape[0], epochs=dFollow['summary']['epochs'], func=cFuncName))
+
+    return dfNew.shape[0]
+
+
+def followSTFGeodetic(stfFile: str, csvFile: str, interval: float, outputs: list, logger: logging.Logger):
+    """
+    follows the growing STF file, every interval seconds the appended lines are added to csvFile and the summary, and the plots of the last FOLLOWWINDOW seconds are recreated
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    logger.info('{func:s}: following file {file:s} every {sec:.1f}s (stop with Ctrl-C)'.format(file=stfFile, sec=interval, func=cFuncName))
+
+    # zone definition
+    defineZones(logger=logger)
+
+    dFollow = initFollow(stfFile, outputs=outputs)
+    try:
+        while True:
+            if updateSTFGeodetic(stfFile=stfFile, csvFile=csvFile, dFollow=dFollow, logger=logger) > 0:
+                storeSummary(dFollow['summary'], logger=logger, append=True, final=False)
+                if 'plots' in outputs:
+                    plotSTFGeodetic(dfGeod=dFollow['plot'], logger=logger)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        # report the rolling window of the last step
+        if dFollow['summary']['epochs'] > 0:
+            storeSummary(dFollow['summary'], logger=logger, append=True, final=True)
+        logger.info('{func:s}: stopped following {file:s} after {epochs:d} epochs'.format(file=stfFile, epochs=dFollow['summary']['epochs'], func=cFuncName))
+
+
+def plotSTFGeodetic(dfGeod: pd.DataFrame, logger: logging.Logger):
+    """
+    creates the trajectory and UTM coordinates plots
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    # group the rows per signal type, 2D/3D mode and error code once for all plots
+    dGroups = plotcoords.groupCoords(dfGeod)
+
+    logger.info('{func:s}: information:\n{dict!s}'.format(dict=amutils.pretty(dSTF), func=cFuncName))
+
+    # the trajectory with suppressed epochs, the UTM coordinates and #SVs and the trajectory are independent figures, rendered in parallel when headless
+    lstFigures = []
+    lstFigures.append((plotcoords.plotUTMSuppressed, {'dStf': dSTF, 'dfCrd': dfGeod[['time', 'UTM.E', 'UTM.N', 'Error']], 'logger': logger, 'dGroups': dGroups}))
+    lstFigures.append((plotcoords.plotUTMCoords, {'dStf': dSTF, 'dfCrd': dfGeod[['time', 'UTM.E', 'UTM.N', 'Height[m]', 'NrSV', 'SignalInfo', 'dist', '2D/3D']], 'logger': logger, 'dGroups': dGroups}))
+    lstFigures.append((plotcoords.plotUTMScatter, {'dStf': dSTF, 'dfCrd': dfGeod[['time', 'UTM.E', 'UTM.N', 'SignalInfo', '2D/3D']], 'logger': logger, 'dGroups': dGroups}))
+    plotrender.renderFigures(lstFigures, logger=logger)
+
+
 def main(argv):
     """
     creates a combined SBF file from hourly or six-hourly SBF files
     """
     amc.cBaseName = colored(os.path.basename(__file__), 'yellow')
-    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
 
     # treat command line options
-    dirSTF, fileSTF, GNSSsyst, crdMarker, logLevels = treatCmdOpts(argv)
+    dirSTF, fileSTF, GNSSsyst, crdMarker, utmZone, chunkSize, follow, outputs, statsWindow, aggregate, zonesFile, start, end, noCache, density, headless, logLevels = treatCmdOpts(argv)
 
     # create logging for better debugging
     logger = amc.createLoggers(os.path.basename(__file__), dir=dirSTF, logLevels=logLevels)
@@ -195,25 +621,40 @@ def main(argv):
     # check if arguments are accepted
     workDir = checkExistenceArgs(stfDir=dirSTF, stfFile=fileSTF, logger=logger)
 
+    if headless:
+        plotrender.setHeadless()
+    plotrender.RENDERCACHE = not noCache
+
+    # process the STF file and put results in the working directory
+    processSTFGeodetic(stfFile=fileSTF, GNSSsyst=GNSSsyst, crdMarker=crdMarker, chunkSize=chunkSize, noCache=noCache, outDir=workDir, logger=logger, follow=follow, outputs=outputs, start=start, end=end, utmZone=utmZone, statsWindow=statsWindow, zonesFile=zonesFile, aggregate=aggregate, density=density)
+
+
+def processSTFGeodetic(stfFile: str, GNSSsyst: str, crdMarker: list, chunkSize: int, noCache: bool, outDir: str, logger: logging.Logger, follow: float = 0, outputs: list = ('csv', 'plots', 'stats'), start: str = None, end: str = None, utmZone: int = None, statsWindow: float = 0, zonesFile: str = None, aggregate: int = 0, density: bool = False) -> dict:
+    """
+    reads the PVTGeodetic STF (or SBF) file (between start and end), saves it as CSV file in outDir and creates the plots in outDir/png (as selected by outputs)
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
     # create dictionary with the current info
     global dSTF
     dSTF = {}
-    dSTF['dir'] = workDir
+    dSTF['dir'] = outDir
     dSTF['gnss'] = GNSSsyst
-    dSTF['stf'] = fileSTF
+    dSTF['stf'] = stfFile
+    dSTF['utmzone'] = utmZone
+    dSTF['statswindow'] = statsWindow if 'stats' in outputs else None  # None when no position statistics are made
+    dSTF['zonesfile'] = zonesFile
+    dSTF['density'] = density
 
     # set the reference point
     dMarker = {}
     dMarker['lat'], dMarker['lon'], dMarker['ellH'] = map(float, crdMarker)
     if [dMarker['lat'], dMarker['lon'], dMarker['ellH']] == [0, 0, 0]:
         dMarker['lat'] = dMarker['lon'] = dMarker['ellH'] = np.NaN
-        dMarker['UTM.E'] = dMarker['UTM.N'] = np.NaN
-        dMarker['UTM.Z'] = dMarker['UTM.L'] = ''
-    else:
-        dMarker['UTM.E'], dMarker['UTM.N'], dMarker['UTM.Z'], dMarker['UTM.L'] = UTM.from_latlon(dMarker['lat'], dMarker['lon'])
+    dSTF['marker'] = dMarker
+    projectMarker()
 
     logger.info('{func:s}: marker coordinates = {crd!s}'.format(func=cFuncName, crd=dMarker))
-    dSTF['marker'] = dMarker
 
     # # add jammer location coordinates
     # dMarker = {}
@@ -224,25 +665,73 @@ def main(argv):
     # dMarker['UTM.E'], dMarker['UTM.N'], dMarker['UTM.Z'], dMarker['UTM.L'] = utm.from_latlon(dMarker['geod']['lat'], dMarker['geod']['lon'])
     # dSTF['marker'] = dMarker
 
-    # read in the STF file using included header information
-    dfGeod = readSTFGeodetic(stfFile=fileSTF, logger=logger)
+    # name the csv file after the STF file sbf2stf would create from a SBF file
+    stfName = sbf_decoder.stfName(dSTF['stf'], sbf_decoder.SBF_PVTGEODETIC) if sbf_decoder.isSBF(dSTF['stf']) else dSTF['stf']
+    dSTF['csv'] = os.path.join(outDir, os.path.splitext(os.path.basename(stfName))[0] + '.csv')
+    # the aggregated epochs are saved in their own csv file
+    if aggregate > 0:
+        dSTF['aggcsv'] = os.path.join(outDir, '{base:s}-{sec:d}s.csv'.format(base=os.path.splitext(os.path.basename(stfName))[0], sec=aggregate))
+    # the pyramid of the values is stored in its own directory
+    dSTF['pyramid'] = os.path.join(outDir, os.path.splitext(os.path.basename(stfName))[0] + '-pyramid')
+
+    if (follow > 0 or chunkSize > 0) and (start is not None or end is not None):
+        logger.error('{func:s}: a time window can not be combined with following or chunked processing'.format(func=cFuncName))
+        sys.exit(amc.E_WRONG_OPTION)
+
+    # follow a growing STF file, only parsing the lines appended to it
+    if follow > 0:
+        if sbf_decoder.isSBF(stfFile) or chunkSize > 0 or aggregate > 0 or 'pyramid' in outputs:
+            logger.error('{func:s}: following is only available for STF files and without chunked processing, aggregation or pyramid'.format(func=cFuncName))
+            sys.exit(amc.E_WRONG_OPTION)
+        followSTFGeodetic(stfFile=stfFile, csvFile=dSTF['csv'], interval=follow, outputs=outputs, logger=logger)
+        logger.info('{func:s}: information:\n{dict!s}'.format(dict=amutils.pretty(dSTF), func=cFuncName))
+        return dSTF
+
+    # stream large files chunk by chunk to the csv file
+    if chunkSize > 0:
+        if sbf_decoder.isSBF(stfFile):
+            logger.error('{func:s}: chunked processing is only available for STF files'.format(func=cFuncName))
+            sys.exit(amc.E_WRONG_OPTION)
+        csvFile = (dSTF['aggcsv'] if aggregate > 0 else dSTF['csv']) if 'csv' in outputs else None
+        usecols = stf_schema.projectColumns(dOutputColumns, outputs)
+        logger.info('{func:s}: parsing columns {cols!s} for outputs {out!s}'.format(cols='all' if usecols is None else usecols, out=list(outputs), func=cFuncName))
+        dfAgg = readSTFGeodeticChunked(stfFile=stfFile, csvFile=csvFile, chunkSize=chunkSize, logger=logger, aggregate=aggregate, pyramid='pyramid' in outputs, usecols=usecols)
+        # the aggregated epochs are small enough to be plotted
+        if aggregate > 0 and 'plots' in outputs:
+            plotSTFGeodetic(dfGeod=dfAgg, logger=logger)
+        else:
+            logger.info('{func:s}: chunked processing, no plots created'.format(func=cFuncName))
+        logger.info('{func:s}: information:\n{dict!s}'.format(dict=amutils.pretty(dSTF), func=cFuncName))
+        return dSTF
+
+    # read in the STF file using included header information, only parsing the columns needed for the outputs
+    usecols = stf_schema.projectColumns(dOutputColumns, outputs)
+    logger.info('{func:s}: parsing columns {cols!s} for outputs {out!s}'.format(cols='all' if usecols is None else usecols, out=list(outputs), func=cFuncName))
+    dfGeod = readSTFGeodetic(stfFile=stfFile, logger=logger, useCache=not noCache, usecols=usecols, start=start, end=end)
     amutils.logHeadTailDataFrame(df=dfGeod, dfName=dSTF['stf'], callerName=cFuncName, logger=logger)
 
-    # save to cvs file
-    dSTF['csv'] = os.path.splitext(dSTF['stf'])[0] + '.csv'
-    dfGeod.to_csv(dSTF['csv'])
+    # multi-resolution pyramid of the values of all epochs
+    if 'pyramid' in outputs:
+        dSTF['pyramidvalues'] = aggregateColumns(dfGeod)[0]
+        storePyramid(stf_pyramid.buildLevels(dfGeod, valueCols=dSTF['pyramidvalues']), logger=logger)
 
-    # plot trajectory
-    logger.info('{func:s}: information:\n{dict!s}'.format(dict=amutils.pretty(dSTF), func=cFuncName))
-    plotcoords.plotUTMSuppressed(dStf=dSTF, dfCrd=dfGeod[['time', 'UTM.E', 'UTM.N', 'Error']], logger=logger)
+    # the csv file and plots use the aggregated epochs
+    if aggregate > 0:
+        dfGeod = aggregateGeodetic(dfGeod, aggregate=aggregate, logger=logger)
+        amutils.logHeadTailDataFrame(df=dfGeod, dfName=dSTF['aggcsv'], callerName=cFuncName, logger=logger)
+
+    # save to cvs file
+    if 'csv' in outputs:
+        dfGeod.to_csv(dSTF['aggcsv'] if aggregate > 0 else dSTF['csv'])
 
-    # plot the UTM coordinates and #SVs
-    plotcoords.plotUTMCoords(dStf=dSTF, dfCrd=dfGeod[['time', 'UTM.E', 'UTM.N', 'Height[m]', 'NrSV', 'SignalInfo', 'dist', '2D/3D']], logger=logger)
-    # plot trajectory
-    plotcoords.plotUTMScatter(dStf=dSTF, dfCrd=dfGeod[['time', 'UTM.E', 'UTM.N', 'SignalInfo', '2D/3D']], logger=logger)
+    # plot trajectory and UTM coordinates
+    if 'plots' in outputs:
+        plotSTFGeodetic(dfGeod=dfGeod, logger=logger)
 
     logger.info('{func:s}: information:\n{dict!s}'.format(dict=amutils.pretty(dSTF), func=cFuncName))
 
+    return dSTF
+
 
 if __name__ == "__main__":
     main(sys.argv)
@@ -13,11 +13,24 @@ import utm
 import am_config as amc
 from ampyutils import amutils
 from GNSS import gpstime
+from GNSS import interference
 from SSN import signal_types as ssnst
+from STF import stf_schema
+from STF import sbf_decoder
+from STF import stf_index
+from STF import stf_aggregate
+from STF import stf_pyramid
 from plot import plotagc
+from plot import plotrender
 
 __author__ = 'amuls'
 
+# columns of the ReceiverStatus STF file used per output, None means all columns
+dOutputColumns = {
+    'csv': ['TOW[s]', 'WNc[week]', 'FrontEnd', 'AGCGain[dB]'],
+    'plots': ['TOW[s]', 'WNc[week]', 'FrontEnd', 'AGCGain[dB]'],
+}
+
 
 def treatCmdOpts(argv):
     """
@@ -26,20 +39,28 @@ def treatCmdOpts(argv):
     :param argv: the options (without argv[0])
     :type argv: list of string
     """
-    helpTxt = os.path.basename(__file__) + ' reads in a sbf2stf converted SBF Receiver Status file and make AGC plots'
+    helpTxt = os.path.basename(__file__) + ' reads in a sbf2stf converted SBF Receiver Status file (or the ReceiverStatus blocks of a SBF file) and make AGC plots'
 
     # create the parser for command line arguments
     parser = argparse.ArgumentParser(description=helpTxt)
 
     parser.add_argument('-d', '--dir', help='Directory of SBF file (defaults to .)', required=False, default='.', type=str)
-    parser.add_argument('-f', '--file', help='Filename of Receiver Status file', required=True, type=str)
+    parser.add_argument('-f', '--file', help='Filename of Receiver Status file or SBF file', required=True, type=str)
     parser.add_argument('-g', '--gnss', help='GNSS System Name', required=True, type=str)
 
+    parser.add_argument('--aggregate', help='aggregate the AGC values per front-end in buckets of AGGREGATE GPS seconds, the CSV file and plot then use the aggregated values (default 0, no aggregation)', required=False, default=0, type=int)
+    parser.add_argument('--pyramid', help='store the multi-resolution pyramid (min/max/mean per {levels!s} seconds) of the AGC values per front-end'.format(levels=list(stf_pyramid.PYRAMIDLEVELS)), required=False, action='store_true')
+    parser.add_argument('--agc-drop', help='flag AGC drops of more than AGCDROP dB below the running baseline of a front-end as interference events (default 3)', required=False, default=3., type=float, dest='agcdrop')
+    parser.add_argument('--start', help='only read the epochs from START on, date/time in the time scale of the plots (e.g. 2019-02-14T03:00:00)', required=False, default=None, type=str)
+    parser.add_argument('--end', help='only read the epochs till END, date/time in the time scale of the plots (e.g. 2019-02-14T03:20:00)', required=False, default=None, type=str)
+    parser.add_argument('--headless', help='render the plots without display (Agg backend) and do not show them', required=False, action='store_true')
+    parser.add_argument('--no-cache', help='do not use (nor create) the parse cache of the STF file and the render cache of the plots', required=False, action='store_true', dest='nocache')
+
     parser.add_argument('-l', '--logging', help='specify logging level console/file (default {:s})'.format(colored('INFO DEBUG', 'green')), nargs=2, required=False, default=['INFO', 'DEBUG'], choices=['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG', 'NOTSET'])
 
     args = parser.parse_args()
 
-    return args.dir, args.file, args.gnss, args.logging
+    return args.dir, args.file, args.gnss, args.aggregate, args.pyramid, args.agcdrop, args.start, args.end, args.nocache, args.headless, args.logging
 
 
 def checkExistenceArgs(stfDir: str, stfFile: str, logger: logging.Logger) -> str:
@@ -69,27 +90,25 @@ def checkExistenceArgs(stfDir: str, stfFile: str, logger: logging.Logger) -> str
     return wdir
 
 
-def readSTFRxStatus(stfFile: str, logger: logging.Logger) -> pd.DataFrame:
+def readSTFRxStatus(stfFile: str, logger: logging.Logger, useCache: bool = True, usecols: list = None, start: str = None, end: str = None) -> pd.DataFrame:
     """
-    read in the STF ReceiverStatus_2 file using included header information
+    read in the STF ReceiverStatus_2 file using included header information, only parsing the columns usecols (default all) of the epochs between start and end (default all)
     """
     cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
 
     # read in the file with in
     logger.info('{func:s}: reading file {file:s}'.format(file=stfFile, func=cFuncName))
-    dfSTF = pd.read_csv(stfFile, sep=',', skiprows=range(1, 2))
-
-    # remove columns CPULoad[%]  UpTime[s]  RxStatus  RxError  Antenna SampleVar  Blanking[%]
-    col2Drop = ['CPULoad[%]', 'UpTime[s]', 'RxStatus', 'RxError', 'Antenna', 'SampleVar', 'Blanking[%]']
-    dfSTF.drop(columns=col2Drop, inplace=True, axis=1)
+    dfSTF = stf_index.readSTFRange(stfFile, dSchema=stf_schema.dReceiverStatus2, logger=logger, start=start, end=end, useCache=useCache, sbfBlock=sbf_decoder.SBF_RECEIVERSTATUS, usecols=usecols)
 
     # drop rows without entry for AGC
     idxNaN = pd.isnull(dfSTF).any(1).to_numpy().nonzero()[0]
     logger.info('{func:s}: dropping NaN on indices {idx!s} (#{nbr:d})'.format(idx=idxNaN, nbr=len(idxNaN), func=cFuncName))
-    dfSTF.drop(idxNaN, inplace=True, axis=0)
+    dfSTF.drop(dfSTF.index[idxNaN], inplace=True, axis=0)
+    dfSTF = stf_schema.compactDtypes(dfSTF, dSchema=stf_schema.dReceiverStatus2)
+    dSTF['memory'] = stf_schema.logMemoryReport(df=dfSTF, dfName=dSTF['stf'], callerName=cFuncName, logger=logger)
 
     # convert the GPS time to UTC
-    dfSTF['time'] = dfSTF.apply(lambda x: gpstime.UTCFromWT(x['WNc[week]'], x['TOW[s]']), axis=1)
+    dfSTF['time'] = gpstime.UTCFromWTArray(dfSTF['WNc[week]'].to_numpy(), dfSTF['TOW[s]'].to_numpy())
 
     # find extreme values in FrontEnd column
     dAGC = {}
@@ -124,15 +143,78 @@ def readSTFRxStatus(stfFile: str, logger: logging.Logger) -> pd.DataFrame:
     return dfSTF
 
 
+def pivotAGC(dfAGC: pd.DataFrame) -> dict:
+    """
+    pivots the AGC values of the long format ReceiverStatus dataframe once into a dense array of epochs x front-ends, NaN where a front-end reports no value
+
+    Returns the epochs (as time and GPS seconds), the front-ends and the array, so that the front-ends are read as columns of the array without masking the dataframe.
+    """
+    epochCodes, epochs = pd.factorize(dfAGC['time'])
+    firstRows = np.unique(epochCodes, return_index=True)[1]
+    feCodes, frontEnds = pd.factorize(dfAGC['FrontEnd'], sort=True)
+
+    agc = np.full((len(epochs), len(frontEnds)), np.nan)
+    agc[epochCodes, feCodes] = dfAGC['AGCGain[dB]'].to_numpy(dtype=float)
+
+    dAGC = {}
+    dAGC['time'] = pd.Series(epochs)
+    dAGC['gpssec'] = dfAGC['WNc[week]'].to_numpy(dtype=float)[firstRows] * gpstime.SECSINWEEK + dfAGC['TOW[s]'].to_numpy(dtype=float)[firstRows]
+    dAGC['frontends'] = frontEnds.tolist()
+    dAGC['agc'] = agc
+
+    return dAGC
+
+
+def analyseAGC(dAGC: dict, logger: logging.Logger):
+    """
+    adds per front-end the min, max and mean AGC and the correlation of the AGC between the front-ends to dSTF
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    agc = dAGC['agc']
+    with np.errstate(invalid='ignore'):
+        for i, frontEnd in enumerate(dAGC['frontends']):
+            dSTF['frontend'][frontEnd]['min'] = np.nanmin(agc[:, i])
+            dSTF['frontend'][frontEnd]['max'] = np.nanmax(agc[:, i])
+            dSTF['frontend'][frontEnd]['mean'] = np.nanmean(agc[:, i])
+
+    # correlation of the AGC between the front-ends, over the epochs where both report a value
+    names = [dSTF['frontend'][frontEnd]['name'] for frontEnd in dAGC['frontends']]
+    dfCorr = pd.DataFrame(agc, columns=names).corr()
+    dSTF['AGC']['corr'] = dfCorr.round(3).to_dict()
+    logger.info('{func:s}: correlation of AGC between front-ends\n{corr:s}'.format(corr=dfCorr.round(3).to_string(), func=cFuncName))
+
+
+def detectInterference(dAGC: dict, threshold: float, logger: logging.Logger) -> pd.DataFrame:
+    """
+    detects the interference events on the front-ends, the AGC drops of more than threshold dB below their running baseline, and adds their number and maximum depth per front-end to dSTF
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
+    # the detector works on consecutive parts of the epochs, here all epochs are passed at once
+    dDetector = interference.initDetector(dAGC['frontends'], threshold=threshold)
+    interference.updateDetector(dDetector, dAGC['gpssec'], dAGC, final=True)
+    dfEvents = interference.eventsFrame(dDetector)
+    dfEvents.insert(1, 'name', [dSTF['frontend'][frontEnd]['name'] for frontEnd in dfEvents['FrontEnd']])
+
+    dSTF['interference'] = {}
+    for frontEnd in dAGC['frontends']:
+        dfFE = dfEvents[dfEvents['FrontEnd'] == frontEnd]
+        dSTF['interference'][frontEnd] = {'events': dfFE.shape[0], 'maxdepth': dfFE['depth[dB]'].max() if dfFE.shape[0] > 0 else None}
+        if dfFE.shape[0] > 0:
+            logger.warning('{func:s}: front-end {name:s} has {nr:d} interference events, max AGC drop {depth:.1f} dB'.format(name=dSTF['frontend'][frontEnd]['name'], nr=dfFE.shape[0], depth=dfFE['depth[dB]'].max(), func=cFuncName))
+
+    return dfEvents
+
+
 def main(argv):
     """
     creates a combined SBF file from hourly or six-hourly SBF files
     """
     amc.cBaseName = colored(os.path.basename(__file__), 'yellow')
-    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
 
     # treat command line options
-    dirSTF, fileSTF, GNSSsyst, logLevels = treatCmdOpts(argv)
+    dirSTF, fileSTF, GNSSsyst, aggregate, pyramid, agcDrop, start, end, noCache, headless, logLevels = treatCmdOpts(argv)
 
     # create logging for better debugging
     logger = amc.createLoggers(os.path.basename(__file__), dir=dirSTF, logLevels=logLevels)
@@ -140,32 +222,73 @@ def main(argv):
     # check if arguments are accepted
     workDir = checkExistenceArgs(stfDir=dirSTF, stfFile=fileSTF, logger=logger)
 
+    if headless:
+        plotrender.setHeadless()
+    plotrender.RENDERCACHE = not noCache
+
+    # process the STF file and put results in the working directory
+    processSTFRxStatus(stfFile=fileSTF, GNSSsyst=GNSSsyst, noCache=noCache, outDir=workDir, logger=logger, start=start, end=end, aggregate=aggregate, pyramid=pyramid, agcDrop=agcDrop)
+
+
+def processSTFRxStatus(stfFile: str, GNSSsyst: str, noCache: bool, outDir: str, logger: logging.Logger, start: str = None, end: str = None, aggregate: int = 0, pyramid: bool = False, agcDrop: float = 3.) -> dict:
+    """
+    reads the ReceiverStatus STF (or SBF) file (between start and end), saves it as CSV file in outDir, saves the AGC drops of more than agcDrop dB as interference events next to it and creates the AGC plot in outDir/png
+    """
+    cFuncName = colored(os.path.basename(__file__), 'yellow') + ' - ' + colored(sys._getframe().f_code.co_name, 'green')
+
     # create dictionary with the current info
     global dSTF
     dSTF = {}
-    dSTF['dir'] = workDir
+    dSTF['dir'] = outDir
     dSTF['gnss'] = GNSSsyst
-    dSTF['stf'] = fileSTF
+    dSTF['stf'] = stfFile
 
     # read in the STF file using included header information
-    dfAGC = readSTFRxStatus(stfFile=fileSTF, logger=logger)
+    # the columns CPULoad[%]  UpTime[s]  RxStatus  RxError  Antenna SampleVar  Blanking[%] are not needed and not parsed
+    dfAGC = readSTFRxStatus(stfFile=stfFile, logger=logger, useCache=not noCache, usecols=stf_schema.projectColumns(dOutputColumns, ['csv', 'plots']), start=start, end=end)
     amutils.logHeadTailDataFrame(df=dfAGC, dfName=dSTF['stf'], callerName=cFuncName, logger=logger)
 
-    # save to cvs file
-    dSTF['csv'] = os.path.splitext(dSTF['stf'])[0] + '.csv'
+    # save to cvs file, named after the STF file sbf2stf would create from a SBF file
+    stfName = sbf_decoder.stfName(dSTF['stf'], sbf_decoder.SBF_RECEIVERSTATUS) if sbf_decoder.isSBF(dSTF['stf']) else dSTF['stf']
+    dSTF['csv'] = os.path.join(outDir, os.path.splitext(os.path.basename(stfName))[0] + '.csv')
+
+    # multi-resolution pyramid of the AGC values per front-end of all epochs
+    if pyramid:
+        dSTF['pyramid'] = os.path.join(outDir, os.path.splitext(os.path.basename(stfName))[0] + '-pyramid')
+        stf_pyramid.storePyramid(dSTF['pyramid'], stf_pyramid.buildLevels(dfAGC, valueCols=['AGCGain[dB]'], keyCols=['FrontEnd']), valueCols=['AGCGain[dB]'], keyCols=['FrontEnd'])
+        logger.info('{func:s}: stored pyramid of levels {levels!s}s in {dir:s}'.format(levels=list(stf_pyramid.PYRAMIDLEVELS), dir=dSTF['pyramid'], func=cFuncName))
+
+    # pivot the AGC values of all epochs once into an epochs x front-ends array used for analysis and interference detection
+    dAGC = pivotAGC(dfAGC)
+    analyseAGC(dAGC, logger=logger)
+
+    # interference events per front-end, detected on the AGC values of all epochs and saved next to the csv file
+    dfEvents = detectInterference(dAGC, threshold=agcDrop, logger=logger)
+    dSTF['events'] = os.path.join(outDir, os.path.splitext(os.path.basename(stfName))[0] + '-agc-events.csv')
+    dfEvents.to_csv(dSTF['events'])
+    logger.info('{func:s}: saved {nr:d} interference events to {csv:s}'.format(nr=dfEvents.shape[0], csv=dSTF['events'], func=cFuncName))
+
+    # the csv file and plot use the AGC values aggregated per front-end
+    if aggregate > 0:
+        dfAGC = stf_aggregate.aggregateFrame(dfAGC, binSeconds=aggregate, valueCols=['AGCGain[dB]'], modeCols=[], keyCols=['FrontEnd'])
+        dSTF['csv'] = os.path.join(outDir, '{base:s}-{sec:d}s.csv'.format(base=os.path.splitext(os.path.basename(stfName))[0], sec=aggregate))
+        logger.info('{func:s}: aggregated AGC values in {nr:d} buckets of {sec:d}s'.format(nr=dfAGC.shape[0], sec=aggregate, func=cFuncName))
+        dAGC = pivotAGC(dfAGC)
     dfAGC.to_csv(dSTF['csv'])
     logger.info('{func:s}: saved to csv file {csv:s}'.format(csv=dSTF['csv'], func=cFuncName))
 
     logger.info('{func:s}: information:\n{dict!s}'.format(dict=dSTF, func=cFuncName))
 
-    # plot the AGC values
-    plotagc.plotAGC(dStf=dSTF, dfAgc=dfAGC, logger=logger)
+    # plot the AGC values per frontend
+    plotrender.renderFigures([(plotagc.plotAGC, {'dStf': dSTF, 'dAgc': dAGC, 'logger': logger})], logger=logger)
     # plotcoords.plotUTMCoords(dStf=dSTF, dfCrd=dfAGC[['time', 'UTM.E', 'UTM.N', 'Height[m]', 'NrSV', 'SignalInfo', 'dist', '2D/3D']], logger=logger)
     # # plot trajectory
     # plotcoords.plotUTMScatter(dStf=dSTF, dfCrd=dfAGC[['time', 'UTM.E', 'UTM.N', 'SignalInfo', '2D/3D']], logger=logger)
 
     logger.info('{func:s}: information:\n{dict!s}'.format(dict=dSTF, func=cFuncName))
 
+    return dSTF
+
 
 if __name__ == "__main__":
     main(sys.argv)